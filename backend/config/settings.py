@@ -33,6 +33,7 @@ ALLOWED_HOSTS = ['*']
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'logistics.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -139,11 +141,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'logistics.auth.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'logistics.instrumentation.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Instrumentação por requisição (Server-Timing + log compacto em performance.log)
+PERFORMANCE_INSTRUMENTATION = {
+    'SAMPLE_RATE': 1.0,
+    'SLOW_REQUEST_MS': 500,
+    'SERVER_TIMING': True,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'compact': {'format': '%(asctime)s %(levelname)s %(message)s'},
+    },
+    'handlers': {
+        'performance_file': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'performance.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'compact',
+        },
+    },
+    'loggers': {
+        'logistics.performance': {
+            'handlers': ['performance_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 # JWT settings
@@ -163,13 +200,50 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Cache: 'board' guarda os painéis pré-calculados (logistics.board) em disco,
+# compartilhados entre todos os workers do host
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'board': {
+        # FileBasedCache com add atômico: os locks dos painéis dependem dele
+        'BACKEND': 'logistics.cache_backends.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'board'),
+        'TIMEOUT': 15 * 60,
+    },
+}
+
+# Segundos que as estatísticas do dashboard ficam em cache (0 desativa)
+STATS_CACHE_TTL = 30
+
+# Expediente usado para calcular os horários livres (/api/appointments/availability/)
+WORKING_HOURS = ('08:00', '18:00')
+
+# Dias após os quais agendamentos finalizados vão para o arquivo (manage.py archive_appointments)
+ARCHIVE_AFTER_DAYS = 90
+
+# Segundos até o índice de busca de veículos (/api/vehicles/search/) ser recarregado em cada processo
+VEHICLE_SEARCH_TTL = 300
+
+# Segundos que o usuário autenticado (com perfil e filial) fica em cache no processo
+PRINCIPAL_CACHE_TTL = 60
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
 
 # Channels settings
+# Layer compartilhado via SQLite: vários workers ASGI no mesmo host trocam
+# mensagens de grupo sem depender de Redis.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'logistics.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': os.path.join(BASE_DIR, 'channels.sqlite3'),
+            'capacity': 100,
+            'expiry': 60,
+            'group_expiry': 86400,
+        },
     }
 }
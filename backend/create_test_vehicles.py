@@ -4,7 +4,7 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from logistics.models import Vehicle
+from logistics.importers import VehicleImporter
 
 # Lista de veículos para teste
 vehicles = [
@@ -35,9 +35,8 @@ vehicles = [
     }
 ]
 
-# Criar os veículos
-for vehicle_data in vehicles:
-    vehicle = Vehicle.objects.create(**vehicle_data)
-    print(f"Veículo criado: {vehicle}")
+# Criar os veículos (upsert pelo chassi: rodar de novo não duplica)
+report = VehicleImporter().run(vehicles)
+print(f"Veículos inseridos: {report['inserted']}, atualizados: {report['updated']}")
 
 print("\nVeículos de teste criados com sucesso!") 
\ No newline at end of file
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class LogisticsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'logistics'
+
+    def ready(self):
+        # Registrar os receivers de sinais (eventos em tempo real)
+        from . import signals  # noqa: F401
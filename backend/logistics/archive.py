@@ -0,0 +1,110 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .filters import parse_day
+from .models import Appointment, ArchivedAppointment, ArchivedDelivery, Delivery, Tombstone
+from .signals import mute_deletions
+from . import availability, board
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Só saem da tabela quente agendamentos finalizados cuja entrega (se houver) também terminou
+ARCHIVABLE_STATUSES = ('completed', 'cancelled')
+FINISHED_DELIVERY_STATUSES = ('delivered', 'cancelled')
+DEFAULT_BATCH_SIZE = 500
+
+APPOINTMENT_COLUMNS = [field.attname for field in Appointment._meta.concrete_fields]
+DELIVERY_COLUMNS = [field.attname for field in Delivery._meta.concrete_fields]
+
+
+def archive_after_days():
+    return getattr(settings, 'ARCHIVE_AFTER_DAYS', 90)
+
+
+def horizon(days=None):
+    """Primeiro dia que continua na tabela quente; tudo antes dele pode estar no arquivo."""
+    return timezone.localdate() - timedelta(days=archive_after_days() if days is None else days)
+
+
+def archive_boundary():
+    """Dia do agendamento arquivado mais recente; None com o arquivo vazio."""
+    return ArchivedAppointment.objects.aggregate(newest=Max('appointment_date'))['newest']
+
+
+def reaches_archive(start_date):
+    """
+    Se um período que começa em ``start_date`` (texto YYYY-MM-DD; vazio é um
+    período aberto) pode ter linhas no arquivo. O limite vem do próprio
+    arquivo e não de ``ARCHIVE_AFTER_DAYS``: ``archive_appointments --days``
+    pode ter arquivado dias mais recentes que o horizonte padrão.
+    """
+    newest = archive_boundary()
+    if newest is None:
+        return False
+    start_date = parse_day(start_date or '')
+    return start_date is None or start_date <= newest
+
+
+def archivable(before):
+    return (
+        Appointment.objects.filter(status__in=ARCHIVABLE_STATUSES, appointment_date__lt=before)
+        .filter(Q(delivery__isnull=True) | Q(delivery__status__in=FINISHED_DELIVERY_STATUSES))
+    )
+
+
+def archive_batch(before, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move um lote de até ``batch_size`` agendamentos (e suas entregas) para
+    as tabelas de arquivo numa transação. Cada lote é independente: se o
+    processo parar, a próxima execução continua de onde parou. Retorna
+    ``(agendamentos, entregas)`` movidos.
+    """
+    with transaction.atomic():
+        ids = list(archivable(before).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+        appointments = list(Appointment.objects.select_for_update().filter(pk__in=ids).values(*APPOINTMENT_COLUMNS))
+        deliveries = list(Delivery.objects.filter(appointment_id__in=ids).values(*DELIVERY_COLUMNS))
+
+        # ignore_conflicts: uma cópia já feita por um lote interrompido não impede o próximo
+        ArchivedAppointment.objects.bulk_create(
+            [ArchivedAppointment(**row) for row in appointments], ignore_conflicts=True
+        )
+        ArchivedDelivery.objects.bulk_create([ArchivedDelivery(**row) for row in deliveries], ignore_conflicts=True)
+        # Para a sincronização incremental as linhas saíram da tabela quente:
+        # lápides em lote, já que as exclusões abaixo não disparam os sinais
+        branches = {row['id']: row['branch_id'] for row in appointments}
+        Tombstone.objects.bulk_create([
+            *(Tombstone(model='appointment', object_id=row['id'], branch_id=row['branch_id']) for row in appointments),
+            *(
+                Tombstone(model='delivery', object_id=row['id'], branch_id=branches[row['appointment_id']])
+                for row in deliveries
+            ),
+        ])
+        with mute_deletions():
+            Delivery.objects.filter(appointment_id__in=ids).delete()
+            Appointment.objects.filter(pk__in=ids).delete()
+
+        keys = {(row['branch_id'], row['appointment_date']) for row in appointments}
+        transaction.on_commit(lambda: (board.invalidate(keys), availability.invalidate(keys)))
+    return len(appointments), len(deliveries)
+
+
+def archive(before, batch_size=DEFAULT_BATCH_SIZE, max_batches=None, on_batch=None):
+    """Arquiva em lotes até acabar (ou até ``max_batches``); retorna os totais movidos."""
+    totals = [0, 0]
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(before, batch_size)
+        if not moved[0]:
+            break
+        batches += 1
+        totals[0] += moved[0]
+        totals[1] += moved[1]
+        if on_batch is not None:
+            on_batch(batches, *moved)
+    logger.info(f"Archived {totals[0]} appointments and {totals[1]} deliveries before {before}")
+    return tuple(totals)
@@ -0,0 +1,180 @@
+import copy
+import threading
+import time
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .tokens import PRINCIPAL_CLAIM, BranchTokenUser, principal_claims
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """
+    Cache local do processo: id do usuário -> usuário com perfil e filial.
+
+    O usuário é carregado com ``select_related('userprofile__branch')``, então
+    ``user.userprofile.branch``, ``branch_id`` e ``is_supervisor`` não custam
+    consulta. Cada requisição recebe uma cópia, para que alterações feitas
+    por uma view não vazem para as próximas. As entradas expiram após
+    ``PRINCIPAL_CACHE_TTL`` segundos e os sinais de ``User``, ``UserProfile``
+    e ``Branch`` as invalidam neste processo; nos demais processos vale o TTL.
+    """
+
+    max_entries = 10000
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PRINCIPAL_CACHE_TTL', 60)
+
+    def load(self, user_id):
+        return (
+            User.objects.select_related('userprofile__branch')
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .first()
+        )
+
+    def entry(self, user_id):
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is None or entry[0] <= now:
+            user = self.load(user_id)
+            if user is None:
+                return None
+            # Carregar o perfil agora: usuários sem perfil ficam com o "não existe" em cache
+            getattr(user, 'userprofile', None)
+            claims = principal_claims(user) if user.is_active else None
+            # A entrada vem da variável local: outra thread pode invalidar o cache logo após a escrita
+            entry = (now + self.ttl, user, claims)
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+                self._entries[user_id] = entry
+        return entry
+
+    def get(self, user_id):
+        """Cópia do usuário em cache (ou recém-carregado); ``None`` se não existir."""
+        entry = self.entry(user_id)
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def claims(self, user_id):
+        """
+        Claims que um token emitido agora teria (compartilhadas: não alterar);
+        ``None`` se o usuário não existir ou estiver inativo.
+        """
+        entry = self.entry(user_id)
+        return entry[2] if entry else None
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+principal_cache = PrincipalCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` que busca o usuário no ``principal_cache``."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token sem identificação de usuário')
+
+        user = principal_cache.get(user_id)
+        if user is None:
+            raise AuthenticationFailed('Usuário não encontrado', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('Usuário inativo', code='user_inactive')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed('A senha do usuário foi alterada', code='password_changed')
+        return user
+
+
+class ClaimsJWTAuthentication(CachedJWTAuthentication):
+    """
+    Leituras (GET/HEAD/OPTIONS) com token emitido pelo login usam as claims
+    assinadas: ``BranchTokenUser`` tem filial, papel e perfil sem copiar o
+    usuário do cache. Escritas, e tokens antigos sem as claims, continuam
+    recebendo o usuário real do ``principal_cache``.
+
+    As claims ainda são conferidas com as atuais do ``principal_cache``: um
+    usuário desativado, ou com filial ou papel alterados, perde a leitura no
+    próximo acesso a este processo e, nos demais, em até
+    ``PRINCIPAL_CACHE_TTL`` segundos, não ao fim do access token.
+    """
+
+    def check_claims(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token sem identificação de usuário')
+
+        current = principal_cache.claims(user_id)
+        if current is None:
+            raise AuthenticationFailed('Usuário não encontrado ou inativo', code='user_inactive')
+        if any(validated_token.get(claim) != value for claim, value in current.items()):
+            raise AuthenticationFailed('Dados do usuário alterados; renove o token', code='claims_changed')
+
+    def get_token_user(self, validated_token, read_only):
+        if read_only and PRINCIPAL_CLAIM in validated_token:
+            self.check_claims(validated_token)
+            return BranchTokenUser(validated_token)
+        return self.get_user(validated_token)
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_token_user(validated_token, request.method in SAFE_METHODS), validated_token
+
+
+@database_sync_to_async
+def get_user_from_token(raw_token):
+    authentication = ClaimsJWTAuthentication()
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        # O socket só recebe eventos: basta o usuário das claims
+        user = authentication.get_token_user(validated_token, read_only=True)
+    except (InvalidToken, AuthenticationFailed) as e:
+        logger.info(f"WebSocket token rejected: {str(e)}")
+        return AnonymousUser()
+    # Claims ou cache: nada é consultado dentro do loop assíncrono
+    return user
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Autentica conexões WebSocket com o mesmo access token do SimpleJWT.
+
+    Navegadores não permitem cabeçalhos customizados no WebSocket, então o
+    token é lido do parâmetro ``token`` da query string.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        raw_token = query.get('token', [None])[0]
+        scope = dict(scope)
+        scope['user'] = await get_user_from_token(raw_token) if raw_token else AnonymousUser()
+        return await super().__call__(scope, receive, send)
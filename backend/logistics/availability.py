@@ -0,0 +1,254 @@
+from bisect import bisect_left, insort
+from datetime import time as dt_time
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .board import board_cache, discard, generations, get_or_build, store, update_cached
+from .models import Appointment, UserProfile, Vehicle
+
+# Status que não ocupam o preparador nem o veículo
+FREE_STATUSES = ('cancelled',)
+DAY_SECONDS = 24 * 60 * 60
+INDEX_TIMEOUT = 15 * 60
+
+RESOURCE_LABELS = {'preparer': 'Preparador', 'vehicle': 'Veículo'}
+INDEX_FIELDS = ('pk', 'branch_id', 'appointment_date', 'preparer_id', 'vehicle_id', 'time', 'estimated_duration')
+
+
+def index_key(branch_id, day):
+    return f'availability:{branch_id}:{day.isoformat()}'
+
+
+def to_seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def format_seconds(seconds):
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}'
+
+
+def interval(start_time, duration):
+    """``(início, fim)`` em segundos desde a meia-noite, cortado no fim do dia."""
+    if duration is None:
+        duration = Appointment._meta.get_field('estimated_duration').default
+    start = to_seconds(start_time)
+    return start, min(start + max(int(duration.total_seconds()), 1), DAY_SECONDS)
+
+
+def working_hours():
+    start, end = getattr(settings, 'WORKING_HOURS', ('08:00', '18:00'))
+    return to_seconds(dt_time.fromisoformat(start)), to_seconds(dt_time.fromisoformat(end))
+
+
+class DayIndex:
+    """
+    Ocupação de uma filial em um dia: por preparador e por veículo, uma
+    lista de ``(início, fim, id)`` ordenada pelo início e a maior duração
+    já vista. Conflitos saem por busca binária: só os intervalos que começam
+    até uma maior duração antes do início pedido podem se sobrepor. Os
+    agendamentos entram e saem um a um, sem recalcular o dia.
+    """
+
+    def __init__(self):
+        self.intervals = {'preparer': {}, 'vehicle': {}}
+        # Recurso -> maior duração; não diminui ao remover, só deixa a busca mais larga
+        self.longest = {'preparer': {}, 'vehicle': {}}
+        # id -> (preparador, veículo, início, fim), para remover sem varrer as listas
+        self.appointments = {}
+
+    def add(self, pk, preparer_id, vehicle_id, start, end):
+        self.remove(pk)
+        self.appointments[pk] = (preparer_id, vehicle_id, start, end)
+        for kind, resource in (('preparer', preparer_id), ('vehicle', vehicle_id)):
+            if resource is not None:
+                insort(self.intervals[kind].setdefault(resource, []), (start, end, pk))
+                longest = self.longest[kind]
+                longest[resource] = max(longest.get(resource, 0), end - start)
+
+    def remove(self, pk):
+        entry = self.appointments.pop(pk, None)
+        if entry is None:
+            return
+        preparer_id, vehicle_id, start, end = entry
+        for kind, resource in (('preparer', preparer_id), ('vehicle', vehicle_id)):
+            intervals = self.intervals[kind].get(resource)
+            if intervals:
+                intervals.remove((start, end, pk))
+
+    def busy(self, kind, resource):
+        return self.intervals[kind].get(resource, [])
+
+    def conflicts(self, preparer_id, vehicle_id, start, end, exclude=None):
+        """Lista de ``(recurso, início, fim, id)`` que se sobrepõem a ``[start, end)``."""
+        found = []
+        for kind, resource in (('preparer', preparer_id), ('vehicle', vehicle_id)):
+            if resource is None:
+                continue
+            intervals = self.busy(kind, resource)
+            # Começar antes do fim pedido e terminar depois do início: o fim
+            # não passa de início + maior duração, então o início é > start - longest
+            first = bisect_left(intervals, (start - self.longest[kind].get(resource, 0) + 1,))
+            for position in range(first, bisect_left(intervals, (end,))):
+                busy_start, busy_end, pk = intervals[position]
+                if busy_end > start and pk != exclude:
+                    found.append((kind, busy_start, busy_end, pk))
+        return found
+
+
+def _add_row(index, pk, preparer_id, vehicle_id, start_time, duration):
+    index.add(pk, preparer_id, vehicle_id, *interval(start_time, duration))
+
+
+def build_indexes(keys):
+    """Índices de vários ``(filial, dia)`` com uma única consulta."""
+    indexes = {key: DayIndex() for key in keys}
+    if not indexes:
+        return indexes
+    condition = Q()
+    for branch_id, day in indexes:
+        condition |= Q(branch_id=branch_id, appointment_date=day)
+    rows = Appointment.objects.filter(condition).exclude(status__in=FREE_STATUSES).values_list(*INDEX_FIELDS)
+    for pk, branch_id, day, preparer_id, vehicle_id, start_time, duration in rows:
+        _add_row(indexes[(branch_id, day)], pk, preparer_id, vehicle_id, start_time, duration)
+    return indexes
+
+
+def get_index(branch_id, day):
+    key = (branch_id, day)
+    return get_or_build(index_key(*key), lambda: build_indexes([key])[key], INDEX_TIMEOUT)
+
+
+def get_indexes(keys):
+    """Como ``get_index`` para vários dias; os que faltam no cache saem numa consulta só."""
+    keys = set(keys)
+    cached = board_cache().get_many([index_key(*key) for key in keys])
+    indexes = {key: cached[index_key(*key)] for key in keys if index_key(*key) in cached}
+    versions = generations([index_key(*key) for key in keys - set(indexes)])
+    missing = build_indexes(keys - set(indexes))
+    for key, index in missing.items():
+        store(index_key(*key), index, versions[index_key(*key)], INDEX_TIMEOUT)
+    indexes.update(missing)
+    return indexes
+
+
+def describe(conflicts):
+    messages = []
+    for kind, start, end, pk in conflicts:
+        # Ids negativos são linhas ainda não gravadas de uma importação
+        origin = f'linha {-pk} da importação' if pk < 0 else f'agendamento {pk}'
+        messages.append(
+            f'{RESOURCE_LABELS[kind]} já ocupado das {format_seconds(start)} às {format_seconds(end)} ({origin})'
+        )
+    return messages
+
+
+def find_conflicts(branch_id, day, start_time, duration, preparer_id, vehicle_id, exclude=None):
+    start, end = interval(start_time, duration)
+    return get_index(branch_id, day).conflicts(preparer_id, vehicle_id, start, end, exclude=exclude)
+
+
+def lock_resources(preparer_ids, vehicle_ids):
+    """
+    Trava (``SELECT ... FOR UPDATE``) os veículos e preparadores de uma
+    reserva até o fim da transação. O índice em cache não enxerga reservas
+    ainda não confirmadas; com a trava, duas reservas do mesmo recurso são
+    gravadas uma depois da outra e a segunda confere o banco já com a
+    primeira. No SQLite, sem ``FOR UPDATE``, a trava de escrita do próprio
+    banco já serializa as transações.
+    """
+    if not connection.features.has_select_for_update:
+        return
+    # Sempre na mesma ordem (veículos, depois preparadores, por id) para não haver deadlock
+    for model, ids in ((Vehicle, vehicle_ids), (UserProfile, preparer_ids)):
+        ids = sorted({pk for pk in ids if pk is not None})
+        if ids:
+            list(model.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+
+def database_conflicts(branch_id, day, start_time, duration, preparer_id, vehicle_id, exclude=None):
+    """Como ``find_conflicts``, lendo o banco em vez do índice; usar depois de ``lock_resources``."""
+    resources = Q(vehicle_id=vehicle_id)
+    if preparer_id is not None:
+        resources |= Q(preparer_id=preparer_id)
+    rows = (
+        Appointment.objects.filter(resources, branch_id=branch_id, appointment_date=day)
+        .exclude(status__in=FREE_STATUSES).values_list(*INDEX_FIELDS)
+    )
+    index = DayIndex()
+    for pk, _, _, row_preparer_id, row_vehicle_id, row_time, row_duration in rows:
+        _add_row(index, pk, row_preparer_id, row_vehicle_id, row_time, row_duration)
+    start, end = interval(start_time, duration)
+    return index.conflicts(preparer_id, vehicle_id, start, end, exclude=exclude)
+
+
+def free_intervals(busy, window_start, window_end, min_length=0):
+    """Intervalos livres em ``[window_start, window_end)`` entre os ocupados (ordenados)."""
+    free = []
+    cursor = window_start
+    for start, end, _ in busy:
+        if start >= window_end:
+            break
+        if start - cursor >= max(min_length, 1):
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if window_end - cursor >= max(min_length, 1):
+        free.append((cursor, window_end))
+    return free
+
+
+def availability_window(day):
+    """Expediente do dia; hoje começa no minuto atual."""
+    start, end = working_hours()
+    now = timezone.localtime()
+    if day == now.date():
+        start = max(start, to_seconds(now.time().replace(second=0, microsecond=0)) + 60)
+    elif day < now.date():
+        start = end
+    return start, end
+
+
+def _load(ids):
+    return {row[0]: row for row in Appointment.objects.filter(pk__in=list(ids)).values_list(*INDEX_FIELDS, 'status')}
+
+
+def _apply(changes, current):
+    updates = {}
+    for pk, keys in changes.items():
+        for key in keys:
+            updates.setdefault(key, set()).add(pk)
+        row = current.get(pk)
+        if row is not None:
+            updates.setdefault((row[1], row[2]), set()).add(pk)
+
+    for key, ids in updates.items():
+        def update(index, ids=ids, key=key):
+            for pk in ids:
+                index.remove(pk)
+                row = current.get(pk)
+                if row is None or (row[1], row[2]) != key or row[-1] in FREE_STATUSES:
+                    continue
+                _add_row(index, pk, *row[3:7])
+
+        update_cached(index_key(*key), update, INDEX_TIMEOUT)
+
+
+def refresh_appointments(changes):
+    """
+    Atualiza os índices em cache afetados por agendamentos alterados;
+    ``changes`` tem o mesmo formato usado pelo painel (``board``).
+    """
+    keys = {index_key(*key) for pk_keys in changes.values() for key in pk_keys}
+    if not keys or not board_cache().get_many(list(keys)):
+        return
+    _apply(changes, _load(changes))
+
+
+def refresh_appointment_ids(ids):
+    """Como ``refresh_appointments``, para alterações que não mudam filial nem dia."""
+    current = _load(ids)
+    _apply({pk: {(row[1], row[2])} for pk, row in current.items()}, current)
+
+
+def invalidate(keys):
+    discard([index_key(branch_id, day) for branch_id, day in keys])
@@ -0,0 +1,251 @@
+import time
+import uuid
+from bisect import insort
+from datetime import datetime, timedelta
+from django.core.cache import caches
+from .models import Appointment, Branch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ordem das colunas do painel e das prioridades dentro de cada coluna
+BUCKET_ORDER = ('in_progress', 'scheduled', 'completed', 'cancelled')
+PRIORITY_RANK = Appointment.PRIORITY_RANKS
+STATUS_LABELS = dict(Appointment.STATUS_CHOICES)
+PRIORITY_LABELS = dict(Appointment.PRIORITY_CHOICES)
+
+# Rede de segurança para mudanças em veículos e usuários, que não atualizam o painel
+SNAPSHOT_TIMEOUT = 15 * 60
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+
+CARD_RELATED = ('vehicle', 'branch', 'preparer__user')
+
+
+def board_cache():
+    return caches['board']
+
+
+def snapshot_key(branch_id, day):
+    return f'board:{branch_id}:{day.isoformat()}'
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _generation_key(key):
+    return f'{key}:generation'
+
+
+def card(appointment):
+    """Card já formatado para o painel."""
+    preparer = appointment.preparer
+    return {
+        'id': appointment.pk,
+        'time': appointment.time.strftime('%H:%M'),
+        'status': appointment.status,
+        'priority': appointment.priority,
+        'priority_label': PRIORITY_LABELS.get(appointment.priority, appointment.priority),
+        'client': appointment.client,
+        'seller': appointment.seller,
+        'vehicle': {
+            'model': appointment.vehicle.model,
+            'color': appointment.vehicle.color,
+            'chassi': appointment.vehicle.chassi,
+        },
+        'preparer': preparer.user.username if preparer else None,
+        'wash_date': (appointment.appointment_date + timedelta(days=3)).strftime('%d/%m/%Y'),
+        # Previsão de término pela duração estimada (aprendida em logistics.durations)
+        'estimated_end': (
+            datetime.combine(appointment.appointment_date, appointment.time) + appointment.estimated_duration
+        ).strftime('%H:%M'),
+    }
+
+
+def _sort_key(card):
+    return PRIORITY_RANK.get(card['priority'], len(PRIORITY_RANK)), card['time'], card['id']
+
+
+def _recount(snapshot):
+    for bucket in snapshot['buckets']:
+        bucket['count'] = len(bucket['appointments'])
+    snapshot['total'] = sum(bucket['count'] for bucket in snapshot['buckets'])
+    snapshot['version'] = uuid.uuid4().hex
+
+
+def build_snapshot(branch_id, day):
+    """Calcula o painel completo de uma filial em um dia (uma consulta)."""
+    appointments = (
+        Appointment.objects.filter(branch_id=branch_id, appointment_date=day)
+        .select_related(*CARD_RELATED)
+    )
+    cards = {status: [] for status in BUCKET_ORDER}
+    branch_name = None
+    for appointment in appointments:
+        branch_name = appointment.branch.name
+        cards.setdefault(appointment.status, []).append(card(appointment))
+    if branch_name is None:
+        branch_name = Branch.objects.filter(pk=branch_id).values_list('name', flat=True).first()
+
+    snapshot = {
+        'branch': {'id': branch_id, 'name': branch_name},
+        'date': day.isoformat(),
+        'buckets': [
+            {
+                'status': status,
+                'label': STATUS_LABELS.get(status, status),
+                'appointments': sorted(bucket, key=_sort_key),
+            }
+            for status, bucket in cards.items()
+        ],
+    }
+    _recount(snapshot)
+    return snapshot
+
+
+def discard(keys):
+    """
+    Apaga os valores e troca a geração das chaves: um cálculo em andamento,
+    que leu o banco antes da mudança, não grava o resultado (ver ``store``).
+    """
+    cache = board_cache()
+    cache.set_many({_generation_key(key): uuid.uuid4().hex for key in keys}, SNAPSHOT_TIMEOUT)
+    cache.delete_many(keys)
+
+
+def generations(keys):
+    """Geração atual de cada chave, lida antes de calcular os valores."""
+    cached = board_cache().get_many([_generation_key(key) for key in keys])
+    return {key: cached.get(_generation_key(key)) for key in keys}
+
+
+def store(key, value, generation, timeout=SNAPSHOT_TIMEOUT):
+    """Grava um valor calculado na geração ``generation``; se ela mudou enquanto isso, descarta."""
+    cache = board_cache()
+    cache.set(key, value, timeout)
+    if cache.get(_generation_key(key)) != generation:
+        cache.delete(key)
+
+
+def get_or_build(key, build, timeout=SNAPSHOT_TIMEOUT):
+    """
+    Valor em cache; numa falta, só quem obtiver o lock calcula e os demais
+    aguardam o resultado, então N requisições simultâneas custam um cálculo.
+    """
+    cache = board_cache()
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    if cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+        try:
+            generation = generations([key])[key]
+            value = build()
+            store(key, value, generation, timeout)
+        finally:
+            cache.delete(_lock_key(key))
+        return value
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    logger.warning(f"Timed out waiting for {key}, building without cache")
+    return build()
+
+
+def update_cached(key, update, timeout=SNAPSHOT_TIMEOUT):
+    """
+    Aplica ``update(valor)`` ao valor em cache sob o lock. Se ``update``
+    retornar False, ou outro processo estiver com o lock (atualizando ou
+    calculando o valor a partir de uma leitura que pode ser anterior a esta
+    mudança), o valor é descartado e o próximo acesso recalcula.
+    """
+    cache = board_cache()
+    if not cache.add(_lock_key(key), 1, LOCK_TIMEOUT):
+        discard([key])
+        return
+    try:
+        value = cache.get(key)
+        if value is None:
+            return
+        if update(value) is False:
+            discard([key])
+        else:
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def get_snapshot(branch_id, day):
+    """Painel em cache, calculado uma vez por filial e dia."""
+    return get_or_build(snapshot_key(branch_id, day), lambda: build_snapshot(branch_id, day))
+
+
+def _patch(key, removed_ids, cards):
+    """Tira ``removed_ids`` do painel em cache e insere ``cards`` na posição certa."""
+    def update(snapshot):
+        removed = set(removed_ids) | {new_card['id'] for new_card in cards}
+        buckets = {bucket['status']: bucket for bucket in snapshot['buckets']}
+        for bucket in snapshot['buckets']:
+            bucket['appointments'] = [item for item in bucket['appointments'] if item['id'] not in removed]
+        for new_card in cards:
+            bucket = buckets.get(new_card['status'])
+            if bucket is None:
+                # Status fora das colunas conhecidas: recalcular por inteiro
+                return False
+            insort(bucket['appointments'], new_card, key=_sort_key)
+        _recount(snapshot)
+
+    update_cached(key, update)
+
+
+def _load(ids):
+    return {
+        appointment.pk: appointment
+        for appointment in Appointment.objects.filter(pk__in=list(ids)).select_related(*CARD_RELATED)
+    }
+
+
+def _apply(changes, current):
+    patches = {}
+    for pk, keys in changes.items():
+        for key in keys:
+            patches.setdefault(snapshot_key(*key), ([], []))[0].append(pk)
+        appointment = current.get(pk)
+        if appointment is not None:
+            key = snapshot_key(appointment.branch_id, appointment.appointment_date)
+            patches.setdefault(key, ([], []))[1].append(card(appointment))
+    for key, (removed_ids, cards) in patches.items():
+        _patch(key, removed_ids, cards)
+
+
+def refresh_appointments(changes):
+    """
+    Atualiza os painéis afetados por agendamentos alterados.
+
+    ``changes`` mapeia o id do agendamento para as chaves ``(filial, dia)``
+    em que ele estava antes e depois da alteração. Se nenhum desses painéis
+    estiver em cache nada é consultado; caso contrário os agendamentos
+    atuais vêm numa única consulta e cada painel perde os cards antigos e
+    ganha os novos.
+    """
+    keys = {snapshot_key(*key) for pk_keys in changes.values() for key in pk_keys}
+    if not keys or not board_cache().get_many(list(keys)):
+        return
+    _apply(changes, _load(changes))
+
+
+def refresh_appointment_ids(ids):
+    """Como ``refresh_appointments``, para alterações que não mudam filial nem dia."""
+    current = _load(ids)
+    changes = {pk: {(appointment.branch_id, appointment.appointment_date)} for pk, appointment in current.items()}
+    _apply(changes, current)
+
+
+def invalidate(keys):
+    """Descarta os painéis ``(filial, dia)``; o próximo acesso recalcula uma vez só."""
+    discard([snapshot_key(branch_id, day) for branch_id, day in keys])
@@ -0,0 +1,56 @@
+import os
+import pickle
+import tempfile
+import time
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache as DjangoFileBasedCache
+
+
+class FileBasedCache(DjangoFileBasedCache):
+    """
+    ``FileBasedCache`` com ``add`` atômico entre processos.
+
+    No backend do Django, ``add`` é ``has_key`` seguido de ``set``: dois
+    processos podem "conseguir" a mesma chave ao mesmo tempo. Aqui o valor é
+    gravado num arquivo temporário e ligado ao nome definitivo com
+    ``os.link``, que falha se o arquivo já existir; só um processo cria a
+    chave. Os locks de ``logistics.board`` dependem disso.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            # Segunda tentativa só depois de apagar uma entrada expirada
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    if not self._remove_expired(fname):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _remove_expired(self, fname):
+        """Apaga ``fname`` se estiver expirado; True se o nome ficou livre."""
+        try:
+            with open(fname, 'rb') as f:
+                expiry = pickle.load(f)
+                inode = os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+        if expiry is None or expiry >= time.time():
+            return False
+        try:
+            # Outro processo pode ter trocado a entrada expirada por uma nova: só apaga a que foi lida
+            if os.stat(fname).st_ino == inode:
+                os.remove(fname)
+        except FileNotFoundError:
+            pass
+        return True
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.core.serializers.json import DjangoJSONEncoder
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS layer_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        expires REAL NOT NULL,
+        payload TEXT NOT NULL
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS layer_messages_channel ON layer_messages (channel, id)',
+    'CREATE INDEX IF NOT EXISTS layer_messages_expires ON layer_messages (expires)',
+    """
+    CREATE TABLE IF NOT EXISTS layer_groups (
+        group_name TEXT NOT NULL,
+        channel TEXT NOT NULL,
+        joined REAL NOT NULL,
+        PRIMARY KEY (group_name, channel)
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS layer_groups_channel ON layer_groups (channel)',
+    """
+    CREATE TABLE IF NOT EXISTS layer_metrics (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+)
+
+# Quantidade máxima de mensagens retiradas do banco a cada leitura do receptor
+RECEIVE_BATCH_SIZE = 500
+
+
+class _Receiver:
+    """Buffers locais de um event loop, alimentados por uma única tarefa de leitura."""
+
+    def __init__(self):
+        self.buffers = {}
+        self.task = None
+        self.wakeup = asyncio.Event()
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """
+    Channel layer compartilhado entre processos do mesmo host via SQLite (WAL).
+
+    Todas as instâncias que apontam para o mesmo arquivo enxergam os mesmos
+    grupos e filas, então um ``group_send`` feito em um worker chega aos
+    sockets mantidos pelos demais, sem precisar de Redis. Cada canal tem fila
+    limitada (``capacity``/``channel_capacity``), mensagens expiram após
+    ``expiry`` segundos e os contadores de uso ficam disponíveis em ``stats()``.
+
+    Cada event loop mantém uma única tarefa que busca, em lote, as mensagens de
+    todos os canais que estão aguardando ``receive``, em vez de um polling por
+    consumidor.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        path='channels.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.05,
+        max_poll_interval=0.5,
+        cleanup_interval=30,
+        **kwargs
+    ):
+        super().__init__(
+            expiry=expiry,
+            capacity=capacity,
+            channel_capacity=channel_capacity,
+            **kwargs
+        )
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = uuid.uuid4().hex[:12]
+        self._local = threading.local()
+        self._receivers = weakref.WeakKeyDictionary()
+        self._last_cleanup = 0
+
+    # Conexões (uma por thread, o sqlite3 não compartilha conexões entre threads)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, func, *args):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(connection, *args)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._transaction, func, *args)
+
+    @staticmethod
+    def _increment(connection, name, amount=1):
+        if amount:
+            connection.execute(
+                'INSERT INTO layer_metrics (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                (name, amount),
+            )
+
+    # Envio
+
+    def _enqueue(self, connection, channels, payload):
+        """Insere o payload nos canais que ainda têm espaço; retorna os canais cheios."""
+        now = time.time()
+        placeholders = ','.join('?' * len(channels))
+        depths = dict(connection.execute(
+            f'SELECT channel, COUNT(*) FROM layer_messages '
+            f'WHERE channel IN ({placeholders}) AND expires >= ? GROUP BY channel',
+            (*channels, now),
+        ).fetchall())
+        full = [channel for channel in channels if depths.get(channel, 0) >= self.get_capacity(channel)]
+        accepted = [channel for channel in channels if channel not in full]
+        connection.executemany(
+            'INSERT INTO layer_messages (channel, expires, payload) VALUES (?, ?, ?)',
+            [(channel, now + self.expiry, payload) for channel in accepted],
+        )
+        self._increment(connection, 'sent', len(accepted))
+        self._increment(connection, 'dropped_full', len(full))
+        return full
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        payload = json.dumps(message, cls=DjangoJSONEncoder)
+        full = await self._run(self._enqueue, [channel], payload)
+        self._wakeup_local()
+        if full:
+            raise ChannelFull(channel)
+
+    # Recebimento
+
+    def _pending(self, channels, limit=RECEIVE_BATCH_SIZE):
+        now = time.time()
+        placeholders = ','.join('?' * len(channels))
+        return (
+            f'SELECT id, channel, expires, payload FROM layer_messages '
+            f'WHERE channel IN ({placeholders}) AND expires >= ? ORDER BY id LIMIT ?',
+            (*channels, now, limit),
+        )
+
+    def _dequeue(self, connection, channels):
+        rows = connection.execute(*self._pending(channels)).fetchall()
+        if rows:
+            connection.executemany('DELETE FROM layer_messages WHERE id = ?', [(row[0],) for row in rows])
+            self._increment(connection, 'received', len(rows))
+        return rows
+
+    def _receive_batch(self, channels):
+        # Leitura simples primeiro: no WAL ela não bloqueia ninguém, e a trava de
+        # escrita (BEGIN IMMEDIATE) só é pedida quando há mensagens para retirar
+        if not self._connection().execute(*self._pending(channels, limit=1)).fetchall():
+            return []
+        return self._transaction(self._dequeue, channels)
+
+    def _requeue(self, connection, rows):
+        # Devolve com o id original, para manter a ordem em relação às mensagens seguintes
+        connection.executemany(
+            'INSERT OR IGNORE INTO layer_messages (id, channel, expires, payload) VALUES (?, ?, ?, ?)',
+            rows,
+        )
+        self._increment(connection, 'received', -len(rows))
+
+    def _receiver(self):
+        loop = asyncio.get_running_loop()
+        receiver = self._receivers.get(loop)
+        if receiver is None:
+            receiver = self._receivers[loop] = _Receiver()
+        if receiver.task is None or receiver.task.done():
+            receiver.task = loop.create_task(self._poll(receiver))
+        return receiver
+
+    def _wakeup_local(self):
+        # Um send local acorda o receptor imediatamente, sem esperar o próximo ciclo
+        try:
+            receiver = self._receivers.get(asyncio.get_running_loop())
+        except RuntimeError:
+            return
+        if receiver is not None:
+            receiver.wakeup.set()
+
+    async def _poll(self, receiver):
+        interval = self.poll_interval
+        loop = asyncio.get_running_loop()
+        while receiver.buffers:
+            try:
+                messages = await loop.run_in_executor(None, self._receive_batch, list(receiver.buffers))
+                await self._maybe_cleanup()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading channel layer database {self.path}: {str(e)}")
+                messages = []
+
+            # O receive() de um canal pode ter sido cancelado enquanto a leitura
+            # estava em andamento: o que já saiu do banco para ele volta para lá
+            undelivered = []
+            for row in messages:
+                queue = receiver.buffers.get(row[1])
+                if queue is None:
+                    undelivered.append(row)
+                else:
+                    queue.put_nowait(json.loads(row[3]))
+            if undelivered:
+                try:
+                    await self._run(self._requeue, undelivered)
+                except sqlite3.Error as e:
+                    logger.error(f"Error requeueing {len(undelivered)} channel layer message(s): {str(e)}")
+
+            if len(messages) > len(undelivered):
+                interval = self.poll_interval
+                continue
+
+            receiver.wakeup.clear()
+            try:
+                await asyncio.wait_for(receiver.wakeup.wait(), interval)
+                interval = self.poll_interval
+            except asyncio.TimeoutError:
+                interval = min(interval * 2, self.max_poll_interval)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        receiver = self._receiver()
+        queue = receiver.buffers.setdefault(channel, asyncio.Queue())
+        receiver.wakeup.set()
+        try:
+            return await queue.get()
+        finally:
+            if queue.empty() and receiver.buffers.get(channel) is queue:
+                del receiver.buffers[channel]
+
+    async def new_channel(self, prefix='specific'):
+        return f'{prefix}.sqlite!{self.client_prefix}{uuid.uuid4().hex[:12]}'
+
+    # Expiração
+
+    def _cleanup(self, connection):
+        now = time.time()
+        # Canal com mensagem expirada não está mais consumindo: sai de todos os grupos
+        connection.execute(
+            'DELETE FROM layer_groups WHERE channel IN '
+            '(SELECT DISTINCT channel FROM layer_messages WHERE expires < ?)',
+            (now,),
+        )
+        expired = connection.execute('DELETE FROM layer_messages WHERE expires < ?', (now,)).rowcount
+        connection.execute('DELETE FROM layer_groups WHERE joined < ?', (now - self.group_expiry,))
+        self._increment(connection, 'expired', expired)
+
+    async def _maybe_cleanup(self):
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = time.time()
+            await self._run(self._cleanup)
+
+    # Grupos
+
+    def _group_add(self, connection, group, channel):
+        connection.execute(
+            'INSERT OR REPLACE INTO layer_groups (group_name, channel, joined) VALUES (?, ?, ?)',
+            (group, channel, time.time()),
+        )
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._run(self._group_add, group, channel)
+
+    def _group_discard(self, connection, group, channel):
+        connection.execute(
+            'DELETE FROM layer_groups WHERE group_name = ? AND channel = ?',
+            (group, channel),
+        )
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), 'Invalid channel name'
+        assert self.valid_group_name(group), 'Invalid group name'
+        await self._run(self._group_discard, group, channel)
+
+    def _group_send(self, connection, group, payload):
+        channels = [row[0] for row in connection.execute(
+            'SELECT channel FROM layer_groups WHERE group_name = ? AND joined >= ?',
+            (group, time.time() - self.group_expiry),
+        )]
+        if channels:
+            # Canais cheios são ignorados, como no InMemoryChannelLayer
+            self._enqueue(connection, channels, payload)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        assert self.valid_group_name(group), 'Invalid group name'
+        payload = json.dumps(message, cls=DjangoJSONEncoder)
+        await self._run(self._group_send, group, payload)
+        self._wakeup_local()
+
+    # Flush
+
+    def _flush(self, connection):
+        for table in ('layer_messages', 'layer_groups', 'layer_metrics'):
+            connection.execute(f'DELETE FROM {table}')
+
+    async def flush(self):
+        await self._run(self._flush)
+
+    async def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    # Métricas
+
+    def _stats(self, connection):
+        now = time.time()
+        channels = {
+            channel: {'depth': depth, 'capacity': self.get_capacity(channel)}
+            for channel, depth in connection.execute(
+                'SELECT channel, COUNT(*) FROM layer_messages WHERE expires >= ? GROUP BY channel',
+                (now,),
+            )
+        }
+        groups = dict(connection.execute(
+            'SELECT group_name, COUNT(*) FROM layer_groups GROUP BY group_name'
+        ).fetchall())
+        counters = dict(connection.execute('SELECT name, value FROM layer_metrics').fetchall())
+        return {
+            'path': self.path,
+            'expiry': self.expiry,
+            'capacity': self.capacity,
+            'queued': sum(channel['depth'] for channel in channels.values()),
+            'channels': channels,
+            'groups': groups,
+            'counters': counters,
+        }
+
+    def stats(self):
+        """Profundidade das filas, membros por grupo e contadores acumulados."""
+        return self._transaction(self._stats)
@@ -0,0 +1,63 @@
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Appointment
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tentativas no modo sem SKIP LOCKED antes de desistir
+CLAIM_ATTEMPTS = 5
+CLAIM_FIELDS = ['status', 'preparer', 'updated_at']
+
+
+def queue(profile, day):
+    """Agendados da filial no dia, livres ou já do preparador, na ordem da fila (``appointment_queue_idx``)."""
+    return (
+        Appointment.objects.filter(branch_id=profile.branch_id, status='scheduled', appointment_date=day)
+        .filter(Q(preparer__isnull=True) | Q(preparer_id=profile.pk))
+        .order_by('priority_rank', 'time', 'id')
+    )
+
+
+def _take(appointment, profile):
+    appointment.status = 'in_progress'
+    appointment.preparer_id = profile.pk
+    appointment.save(update_fields=CLAIM_FIELDS)
+    return appointment
+
+
+def _claim_skip_locked(profile, day):
+    with transaction.atomic():
+        # Linhas travadas por outro preparador são puladas, não esperadas
+        appointment = queue(profile, day).select_for_update(skip_locked=True).first()
+        if appointment is None:
+            return None
+        return _take(appointment, profile)
+
+
+def _claim_optimistic(profile, day):
+    # SQLite não trava linhas: o UPDATE condicional decide quem leva o agendamento
+    tried = []
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            appointment = queue(profile, day).exclude(pk__in=tried).first()
+            if appointment is None:
+                return None
+            taken = queue(profile, day).filter(pk=appointment.pk).update(status='in_progress')
+            if taken:
+                # O save() grava o preparador e dispara os sinais (eventos e painel)
+                return _take(appointment, profile)
+        tried.append(appointment.pk)
+    logger.warning(f"Gave up claiming for profile {profile.pk} after {CLAIM_ATTEMPTS} attempts")
+    return None
+
+
+def claim_next(profile, day):
+    """
+    Passa para ``in_progress`` o próximo agendamento da fila do preparador
+    e o atribui a ele; dois preparadores nunca recebem o mesmo. Retorna
+    None se a fila estiver vazia.
+    """
+    if connection.features.has_select_for_update_skip_locked:
+        return _claim_skip_locked(profile, day)
+    return _claim_optimistic(profile, day)
@@ -0,0 +1,43 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core.exceptions import ObjectDoesNotExist
+from . import events
+
+
+class BranchEventsConsumer(AsyncJsonWebsocketConsumer):
+    """Envia aos painéis de uma filial os eventos de agendamentos e entregas."""
+
+    group_name = None
+
+    async def connect(self):
+        user = self.scope.get('user')
+        branch_id = int(self.scope['url_route']['kwargs']['branch_id'])
+
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        # Usuários comuns só podem acompanhar a própria filial
+        if not user.is_superuser:
+            try:
+                user_branch_id = user.userprofile.branch_id
+            except ObjectDoesNotExist:
+                user_branch_id = None
+            if user_branch_id != branch_id:
+                await self.close(code=4403)
+                return
+
+        self.group_name = events.branch_group(branch_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Keep-alive dos painéis
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def branch_event(self, message):
+        await self.send_json(message['event'])
@@ -0,0 +1,292 @@
+import random
+from datetime import datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import Appointment, Branch, Delivery, UserProfile, Vehicle
+from . import availability, board
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+# Senha de todos os usuários gerados (o hash é calculado uma vez só)
+DEFAULT_PASSWORD = 'carga123'
+
+# Modelo -> (peso na frota, minutos de preparação estimados)
+VEHICLE_MODELS = {
+    'Chevrolet Onix': (14, 60), 'Hyundai HB20': (12, 60), 'Fiat Argo': (10, 60),
+    'Volkswagen Polo': (9, 60), 'Fiat Mobi': (8, 45), 'Renault Kwid': (8, 45),
+    'Toyota Corolla': (6, 90), 'Honda Civic': (4, 90), 'Jeep Compass': (6, 120),
+    'Nissan Kicks': (5, 75), 'Volkswagen T-Cross': (5, 75), 'Fiat Strada': (9, 90),
+    'Toyota Hilux': (3, 150), 'Chevrolet S10': (2, 150), 'Citroën C3': (3, 60),
+}
+COLORS = {'#FFFFFF': 30, '#808080': 22, '#000000': 20, '#C0C0C0': 15, '#FF0000': 8, '#0000FF': 5}
+FIRST_NAMES = (
+    'Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'Wagner',
+)
+LAST_NAMES = (
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+    'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Rocha', 'Almeida', 'Nascimento', 'Araújo', 'Melo', 'Barbosa',
+)
+PRIORITIES = {'high': 15, 'medium': 60, 'low': 25}
+# Status por momento do agendamento em relação a hoje
+PAST_STATUSES = {'completed': 88, 'cancelled': 9, 'scheduled': 3}
+TODAY_STATUSES = {'completed': 35, 'in_progress': 20, 'scheduled': 40, 'cancelled': 5}
+FUTURE_STATUSES = {'scheduled': 95, 'cancelled': 5}
+# Entregas dos agendamentos concluídos (os agendados futuros só às vezes já têm entrega pendente)
+COMPLETED_DELIVERIES = {'delivered': 92, 'pending': 5, 'cancelled': 3}
+FUTURE_DELIVERY_RATE = 0.3
+SLOT = timedelta(minutes=30)
+# Multiplicador ímpar e não divisível por 3: embaralha o id em chassis únicos de 7 caracteres (36^7)
+CHASSI_MULTIPLIER = 2654435761
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def chassi_for(number):
+    value = (number * CHASSI_MULTIPLIER) % 36 ** 7
+    digits = []
+    for _ in range(7):
+        value, digit = divmod(value, 36)
+        digits.append(BASE36[digit])
+    return ''.join(reversed(digits))
+
+
+class Weighted:
+    """Sorteio com pesos pré-acumulados (``random.choices`` refaz a soma a cada chamada)."""
+
+    def __init__(self, weights):
+        self.values = list(weights)
+        self.cumulative = []
+        total = 0
+        for weight in weights.values():
+            total += weight
+            self.cumulative.append(total)
+
+    def __call__(self, rnd):
+        return rnd.choices(self.values, cum_weights=self.cumulative)[0]
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class DatasetGenerator:
+    """
+    Gera uma massa de dados reproduzível (mesma ``seed``, mesmos dados):
+    filiais com supervisor e preparadores, uma frota de veículos e
+    ``years`` anos de agendamentos (mais ``future_days`` à frente) com
+    entregas.
+
+    Os ids são atribuídos aqui, a partir do maior id existente, para que as
+    entregas possam apontar para agendamentos gravados com ``bulk_create``
+    também no MySQL, que não devolve os ids inseridos. Tudo é gravado em
+    lotes de ``batch_size`` linhas, um lote por transação; a memória não
+    cresce com o tamanho da massa. Não rode com a aplicação gravando no
+    mesmo banco.
+    """
+
+    def __init__(self, seed=1, branches=5, preparers=8, vehicles=20000, years=1.0, future_days=14,
+                 appointments_per_day=40, batch_size=DEFAULT_BATCH_SIZE, password=DEFAULT_PASSWORD):
+        self.rnd = random.Random(seed)
+        self.branches = branches
+        self.preparers = preparers
+        self.vehicles = vehicles
+        self.years = years
+        self.future_days = future_days
+        self.appointments_per_day = appointments_per_day
+        self.batch_size = batch_size
+        self.password = password
+        self.counts = {'branches': 0, 'users': 0, 'vehicles': 0, 'appointments': 0, 'deliveries': 0}
+
+        self.pick_model = Weighted({model: weight for model, (weight, _) in VEHICLE_MODELS.items()})
+        self.pick_color = Weighted(COLORS)
+        self.pick_priority = Weighted(PRIORITIES)
+        self.pick_past = Weighted(PAST_STATUSES)
+        self.pick_today = Weighted(TODAY_STATUSES)
+        self.pick_future = Weighted(FUTURE_STATUSES)
+        self.pick_delivery = Weighted(COMPLETED_DELIVERIES)
+
+    def name(self):
+        return f'{self.rnd.choice(FIRST_NAMES)} {self.rnd.choice(LAST_NAMES)}'
+
+    def create_people(self):
+        """Filiais, supervisores e preparadores; retorna ``[(filial, supervisor, [preparadores])]``."""
+        password = make_password(self.password)
+        branch_id, user_id, profile_id = _next_id(Branch), _next_id(User), _next_id(UserProfile)
+        branches, users, profiles, staff = [], [], [], []
+        for offset in range(self.branches):
+            branch = Branch(id=branch_id + offset, name=f'Filial Carga {branch_id + offset}', cnpj=f'9{branch_id + offset:013d}')
+            branches.append(branch)
+            members = []
+            for number in range(self.preparers + 1):
+                role = 'supervisor' if number == 0 else 'preparador'
+                first_name, last_name = self.name().split(' ', 1)
+                username = f'{role}{branch.id}_{number}'
+                users.append(User(
+                    id=user_id, username=username, email=f'{username}@carga.example.com', password=password,
+                    first_name=first_name, last_name=last_name,
+                ))
+                members.append(UserProfile(
+                    id=profile_id, user_id=user_id, branch_id=branch.id,
+                    employee_id=f'{"SUP" if number == 0 else "PREP"}{branch.id}{number:03d}', is_supervisor=number == 0,
+                ))
+                user_id += 1
+                profile_id += 1
+            profiles.extend(members)
+            staff.append((branch, members[0], members[1:]))
+
+        with transaction.atomic():
+            Branch.objects.bulk_create(branches, batch_size=self.batch_size)
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            UserProfile.objects.bulk_create(profiles, batch_size=self.batch_size)
+        self.counts['branches'] += len(branches)
+        self.counts['users'] += len(users)
+        return staff
+
+    def create_vehicles(self):
+        """Retorna ``[(id, modelo)]`` da frota gerada."""
+        first = _next_id(Vehicle)
+        fleet = []
+        batch = []
+        for pk in range(first, first + self.vehicles):
+            model = self.pick_model(self.rnd)
+            batch.append(Vehicle(id=pk, model=model, color=self.pick_color(self.rnd), chassi=chassi_for(pk)))
+            fleet.append((pk, model))
+            if len(batch) >= self.batch_size:
+                Vehicle.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Vehicle.objects.bulk_create(batch)
+        self.counts['vehicles'] += len(fleet)
+        return fleet
+
+    def days(self):
+        today = timezone.localdate()
+        day = today - timedelta(days=round(self.years * 365))
+        while day <= today + timedelta(days=self.future_days):
+            # Sem expediente aos domingos
+            if day.weekday() != 6:
+                yield day
+            day += timedelta(days=1)
+
+    def day_appointments(self, day, branch, supervisor, preparers, fleet):
+        """Agendamentos de uma filial num dia, com a agenda de cada preparador sem sobreposição."""
+        today = timezone.localdate()
+        pick_status = self.pick_past if day < today else self.pick_today if day == today else self.pick_future
+        opening = datetime.combine(day, time(8))
+        closing = datetime.combine(day, time(18))
+        free_at = {profile.id: opening for profile in preparers}
+        mean = self.appointments_per_day
+        count = max(0, round(self.rnd.gauss(mean, mean ** 0.5)))
+
+        for _ in range(count):
+            vehicle_id, model = self.rnd.choice(fleet)
+            estimated = timedelta(minutes=VEHICLE_MODELS[model][1])
+            # Preparador que fica livre mais cedo; sem ninguém livre, fica sem preparador
+            preparer_id = min(free_at, key=free_at.get) if free_at else None
+            if preparer_id is not None and free_at[preparer_id] + estimated <= closing:
+                start = free_at[preparer_id]
+                free_at[preparer_id] = start + estimated + SLOT * self.rnd.randint(0, 2)
+            else:
+                preparer_id = None
+                start = opening + SLOT * self.rnd.randrange(20)
+
+            status = pick_status(self.rnd)
+            if status == 'scheduled' and day < today:
+                preparer_id = None
+            actual = None
+            if status == 'completed':
+                # Duração real log-normal em torno da estimada, em minutos cheios
+                minutes = estimated.total_seconds() / 60 * self.rnd.lognormvariate(0, 0.25)
+                actual = timedelta(minutes=max(10, round(minutes)))
+            client = self.name()
+            appointment = Appointment(
+                appointment_date=day,
+                time=start.time(),
+                seller=self.name(),
+                client=client,
+                client_phone=f'119{self.rnd.randrange(10 ** 8):08d}',
+                client_email=f'{slugify(client.split()[0])}{self.rnd.randrange(1000)}@cliente.example.com'
+                if self.rnd.random() < 0.4 else '',
+                vehicle_id=vehicle_id,
+                branch_id=branch.id,
+                preparer_id=preparer_id,
+                status=status,
+                priority=self.pick_priority(self.rnd),
+                estimated_duration=estimated,
+                actual_duration=actual,
+                created_by_id=supervisor.id,
+            )
+            appointment.apply_defaults()
+            yield appointment
+
+    def delivery_for(self, appointment, day):
+        if appointment.status == 'completed':
+            status = self.pick_delivery(self.rnd)
+        elif appointment.status == 'scheduled' and day >= timezone.localdate() and self.rnd.random() < FUTURE_DELIVERY_RATE:
+            status = 'pending'
+        else:
+            return None
+        delivered = None
+        if status == 'delivered':
+            moment = datetime.combine(appointment.delivery_date, time(9)) + timedelta(minutes=self.rnd.randrange(9 * 60))
+            delivered = timezone.make_aware(moment)
+        return Delivery(appointment_id=appointment.id, status=status, delivery_date=delivered)
+
+    def flush(self, appointments, deliveries):
+        with transaction.atomic():
+            Appointment.objects.bulk_create(appointments)
+            Delivery.objects.bulk_create(deliveries)
+        self.counts['appointments'] += len(appointments)
+        self.counts['deliveries'] += len(deliveries)
+
+    def create_appointments(self, staff, fleet, on_batch=None):
+        """Agendamentos e entregas, dia a dia; retorna os painéis ``(filial, dia)`` tocados."""
+        appointment_id, delivery_id = _next_id(Appointment), _next_id(Delivery)
+        appointments, deliveries = [], []
+        keys = []
+        for day in self.days():
+            for branch, supervisor, preparers in staff:
+                keys.append((branch.id, day))
+                for appointment in self.day_appointments(day, branch, supervisor, preparers, fleet):
+                    appointment.id = appointment_id
+                    appointment_id += 1
+                    appointments.append(appointment)
+                    delivery = self.delivery_for(appointment, day)
+                    if delivery is not None:
+                        delivery.id = delivery_id
+                        delivery_id += 1
+                        deliveries.append(delivery)
+                    if len(appointments) >= self.batch_size:
+                        self.flush(appointments, deliveries)
+                        appointments, deliveries = [], []
+                        if on_batch is not None:
+                            on_batch(self.counts)
+        if appointments:
+            self.flush(appointments, deliveries)
+        return keys
+
+    def reset_sequences(self):
+        # Ids explícitos: no PostgreSQL as sequências precisam acompanhar (MySQL e SQLite se ajustam sozinhos)
+        statements = connection.ops.sequence_reset_sql(no_style(), [Branch, User, UserProfile, Vehicle, Appointment, Delivery])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def run(self, on_batch=None):
+        staff = self.create_people()
+        fleet = self.create_vehicles()
+        keys = self.create_appointments(staff, fleet, on_batch)
+        self.reset_sequences()
+        # bulk_create não dispara os sinais que mantêm os painéis e os índices de horários
+        board.invalidate(keys)
+        availability.invalidate(keys)
+        logger.info(f"Generated dataset: {self.counts}")
+        return self.counts
@@ -0,0 +1,235 @@
+from bisect import bisect_right, insort
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Appointment, ArchivedAppointment, DurationStat
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Amostras mínimas para confiar numa estatística
+MIN_SAMPLES = 5
+# Quantis acompanhados em cada resumo
+QUANTILES = (0.5, 0.9)
+# Quanto o histórico do preparador pode esticar ou encurtar a estimativa do modelo
+PREPARER_FACTOR_LIMITS = (0.5, 2.0)
+GLOBAL_KEY = ''
+
+
+class P2Quantile:
+    """
+    Estimador P² (Jain & Chlamtac) de um quantil: cinco marcadores
+    ajustados a cada amostra, memória e custo constantes.
+    """
+
+    def __init__(self, p, state=None):
+        self.p = p
+        state = state or {}
+        self.heights = state.get('q', [])
+        self.positions = state.get('n', [])
+        self.desired = state.get('np', [])
+
+    def state(self):
+        return {'q': self.heights, 'n': self.positions, 'np': self.desired}
+
+    def add(self, value):
+        q, n = self.heights, self.positions
+        if len(q) < 5:
+            insort(q, value)
+            if len(q) == 5:
+                p = self.p
+                self.positions = [0, 1, 2, 3, 4]
+                self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+            return
+
+        if value < q[0]:
+            q[0] = value
+            cell = 0
+        elif value >= q[4]:
+            q[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(q, value) - 1
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i, increment in enumerate((0, self.p / 2, self.p, (1 + self.p) / 2, 1)):
+            self.desired[i] += increment
+
+        for i in (1, 2, 3):
+            offset = self.desired[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def _parabolic(self, i, step):
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[round(self.p * (len(self.heights) - 1))]
+        return self.heights[2]
+
+
+def add_sample(stat, seconds):
+    """Atualiza contagem, média e variância (Welford) e os quantis de ``stat``."""
+    stat.count += 1
+    delta = seconds - stat.mean
+    stat.mean += delta / stat.count
+    stat.m2 += delta * (seconds - stat.mean)
+    quantiles = dict(stat.quantiles or {})
+    for p in QUANTILES:
+        estimator = P2Quantile(p, quantiles.get(str(p)))
+        estimator.add(seconds)
+        quantiles[str(p)] = estimator.state()
+    stat.quantiles = quantiles
+
+
+def quantile(stat, p):
+    return P2Quantile(p, (stat.quantiles or {}).get(str(p))).value()
+
+
+def _sample_keys(vehicle_model, preparer_id):
+    keys = [('global', GLOBAL_KEY), ('model', vehicle_model)]
+    if preparer_id is not None:
+        keys.append(('preparer', str(preparer_id)))
+    return keys
+
+
+def _lookup(keys, lock=False):
+    condition = Q()
+    for scope, key in keys:
+        condition |= Q(scope=scope, key=key)
+    queryset = DurationStat.objects.filter(condition)
+    if lock:
+        queryset = queryset.select_for_update()
+    return {(stat.scope, stat.key): stat for stat in queryset}
+
+
+def record_samples(samples):
+    """
+    Soma amostras ``(modelo do veículo, preparador, segundos)`` aos resumos
+    geral, do modelo e do preparador: uma leitura travada, um INSERT em lote
+    dos resumos novos e um UPDATE em lote de todos.
+    """
+    if not samples:
+        return
+    keys = {key for vehicle_model, preparer_id, _ in samples for key in _sample_keys(vehicle_model, preparer_id)}
+    with transaction.atomic():
+        stats = _lookup(keys, lock=True)
+        missing = keys - set(stats)
+        if missing:
+            # Linha inexistente não trava: outra conclusão pode criar o mesmo
+            # resumo ao mesmo tempo. Os conflitos são ignorados e a releitura
+            # travada devolve a linha, seja a nossa ou a da outra transação.
+            DurationStat.objects.bulk_create(
+                [DurationStat(scope=scope, key=key) for scope, key in missing], ignore_conflicts=True
+            )
+            stats.update(_lookup(missing, lock=True))
+        for vehicle_model, preparer_id, seconds in samples:
+            for key in _sample_keys(vehicle_model, preparer_id):
+                add_sample(stats[key], seconds)
+        # bulk_update não preenche auto_now
+        now = timezone.now()
+        for stat in stats.values():
+            stat.updated_at = now
+        DurationStat.objects.bulk_update(
+            list(stats.values()), ['count', 'mean', 'm2', 'quantiles', 'updated_at']
+        )
+
+
+def record_completed(ids):
+    """
+    Registra a duração real dos agendamentos concluídos em ``ids`` que
+    ainda não entraram nas estatísticas (``duration_sampled``).
+    """
+    with transaction.atomic():
+        rows = list(
+            Appointment.objects.select_for_update()
+            .filter(pk__in=list(ids), status='completed', actual_duration__isnull=False, duration_sampled=False)
+            .values_list('pk', 'vehicle__model', 'preparer_id', 'actual_duration')
+        )
+        if not rows:
+            return 0
+        Appointment.objects.filter(pk__in=[row[0] for row in rows]).update(duration_sampled=True)
+        record_samples([
+            (vehicle_model, preparer_id, duration.total_seconds())
+            for _, vehicle_model, preparer_id, duration in rows
+        ])
+    return len(rows)
+
+
+class Estimator:
+    """
+    Estimativas de duração a partir dos resumos já carregados: a mediana
+    do modelo do veículo (ou a geral), ajustada pela razão entre a média do
+    preparador e a média geral. Carrega os resumos de todos os pares pedidos
+    numa única consulta.
+    """
+
+    def __init__(self, pairs):
+        keys = {key for vehicle_model, preparer_id in pairs for key in _sample_keys(vehicle_model, preparer_id)}
+        self.stats = _lookup(keys) if keys else {}
+
+    def _stat(self, scope, key):
+        stat = self.stats.get((scope, key))
+        return stat if stat is not None and stat.count >= MIN_SAMPLES else None
+
+    def estimate(self, vehicle_model, preparer_id=None):
+        """Retorna ``(duração, origem)``; sem histórico suficiente, o padrão do modelo."""
+        overall = self._stat('global', GLOBAL_KEY)
+        base = self._stat('model', vehicle_model)
+        source = 'model'
+        if base is None:
+            base, source = overall, 'global'
+        if base is None:
+            return Appointment._meta.get_field('estimated_duration').default, 'default'
+
+        seconds = quantile(base, 0.5)
+        preparer = self._stat('preparer', str(preparer_id)) if preparer_id is not None else None
+        if preparer is not None and overall is not None and overall.mean > 0:
+            low, high = PREPARER_FACTOR_LIMITS
+            seconds *= min(max(preparer.mean / overall.mean, low), high)
+            source = f'{source}+preparer'
+        # Arredondar para minutos cheios
+        return timedelta(minutes=max(round(seconds / 60), 1)), source
+
+
+def estimate(vehicle_model, preparer_id=None):
+    return Estimator([(vehicle_model, preparer_id)]).estimate(vehicle_model, preparer_id)
+
+
+def rebuild():
+    """
+    Recalcula todos os resumos a partir do histórico de agendamentos
+    concluídos, inclusive os já movidos para o arquivo (``logistics.archive``).
+    """
+    with transaction.atomic():
+        DurationStat.objects.all().delete()
+        count = 0
+        batch = []
+        for model in (ArchivedAppointment, Appointment):
+            completed = model.objects.filter(status='completed', actual_duration__isnull=False)
+            model.objects.filter(duration_sampled=True).update(duration_sampled=False)
+            rows = completed.order_by('pk').values_list('vehicle__model', 'preparer_id', 'actual_duration')
+            for vehicle_model, preparer_id, duration in rows.iterator(chunk_size=2000):
+                batch.append((vehicle_model, preparer_id, duration.total_seconds()))
+                if len(batch) >= 2000:
+                    record_samples(batch)
+                    count += len(batch)
+                    batch = []
+            completed.update(duration_sampled=True)
+        record_samples(batch)
+        count += len(batch)
+    logger.info(f"Rebuilt duration statistics from {count} appointments")
+    return count
@@ -0,0 +1,64 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Campos enviados nos eventos: apenas o necessário para os painéis decidirem
+# o que atualizar, nunca o objeto serializado completo.
+APPOINTMENT_EVENT_FIELDS = (
+    'id', 'status', 'priority', 'appointment_date', 'time',
+    'preparer_id', 'vehicle_id', 'updated_at',
+)
+DELIVERY_EVENT_FIELDS = ('id', 'appointment_id', 'status', 'updated_at')
+
+
+def branch_group(branch_id):
+    return f'branch_{branch_id}'
+
+
+def _compact(instance, fields):
+    data = {}
+    for field in fields:
+        value = getattr(instance, field, None)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+
+def _send(branch_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None or branch_id is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            branch_group(branch_id),
+            {'type': 'branch.event', 'event': event},
+        )
+    except Exception as e:
+        # Falha na notificação nunca deve derrubar a requisição que gravou os dados
+        logger.error(f"Error broadcasting {event['model']} event to branch {branch_id}: {str(e)}")
+
+
+def publish(branch_id, model, action, data):
+    """Agenda o envio do evento para depois do commit da transação corrente."""
+    event = {'model': model, 'action': action, 'data': data}
+    transaction.on_commit(lambda: _send(branch_id, event))
+
+
+def publish_appointment(appointment, action):
+    if action == 'deleted':
+        data = {'id': appointment.pk}
+    else:
+        data = _compact(appointment, APPOINTMENT_EVENT_FIELDS)
+    publish(appointment.branch_id, 'appointment', action, data)
+
+
+def publish_delivery(delivery, branch_id, action):
+    if action == 'deleted':
+        data = {'id': delivery.pk, 'appointment_id': delivery.appointment_id}
+    else:
+        data = _compact(delivery, DELIVERY_EVENT_FIELDS)
+    publish(branch_id, 'delivery', action, data)
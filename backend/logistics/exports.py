@@ -0,0 +1,175 @@
+import csv
+import json
+import zlib
+from datetime import date, time, timedelta
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.duration import duration_string
+
+# Linhas lidas do banco por consulta
+EXPORT_CHUNK_SIZE = 2000
+# Bytes acumulados antes de entregar um pedaço ao servidor
+EXPORT_BUFFER_BYTES = 64 * 1024
+
+# (coluna no arquivo, lookup no .values_list); o id vem primeiro e guia a paginação
+APPOINTMENT_COLUMNS = (
+    ('id', 'id'),
+    ('appointment_date', 'appointment_date'),
+    ('time', 'time'),
+    ('status', 'status'),
+    ('priority', 'priority'),
+    ('client', 'client'),
+    ('client_phone', 'client_phone'),
+    ('client_email', 'client_email'),
+    ('seller', 'seller'),
+    ('vehicle_model', 'vehicle__model'),
+    ('vehicle_chassi', 'vehicle__chassi'),
+    ('branch', 'branch__name'),
+    ('preparer', 'preparer__user__username'),
+    ('estimated_duration', 'estimated_duration'),
+    ('actual_duration', 'actual_duration'),
+    ('delivery_status', 'delivery__status'),
+    ('delivery_date', 'delivery__delivery_date'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+DELIVERY_COLUMNS = (
+    ('id', 'id'),
+    ('appointment_id', 'appointment_id'),
+    ('status', 'status'),
+    ('delivery_date', 'delivery_date'),
+    ('appointment_date', 'appointment__appointment_date'),
+    ('client', 'appointment__client'),
+    ('vehicle_model', 'appointment__vehicle__model'),
+    ('vehicle_chassi', 'appointment__vehicle__chassi'),
+    ('branch', 'appointment__branch__name'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+
+def _plain(value):
+    # Mesmas representações da API (DurationField como "HH:MM:SS")
+    if isinstance(value, timedelta):
+        return duration_string(value)
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+
+def rows(querysets, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Tuplas das colunas de cada queryset, em ordem de id, lidas em páginas
+    de ``chunk_size`` pela chave primária. Ao contrário de ``.iterator()``,
+    que no MySQL (mysqlclient) traz o resultado inteiro para a memória do
+    cliente, cada página é uma consulta curta e a memória não cresce.
+    """
+    lookups = [lookup for _, lookup in columns]
+    for queryset in querysets:
+        values = queryset.order_by('pk').values_list(*lookups)
+        last = None
+        while True:
+            page = values if last is None else values.filter(pk__gt=last)
+            page = list(page[:chunk_size])
+            if not page:
+                break
+            yield from page
+            last = page[-1][0]
+
+
+class _Echo:
+    """Arquivo falso: ``csv.writer`` devolve a linha em vez de gravá-la."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, records):
+    writer = csv.writer(_Echo())
+    # BOM para o Excel reconhecer UTF-8; o CSVParser o descarta na importação
+    yield '\ufeff' + writer.writerow([name for name, _ in columns])
+    for record in records:
+        yield writer.writerow(['' if value is None else _plain(value) for value in record])
+
+
+def ndjson_lines(columns, records):
+    names = [name for name, _ in columns]
+    for record in records:
+        yield json.dumps(dict(zip(names, map(_plain, record))), ensure_ascii=False) + '\n'
+
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
+
+
+def _chunks(lines, size=EXPORT_BUFFER_BYTES):
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer).encode()
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(querysets, columns, fmt='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Bytes do arquivo exportado, gerados sob demanda."""
+    _, lines = FORMATS[fmt]
+    chunks = _chunks(lines(columns, rows(querysets, columns, chunk_size)))
+    return _gzip(chunks) if compress else chunks
+
+
+def filename(name, fmt, compress=False):
+    return f'{name}.{fmt}.gz' if compress else f'{name}.{fmt}'
+
+
+_END = object()
+
+
+class ExportResponse(StreamingHttpResponse):
+    """
+    ``StreamingHttpResponse`` que também flui sob ASGI (daphne).
+
+    O Django 4.2 serve iteradores síncronos no ASGI com
+    ``sync_to_async(list)``: o arquivo inteiro seria montado na memória antes
+    do primeiro byte. Aqui cada pedaço é pedido ao gerador com
+    ``sync_to_async`` na thread da requisição, a mesma da conexão com o
+    banco, e enviado antes de ler o próximo. No WSGI nada muda.
+    """
+
+    async def __aiter__(self):
+        parts = iter(self.streaming_content)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, _END)
+            if part is _END:
+                return
+            yield part
+
+
+def streaming_response(querysets, columns, name, fmt='csv', compress=False):
+    content_type, _ = FORMATS[fmt]
+    response = ExportResponse(
+        stream(querysets, columns, fmt, compress),
+        content_type='application/gzip' if compress else content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename(name, fmt, compress)}"'
+    return response
@@ -0,0 +1,74 @@
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from .models import Appointment
+
+
+def parse_day(value):
+    """Data de um texto ``YYYY-MM-DD``; ``None`` se malformado ou impossível (ex.: ``2024-02-30``)."""
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def filter_appointments(queryset, params, branch_id=None, prefix=''):
+    """
+    Filtros de ``/api/appointments/``: filial, período, status, preparador e
+    prioridade. ``params`` é um QueryDict ou dicionário; ``branch_id`` None
+    não restringe a filial (superusuário). Com ``prefix`` (ex.:
+    ``'appointment__'``) filtra outro modelo pelo agendamento. Datas ou
+    preparador inválidos levantam ``ValidationError`` (400 na API).
+    """
+    errors = {}
+    dates = {}
+    for name in ('start_date', 'end_date'):
+        if params.get(name):
+            dates[name] = parse_day(params[name])
+            if dates[name] is None:
+                errors[name] = 'Data inválida. Use YYYY-MM-DD'
+    preparer = params.get('preparer', None)
+    if preparer:
+        try:
+            preparer = int(preparer)
+        except (TypeError, ValueError):
+            errors['preparer'] = 'Preparador inválido'
+    if errors:
+        raise ValidationError(errors)
+
+    # Filtrar por filial
+    if branch_id is not None:
+        queryset = queryset.filter(**{f'{prefix}branch_id': branch_id})
+
+    # Filtrar por data
+    if 'start_date' in dates:
+        queryset = queryset.filter(**{f'{prefix}appointment_date__gte': dates['start_date']})
+    if 'end_date' in dates:
+        queryset = queryset.filter(**{f'{prefix}appointment_date__lte': dates['end_date']})
+
+    # Filtrar por status
+    status = params.get('status', None)
+    if status:
+        queryset = queryset.filter(**{f'{prefix}status': status})
+
+    # Filtrar por preparador
+    if preparer:
+        queryset = queryset.filter(**{f'{prefix}preparer_id': preparer})
+
+    # Filtrar por prioridade
+    priority = params.get('priority', None)
+    if priority in dict(Appointment.PRIORITY_CHOICES):
+        queryset = queryset.filter(**{f'{prefix}priority': priority})
+
+    return queryset
+
+
+def filter_deliveries(queryset, params, branch_id=None):
+    """
+    Filtros de ``/api/deliveries/``: ``status`` é o da entrega; filial,
+    período, preparador e prioridade são os do agendamento.
+    """
+    status = params.get('status', None)
+    if status:
+        queryset = queryset.filter(status=status)
+    appointment_params = {key: value for key, value in params.items() if key != 'status'}
+    return filter_appointments(queryset, appointment_params, branch_id, prefix='appointment__')
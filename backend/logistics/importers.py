@@ -0,0 +1,239 @@
+import re
+from django.db import connection, transaction
+from .models import Branch, UserProfile, Vehicle, Appointment
+from .serializers import AppointmentImportSerializer
+from .signals import appointments_imported, vehicles_imported
+from . import availability, durations
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Limite de linhas por importação
+MAX_IMPORT_ROWS = 5000
+BULK_CREATE_BATCH_SIZE = 500
+
+# Campo da linha -> modelo carregado em lote
+RELATED_FIELDS = (
+    ('vehicle_id', Vehicle),
+    ('preparer_id', UserProfile),
+    ('branch_id', Branch),
+)
+
+
+def _collect_ids(rows, field):
+    ids = set()
+    for row in rows:
+        try:
+            ids.add(int(row.get(field)))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+class AppointmentImporter:
+    """
+    Importa uma lista de agendamentos de uma vez.
+
+    As chaves estrangeiras de todas as linhas são resolvidas com um
+    ``in_bulk`` por modelo, as linhas são validadas numa única passada pelo
+    ``AppointmentImportSerializer`` e, se nenhuma tiver erro, tudo é gravado
+    com ``bulk_create`` dentro de uma transação. Qualquer linha inválida
+    cancela a importação inteira.
+    """
+
+    def __init__(self, profile, superuser=False):
+        self.profile = profile
+        # Usuário comum só importa para a própria filial
+        self.branch = None if superuser else profile.branch
+
+    def prepare_rows(self, rows):
+        if self.branch is None:
+            return rows
+        return [{'branch_id': self.branch.pk, **row} if isinstance(row, dict) else row for row in rows]
+
+    def load_related(self, rows):
+        related = {}
+        for field, model in RELATED_FIELDS:
+            ids = _collect_ids(rows, field)
+            related[model] = model.objects.in_bulk(ids) if ids else {}
+        return related
+
+    def validate(self, rows):
+        """Retorna (dados validados, erros por linha numerados a partir de 1)."""
+        rows = self.prepare_rows(rows)
+        serializer = AppointmentImportSerializer(
+            data=rows,
+            many=True,
+            context={'related': self.load_related(rows), 'branch': self.branch},
+        )
+        if serializer.is_valid():
+            return serializer.validated_data, []
+        errors = [
+            {'row': number, 'errors': row_errors}
+            for number, row_errors in enumerate(serializer.errors, start=1)
+            if row_errors
+        ]
+        return None, errors
+
+    def fill_estimates(self, validated):
+        """Duração estimada das linhas sem ``estimated_duration``, com os resumos lidos de uma vez."""
+        pending = [data for data in validated if 'estimated_duration' not in data]
+        if not pending:
+            return
+
+        def pair(data):
+            preparer = data.get('preparer')
+            return data['vehicle'].model, preparer.pk if preparer else None
+
+        estimator = durations.Estimator({pair(data) for data in pending})
+        for data in pending:
+            data['estimated_duration'], _ = estimator.estimate(*pair(data))
+
+    def find_conflicts(self, validated, indexes=None):
+        """
+        Horários já ocupados, no banco ou por uma linha anterior da mesma
+        importação; os índices de todos os dias envolvidos vêm de uma vez
+        (do cache, ou os de ``indexes``).
+        """
+        if indexes is None:
+            indexes = availability.get_indexes({(data['branch'].pk, data['appointment_date']) for data in validated})
+        errors = []
+        for number, data in enumerate(validated, start=1):
+            if data.get('status') in availability.FREE_STATUSES:
+                continue
+            preparer = data.get('preparer')
+            preparer_id = preparer.pk if preparer else None
+            start, end = availability.interval(data['time'], data.get('estimated_duration'))
+            index = indexes[(data['branch'].pk, data['appointment_date'])]
+            conflicts = index.conflicts(preparer_id, data['vehicle'].pk, start, end)
+            if conflicts:
+                errors.append({'row': number, 'errors': {'time': availability.describe(conflicts)}})
+            else:
+                # Id negativo: a linha ainda não existe no banco
+                index.add(-number, preparer_id, data['vehicle'].pk, start, end)
+        return errors
+
+    def build(self, data):
+        appointment = Appointment(created_by=self.profile, **data)
+        appointment.apply_defaults()
+        return appointment
+
+    def run(self, rows):
+        validated, errors = self.validate(rows)
+        if not errors:
+            self.fill_estimates(validated)
+            errors = self.find_conflicts(validated)
+        if errors:
+            return 0, errors
+
+        appointments = [self.build(data) for data in validated]
+        with transaction.atomic():
+            # O cache não enxerga reservas concorrentes: com veículos e preparadores
+            # travados, os conflitos são conferidos de novo no banco
+            availability.lock_resources(
+                [data['preparer'].pk for data in validated if data.get('preparer')],
+                [data['vehicle'].pk for data in validated],
+            )
+            errors = self.find_conflicts(
+                validated, availability.build_indexes({(data['branch'].pk, data['appointment_date']) for data in validated})
+            )
+            if errors:
+                return 0, errors
+            Appointment.objects.bulk_create(appointments, batch_size=BULK_CREATE_BATCH_SIZE)
+            appointments_imported.send(sender=Appointment, appointments=appointments)
+
+        logger.info(f"Imported {len(appointments)} appointments by profile {self.profile.pk}")
+        return len(appointments), []
+
+
+# Linhas por INSERT ... ON CONFLICT na importação de veículos
+VEHICLE_BATCH_SIZE = 1000
+# Erros detalhados devolvidos no relatório; os demais só entram na contagem
+MAX_REPORTED_ERRORS = 100
+VEHICLE_UPDATE_FIELDS = ['model', 'color', 'updated_at']
+COLOR_PATTERN = re.compile(r'^#[0-9A-Fa-f]{6}$')
+
+
+def clean_vehicle(row):
+    """Retorna (dados, erros) de uma linha da importação de veículos."""
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Linha inválida']}
+    data = {
+        'model': str(row.get('model') or '').strip(),
+        'color': str(row.get('color') or '').strip().upper(),
+        'chassi': str(row.get('chassi') or '').strip().upper(),
+    }
+    errors = {}
+    limits = {field: Vehicle._meta.get_field(field).max_length for field in ('model', 'chassi')}
+    for field, value in data.items():
+        if not value:
+            errors[field] = ['Este campo é obrigatório.']
+        elif field in limits and len(value) > limits[field]:
+            errors[field] = [f'Máximo de {limits[field]} caracteres.']
+    if data['color'] and not COLOR_PATTERN.match(data['color']):
+        errors['color'] = ['Use o formato #RRGGBB.']
+    return (None, errors) if errors else (data, None)
+
+
+class VehicleImporter:
+    """
+    Importa veículos em fluxo, com upsert pelo chassi.
+
+    As linhas são consumidas de um iterável (o CSV é lido aos poucos) e
+    gravadas em lotes de ``batch_size``: uma consulta descobre quais chassis
+    já existem (para separar inseridos de atualizados) e um ``bulk_create``
+    com ``update_conflicts`` grava o lote. Cada lote é uma transação; linhas
+    inválidas ou com chassi repetido no arquivo são recusadas sem impedir
+    as demais.
+    """
+
+    def __init__(self, batch_size=VEHICLE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+        # Chassi -> linha em que apareceu primeiro
+        self.seen = {}
+
+    def reject(self, number, errors):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def write(self, batch):
+        chassis = [vehicle.chassi for vehicle in batch]
+        options = {'update_conflicts': True, 'update_fields': VEHICLE_UPDATE_FIELDS}
+        # MySQL (ON DUPLICATE KEY UPDATE) não aceita indicar a chave do conflito
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['chassi']
+        with transaction.atomic():
+            existing = set(Vehicle.objects.filter(chassi__in=chassis).values_list('chassi', flat=True))
+            Vehicle.objects.bulk_create(batch, **options)
+        vehicles_imported.send(sender=Vehicle, chassis=chassis)
+        self.updated += len(existing)
+        self.inserted += len(batch) - len(existing)
+
+    def run(self, rows):
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            data, errors = clean_vehicle(row)
+            if errors:
+                self.reject(number, errors)
+                continue
+            first = self.seen.setdefault(data['chassi'], number)
+            if first != number:
+                self.reject(number, {'chassi': [f'Chassi repetido (linha {first}).']})
+                continue
+            batch.append(Vehicle(**data))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+        logger.info(f"Imported vehicles: {self.inserted} inserted, {self.updated} updated, {self.rejected} rejected")
+        return self.report()
+
+    def report(self):
+        return {'inserted': self.inserted, 'updated': self.updated, 'rejected': self.rejected, 'errors': self.errors}
@@ -0,0 +1,147 @@
+import json
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+import logging
+
+logger = logging.getLogger('logistics.performance')
+
+DEFAULTS = {
+    # Fração das requisições medidas em detalhe (0.0 a 1.0)
+    'SAMPLE_RATE': 1.0,
+    # Requisições acima deste tempo sempre vão para o log, mesmo fora da amostra
+    'SLOW_REQUEST_MS': 500,
+    # Envia o cabeçalho Server-Timing nas requisições amostradas
+    'SERVER_TIMING': True,
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PERFORMANCE_INSTRUMENTATION', {})}
+
+
+class RequestMetrics:
+    """Contadores de uma requisição; também serve de ``execute_wrapper`` do banco."""
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.view = None
+        self.queries = 0
+        self.db = 0.0
+        self.timings = {'serialize': 0.0, 'render': 0.0}
+        self.depth = {'serialize': 0, 'render': 0}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db += time.perf_counter() - started
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        parts = [
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            *(f'{name};dur={value * 1000:.1f}' for name, value in self.timings.items()),
+            f'total;dur={total * 1000:.1f}',
+        ]
+        if self.view:
+            parts.append(f'view;desc="{self.view}"')
+        return ', '.join(parts)
+
+
+@contextmanager
+def measure(name):
+    """Soma o tempo do bloco em ``name``; chamadas aninhadas contam uma vez só."""
+    metrics = _current.get()
+    if metrics is None or not metrics.sampled or metrics.depth[name]:
+        yield
+        return
+    metrics.depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+        metrics.depth[name] -= 1
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ServerTimingMiddleware:
+    """
+    Mede cada requisição: consultas e tempo de banco, serialização,
+    renderização e a view atendida.
+
+    Requisições amostradas (``SAMPLE_RATE``) recebem o cabeçalho
+    ``Server-Timing`` e uma linha JSON no logger ``logistics.performance``.
+    Fora da amostra só o tempo total é medido, e a requisição vai para o log
+    apenas se passar de ``SLOW_REQUEST_MS``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = get_config()
+        metrics = RequestMetrics(sampled=random.random() < config['SAMPLE_RATE'])
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                if metrics.sampled:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total = metrics.elapsed()
+        if metrics.sampled and config['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing(total)
+
+        slow = total * 1000 >= config['SLOW_REQUEST_MS']
+        if metrics.sampled or slow:
+            self.log(request, response, metrics, total, slow)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            match = request.resolver_match
+            metrics.view = (match.view_name if match else None) or view_func.__name__
+
+    def log(self, request, response, metrics, total, slow):
+        entry = {
+            'method': request.method,
+            'path': request.path,
+            'view': metrics.view,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+        }
+        if metrics.sampled:
+            entry.update({
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db * 1000, 1),
+                'serialize_ms': round(metrics.timings['serialize'] * 1000, 1),
+                'render_ms': round(metrics.timings['render'] * 1000, 1),
+                'bytes': len(response.content) if not response.streaming else None,
+            })
+        line = json.dumps(entry, separators=(',', ':'))
+        if slow:
+            logger.warning(line)
+        else:
+            logger.info(line)
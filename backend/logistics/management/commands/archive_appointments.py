@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from logistics.archive import DEFAULT_BATCH_SIZE, archivable, archive, horizon
+
+
+class Command(BaseCommand):
+    help = 'Move agendamentos e entregas finalizados mais antigos que o horizonte para as tabelas de arquivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Horizonte em dias (padrão: ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Agendamentos por transação')
+        parser.add_argument('--max-batches', type=int, help='Para depois de N lotes; rode de novo para continuar')
+        parser.add_argument('--pause', type=float, default=0.0, help='Segundos de pausa entre lotes')
+        parser.add_argument('--dry-run', action='store_true', help='Só conta o que seria arquivado')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days não pode ser negativo')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size deve ser positivo')
+        before = horizon(options['days'])
+
+        if options['dry_run']:
+            count = archivable(before).count()
+            self.stdout.write(f'{count} agendamento(s) anteriores a {before} seriam arquivados')
+            return
+
+        def on_batch(number, appointments, deliveries):
+            self.stdout.write(f'  lote {number}: {appointments} agendamento(s), {deliveries} entrega(s)')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        appointments, deliveries = archive(
+            before, batch_size=options['batch_size'], max_batches=options['max_batches'], on_batch=on_batch
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{appointments} agendamento(s) e {deliveries} entrega(s) anteriores a {before} arquivados'
+        ))
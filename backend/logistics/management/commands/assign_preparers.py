@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from logistics.filters import parse_day
+from logistics.models import Branch
+from logistics.scheduling import PreparerScheduler
+
+
+class Command(BaseCommand):
+    help = 'Atribui preparadores aos agendamentos sem preparador e mostra a ocupação de cada um'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Dia dos agendamentos (YYYY-MM-DD); padrão: hoje')
+        parser.add_argument('--branch', type=int, action='append', help='Filial (pode repetir); padrão: todas')
+        parser.add_argument('--dry-run', action='store_true', help='Só calcula e mostra o plano, sem gravar')
+
+    def handle(self, *args, **options):
+        day = parse_day(options['date']) if options['date'] else timezone.localdate()
+        if day is None:
+            raise CommandError('Data inválida. Use YYYY-MM-DD')
+        branch_ids = options['branch'] or list(Branch.objects.order_by('pk').values_list('pk', flat=True))
+
+        for branch_id in branch_ids:
+            started = time.perf_counter()
+            result = PreparerScheduler(branch_id, day).run(dry_run=options['dry_run'])
+            elapsed = (time.perf_counter() - started) * 1000
+
+            self.stdout.write(
+                f"Filial {branch_id} em {result['date']}: {result['assigned']} atribuído(s), "
+                f"{len(result['unassigned'])} sem preparador livre, ocupação {result['utilization']:.0%} "
+                f"({elapsed:.0f} ms)"
+            )
+            for row in result['preparers']:
+                self.stdout.write(
+                    f"  {row['username']:<20} +{row['assigned']:<4} {row['busy_seconds'] / 3600:5.1f} h  "
+                    f"{row['utilization']:.0%}"
+                )
+            if result['unassigned']:
+                self.stdout.write(self.style.WARNING(
+                    f"  Sem preparador livre: {', '.join(map(str, result['unassigned']))}"
+                ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Simulação: nada foi gravado'))
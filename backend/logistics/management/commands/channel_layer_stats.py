@@ -0,0 +1,29 @@
+import json
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Mostra ocupação das filas, grupos e contadores do channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help='Alias do channel layer em CHANNEL_LAYERS')
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer(options['alias'])
+        if layer is None:
+            raise CommandError(f"Channel layer '{options['alias']}' não configurado")
+        if not hasattr(layer, 'stats'):
+            raise CommandError(f'{type(layer).__name__} não expõe métricas de capacidade')
+
+        stats = layer.stats()
+        self.stdout.write(json.dumps(stats, indent=2, ensure_ascii=False))
+
+        saturated = [
+            channel for channel, info in stats['channels'].items()
+            if info['depth'] >= info['capacity']
+        ]
+        if saturated:
+            self.stdout.write(self.style.WARNING(f'{len(saturated)} canal(is) na capacidade máxima'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Nenhum canal na capacidade máxima'))
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from logistics.models import Branch, UserProfile
+from logistics.views import (
+    AppointmentViewSet, DeliveryViewSet, UserProfileViewSet, UserViewSet
+)
+
+# Consultas canônicas de cada viewset: (descrição, viewset, query params, superusuário)
+CANONICAL_QUERIES = [
+    ('appointments: filial', AppointmentViewSet, {}, False),
+    ('appointments: filial + período', AppointmentViewSet, {'start_date': '{today}', 'end_date': '{today}'}, False),
+    ('appointments: filial + status', AppointmentViewSet, {'status': 'scheduled'}, False),
+    ('appointments: filial + status + período', AppointmentViewSet, {'status': 'scheduled', 'start_date': '{today}'}, False),
+    ('appointments: filial + preparador', AppointmentViewSet, {'preparer': '{profile}'}, False),
+    ('appointments: filial + prioridade', AppointmentViewSet, {'priority': 'high'}, False),
+    ('appointments: todas as filiais', AppointmentViewSet, {}, True),
+    ('appointments: todas as filiais + período', AppointmentViewSet, {'start_date': '{today}', 'end_date': '{today}'}, True),
+    ('deliveries: filial', DeliveryViewSet, {}, False),
+    ('deliveries: filial + status', DeliveryViewSet, {'status': 'pending'}, False),
+    ('profiles: filial', UserProfileViewSet, {}, False),
+    ('profiles: preparadores da filial', UserProfileViewSet, {'is_preparer': 'true'}, False),
+    ('users: filial', UserViewSet, {}, False),
+]
+
+
+def full_table_scans(queryset):
+    """Tabelas lidas por varredura completa no plano de execução do queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            # "SCAN tabela" sem "USING ... INDEX" é leitura da tabela inteira
+            return [
+                detail.split()[1] for *_, detail in cursor.fetchall()
+                if detail.startswith('SCAN ') and 'INDEX' not in detail
+            ]
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return [row['table'] for row in rows if row['type'] == 'ALL']
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [
+                line.split(' on ')[1].split()[0] for (line,) in cursor.fetchall()
+                if 'Seq Scan on ' in line
+            ]
+    raise CommandError(f'Banco {connection.vendor} não suportado')
+
+
+class Command(BaseCommand):
+    help = 'Executa EXPLAIN nas consultas canônicas das viewsets e falha se alguma fizer varredura completa'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Mostra o plano completo de cada consulta')
+
+    def build_queryset(self, viewset_class, params, superuser, branch, profile_id):
+        today = timezone.localdate().isoformat()
+        params = {key: value.format(today=today, profile=profile_id) for key, value in params.items()}
+
+        # Usuário leve: as viewsets só precisam da filial e do flag de superusuário
+        user = SimpleNamespace(
+            pk=0,
+            username='explain',
+            is_authenticated=True,
+            is_superuser=superuser,
+            userprofile=UserProfile(pk=profile_id, branch=branch),
+        )
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = user
+
+        view = viewset_class()
+        view.request = request
+        view.action = 'list'
+        view.format_kwarg = None
+        view.kwargs = {}
+        queryset = view.filter_queryset(view.get_queryset())
+
+        # Mesmo recorte que a paginação aplica na primeira página
+        if view.pagination_class is not None and hasattr(view.pagination_class, 'page_size'):
+            queryset = queryset[:view.pagination_class.page_size]
+        return queryset
+
+    def handle(self, *args, **options):
+        branch = Branch.objects.order_by('pk').first() or Branch(pk=1)
+        profile_id = (
+            UserProfile.objects.filter(branch=branch).order_by('pk').values_list('pk', flat=True).first() or 1
+        )
+
+        failures = []
+        for description, viewset_class, params, superuser in CANONICAL_QUERIES:
+            queryset = self.build_queryset(viewset_class, params, superuser, branch, profile_id)
+            scans = full_table_scans(queryset)
+
+            if options['verbose_plans']:
+                self.stdout.write(queryset.explain())
+            if scans:
+                failures.append(description)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {description}: {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK         {description}'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} consulta(s) com varredura completa de tabela')
+        self.stdout.write(self.style.SUCCESS('Todas as consultas canônicas usam índices'))
@@ -0,0 +1,59 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from logistics import exports
+from logistics.archive import reaches_archive
+from logistics.filters import filter_appointments, filter_deliveries
+from logistics.models import Appointment, ArchivedAppointment, ArchivedDelivery, Delivery
+
+
+class Command(BaseCommand):
+    help = 'Exporta agendamentos ou entregas em CSV/NDJSON, com os mesmos filtros da API, sem carregar tudo na memória'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', action='store_true', help='Exporta entregas em vez de agendamentos')
+        parser.add_argument('--format', dest='output_format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Comprime a saída com gzip')
+        parser.add_argument('--output', help='Arquivo de saída; padrão: saída padrão')
+        parser.add_argument('--branch', type=int, help='Filial; padrão: todas')
+        parser.add_argument('--start-date', help='Primeiro dia (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Último dia (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Status (da entrega, com --deliveries)')
+        parser.add_argument('--preparer', type=int, help='Preparador')
+        parser.add_argument('--priority', help='Prioridade')
+        parser.add_argument('--chunk-size', type=int, default=exports.EXPORT_CHUNK_SIZE, help='Linhas por consulta')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size deve ser positivo')
+
+        params = {
+            name: options[name] for name in ('start_date', 'end_date', 'status', 'preparer', 'priority')
+            if options[name] is not None
+        }
+        if options['deliveries']:
+            columns = exports.DELIVERY_COLUMNS
+            models = [ArchivedDelivery, Delivery]
+            apply_filters = filter_deliveries
+        else:
+            columns = exports.APPOINTMENT_COLUMNS
+            models = [ArchivedAppointment, Appointment]
+            apply_filters = filter_appointments
+        if not reaches_archive(options['start_date']):
+            models = models[1:]
+        try:
+            querysets = [apply_filters(model.objects.all(), params, options['branch']) for model in models]
+        except ValidationError as e:
+            raise CommandError('; '.join(f'{name}: {message[0]}' for name, message in e.detail.items()))
+
+        chunks = exports.stream(
+            querysets, columns, options['output_format'], options['gzip'], chunk_size=options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                written = sum(output.write(chunk) for chunk in chunks)
+            self.stderr.write(self.style.SUCCESS(f'{written} bytes gravados em {options["output"]}'))
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
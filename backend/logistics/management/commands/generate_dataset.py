@@ -0,0 +1,63 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from logistics.dataset import DEFAULT_BATCH_SIZE, DEFAULT_PASSWORD, DatasetGenerator
+from logistics.durations import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Gera uma massa de dados sintética e reproduzível (filiais, preparadores, veículos, agendamentos e entregas) para testes de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Semente: a mesma semente gera os mesmos dados')
+        parser.add_argument('--branches', type=int, default=5, help='Filiais')
+        parser.add_argument('--preparers', type=int, default=8, help='Preparadores por filial')
+        parser.add_argument('--vehicles', type=int, default=20000, help='Veículos na frota')
+        parser.add_argument('--years', type=float, default=1.0, help='Anos de histórico até hoje')
+        parser.add_argument('--future-days', type=int, default=14, help='Dias de agenda depois de hoje')
+        parser.add_argument('--appointments-per-day', type=int, default=40, help='Média de agendamentos por filial por dia')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Linhas por lote gravado')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Senha dos usuários gerados')
+        parser.add_argument('--with-stats', action='store_true', help='Recalcula as estatísticas de duração no fim')
+
+    def handle(self, *args, **options):
+        for name in ('branches', 'preparers', 'vehicles', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} deve ser positivo")
+        for name in ('years', 'future_days', 'appointments_per_day'):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} não pode ser negativo")
+
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            branches=options['branches'],
+            preparers=options['preparers'],
+            vehicles=options['vehicles'],
+            years=options['years'],
+            future_days=options['future_days'],
+            appointments_per_day=options['appointments_per_day'],
+            batch_size=options['batch_size'],
+            password=options['password'],
+        )
+        started = time.perf_counter()
+        reported = [0]
+
+        def progress(counts):
+            # Uma linha a cada ~100 mil agendamentos
+            if counts['appointments'] - reported[0] >= 100000:
+                reported[0] = counts['appointments']
+                self.stderr.write(
+                    f"  {counts['appointments']} agendamentos, {counts['deliveries']} entregas "
+                    f"({time.perf_counter() - started:.0f} s)"
+                )
+
+        counts = generator.run(on_batch=progress)
+        if options['with_stats']:
+            rebuild()
+        elapsed = time.perf_counter() - started
+
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['branches']} filial(is), {counts['users']} usuário(s), {counts['vehicles']} veículo(s), "
+            f"{counts['appointments']} agendamento(s) e {counts['deliveries']} entrega(s) "
+            f"em {elapsed:.1f} s ({total / max(elapsed, 0.001):.0f} linhas/s)"
+        ))
@@ -0,0 +1,42 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ParseError
+from logistics.importers import VEHICLE_BATCH_SIZE, VehicleImporter
+from logistics.parsers import iter_csv_rows
+
+
+class Command(BaseCommand):
+    help = 'Importa veículos de um CSV (model, color, chassi), inserindo os novos e atualizando pelo chassi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Arquivo CSV ('-' para a entrada padrão)")
+        parser.add_argument('--batch-size', type=int, default=VEHICLE_BATCH_SIZE, help='Veículos por INSERT')
+        parser.add_argument('--encoding', default='utf-8', help='Codificação do arquivo')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size deve ser positivo')
+
+        started = time.perf_counter()
+        importer = VehicleImporter(batch_size=options['batch_size'])
+        try:
+            if options['path'] == '-':
+                report = importer.run(iter_csv_rows(sys.stdin.buffer, options['encoding']))
+            else:
+                with open(options['path'], 'rb') as source:
+                    report = importer.run(iter_csv_rows(source, options['encoding']))
+        except OSError as e:
+            raise CommandError(f'Não foi possível ler o arquivo: {e}')
+        except ParseError as e:
+            raise CommandError(
+                f'{e.detail} (gravados até aqui: {importer.inserted} inseridos, {importer.updated} atualizados)'
+            )
+        elapsed = time.perf_counter() - started
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f"  linha {error['row']}: {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['inserted']} inserido(s), {report['updated']} atualizado(s), "
+            f"{report['rejected']} recusado(s) em {elapsed:.1f} s"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from logistics.durations import MIN_SAMPLES, quantile, rebuild
+from logistics.models import DurationStat
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as estatísticas de duração a partir dos agendamentos concluídos'
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{count} agendamento(s) concluído(s) processado(s)'))
+
+        for stat in DurationStat.objects.order_by('scope', 'key'):
+            marker = '' if stat.count >= MIN_SAMPLES else '  (poucas amostras)'
+            self.stdout.write(
+                f"  {stat.scope:<9} {stat.key or '-':<20} n={stat.count:<6} "
+                f"média={stat.mean / 60:6.1f} min  p50={quantile(stat, 0.5) / 60:6.1f}  "
+                f"p90={quantile(stat, 0.9) / 60:6.1f}  desvio={stat.variance ** 0.5 / 60:5.1f}{marker}"
+            )
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0004_alter_appointment_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('appointment', 'Agendamento'), ('delivery', 'Entrega')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'updated_at', 'id'], name='appointment_branch_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['updated_at', 'id'], name='delivery_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='branch',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='logistics.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model', 'branch', 'id'], name='tombstone_sync_idx'),
+        ),
+    ]
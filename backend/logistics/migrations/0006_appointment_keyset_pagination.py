@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0005_appointment_sync_index_tombstone'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='appointment',
+            options={'ordering': ['appointment_date', 'time', 'id'], 'verbose_name': 'Agendamento', 'verbose_name_plural': 'Agendamentos'},
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'time', 'id'], name='appointment_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'appointment_date', 'time', 'id'], name='appointment_branch_keyset_idx'),
+        ),
+    ]
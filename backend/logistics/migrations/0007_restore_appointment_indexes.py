@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0006_appointment_keyset_pagination'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'status', 'appointment_date', 'time'], name='appointment_branch_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'priority', 'appointment_date', 'time'], name='appointment_branch_prio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['preparer', 'appointment_date', 'time'], name='appointment_preparer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'appointment'], name='delivery_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['branch', 'is_supervisor'], name='profile_branch_role_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:44
+
+from django.db import migrations, models
+
+
+PRIORITY_RANKS = {'high': 0, 'medium': 1, 'low': 2}
+
+
+def fill_priority_rank(apps, schema_editor):
+    Appointment = apps.get_model('logistics', 'Appointment')
+    for priority, rank in PRIORITY_RANKS.items():
+        Appointment.objects.filter(priority=priority).update(priority_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0007_restore_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(fill_priority_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['branch', 'status', 'appointment_date', 'priority_rank', 'time', 'id'], name='appointment_queue_idx'),
+        ),
+    ]
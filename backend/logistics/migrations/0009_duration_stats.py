@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0008_appointment_priority_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DurationStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Geral'), ('model', 'Modelo de veículo'), ('preparer', 'Preparador')], max_length=10)),
+                ('key', models.CharField(blank=True, default='', max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('m2', models.FloatField(default=0.0)),
+                ('quantiles', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_sampled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='durationstat',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='duration_stat_scope_key_uniq'),
+        ),
+    ]
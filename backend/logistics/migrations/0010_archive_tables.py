@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0009_duration_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('appointment_date', models.DateField()),
+                ('scheduled_date', models.DateTimeField()),
+                ('delivery_date', models.DateField(blank=True, null=True)),
+                ('time', models.TimeField()),
+                ('seller', models.CharField(max_length=100)),
+                ('client', models.CharField(max_length=100)),
+                ('client_phone', models.CharField(blank=True, default='', max_length=20)),
+                ('client_email', models.EmailField(blank=True, default='', max_length=254)),
+                ('status', models.CharField(choices=[('scheduled', 'Agendado'), ('in_progress', 'Em Andamento'), ('completed', 'Concluído'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('priority', models.CharField(choices=[('low', 'Baixa'), ('medium', 'Média'), ('high', 'Alta')], max_length=10)),
+                ('priority_rank', models.PositiveSmallIntegerField()),
+                ('estimated_duration', models.DurationField()),
+                ('actual_duration', models.DurationField(blank=True, null=True)),
+                ('duration_sampled', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistics.branch')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistics.userprofile')),
+                ('preparer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistics.userprofile')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='logistics.vehicle')),
+            ],
+            options={
+                'verbose_name': 'Agendamento arquivado',
+                'verbose_name_plural': 'Agendamentos arquivados',
+                'ordering': ['appointment_date', 'time', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedDelivery',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('delivered', 'Entregue'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('delivery_date', models.DateTimeField(blank=True, null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='delivery', to='logistics.archivedappointment')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['appointment_date', 'time', 'id'], name='archived_appt_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['branch', 'appointment_date', 'time', 'id'], name='archived_appt_branch_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_chassis(apps, schema_editor):
+    # Mantém o veículo mais antigo de cada chassi e aponta os agendamentos para ele
+    Vehicle = apps.get_model('logistics', 'Vehicle')
+    Appointment = apps.get_model('logistics', 'Appointment')
+    ArchivedAppointment = apps.get_model('logistics', 'ArchivedAppointment')
+    duplicates = (
+        Vehicle.objects.values('chassi').annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    )
+    for group in duplicates:
+        others = Vehicle.objects.filter(chassi=group['chassi']).exclude(pk=group['keep'])
+        Appointment.objects.filter(vehicle__in=others).update(vehicle_id=group['keep'])
+        ArchivedAppointment.objects.filter(vehicle__in=others).update(vehicle_id=group['keep'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0010_archive_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_chassis, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='chassi',
+            field=models.CharField(max_length=7, unique=True),
+        ),
+    ]
@@ -0,0 +1,328 @@
+import base64
+import binascii
+import hashlib
+import json
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from .exports import FORMATS, streaming_response
+from .models import Tombstone
+from .serializers import related_paths, unknown_paths
+from .signals import statuses_changed
+
+
+class ConditionalResponseMixin:
+    """
+    Responde ``304 Not Modified`` em list/retrieve quando nada mudou.
+
+    Os validadores saem de um único aggregate (``COUNT`` + ``MAX`` das colunas
+    em ``validator_fields``) sobre o mesmo queryset filtrado por filial, então
+    nenhuma linha é carregada nem serializada quando o cliente já tem a versão
+    atual. A contagem faz o ETag mudar também em exclusões; o Last-Modified
+    sozinho não percebe exclusões, por isso o ETag tem precedência.
+    """
+
+    # Colunas cujo MAX compõe o validador. Inclua as relações que aparecem
+    # aninhadas na resposta para que alterações nelas também invalidem o ETag.
+    validator_fields = ('updated_at',)
+
+    def get_validator_queryset(self, queryset):
+        return queryset
+
+    def get_validators(self, queryset):
+        queryset = self.get_validator_queryset(queryset)
+        aggregates = {f'max_{index}': Max(field) for index, field in enumerate(self.validator_fields)}
+        result = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+
+        timestamps = [value for key, value in result.items() if key != 'count' and value is not None]
+        last_modified = max(timestamps) if timestamps else None
+
+        key = '|'.join([
+            self.request.get_full_path(),
+            str(self.request.user.pk),
+            str(result['count']),
+            *(value.isoformat() if value else '' for value in timestamps),
+        ])
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        return etag, last_modified
+
+    def _conditional(self, queryset, render):
+        etag, last_modified = self.get_validators(queryset)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+            # O navegador pode guardar, mas deve sempre revalidar com o servidor
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(queryset, lambda: super(ConditionalResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        return self._conditional(queryset, lambda: super(ConditionalResponseMixin, self).retrieve(request, *args, **kwargs))
+
+
+class FlexFieldsViewMixin:
+    """
+    Repassa ``?fields=`` e ``?expand=`` ao serializer e deriva o
+    ``select_related`` da forma pedida, para que só as relações expandidas
+    entrem no JOIN. Nomes desconhecidos nos dois parâmetros respondem 400.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        params = request.query_params
+        checks = [('expand', True)]
+        if request.method in SAFE_METHODS:
+            checks.append(('fields', False))
+        errors = {}
+        for param, expand in checks:
+            if param in params:
+                unknown = unknown_paths(self.get_serializer_class(), params[param], expand)
+                if unknown:
+                    errors[param] = f"Campos desconhecidos: {', '.join(unknown)}"
+        if errors:
+            raise ValidationError(errors)
+
+    def get_expand(self):
+        params = self.request.query_params
+        if 'expand' in params:
+            return params['expand']
+        return self.get_serializer_class().default_expand
+
+    def get_related_paths(self, prefix=''):
+        return related_paths(self.get_serializer_class(), self.get_expand(), prefix)
+
+    def get_serializer(self, *args, **kwargs):
+        params = self.request.query_params
+        kwargs.setdefault('expand', self.get_expand())
+        # Campos esparsos só fazem sentido na leitura
+        if 'fields' in params and self.request.method in SAFE_METHODS:
+            kwargs.setdefault('fields', params['fields'])
+        return super().get_serializer(*args, **kwargs)
+
+
+def encode_sync_cursor(updated_at, pk, tombstone_id):
+    payload = json.dumps({
+        'u': updated_at.isoformat() if updated_at else None,
+        'i': pk,
+        't': tombstone_id,
+    })
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_sync_cursor(cursor):
+    """Retorna (updated_at, pk, tombstone_id); ``ValueError`` se o cursor for inválido."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        updated_at = parse_datetime(payload['u']) if payload['u'] else None
+        return updated_at, int(payload['i'] or 0), int(payload['t'] or 0)
+    except (TypeError, KeyError, ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError('invalid sync cursor')
+
+
+class DeltaSyncMixin:
+    """
+    Ação ``sync``: devolve apenas o que mudou desde o cursor enviado em ``?since=``.
+
+    As linhas são lidas em ordem de ``(updated_at, id)`` a partir do cursor e
+    as exclusões vêm da tabela de lápides (``Tombstone``), que também registra
+    as linhas que saíram da filial do cliente. Sem ``since`` a
+    resposta é a carga inicial completa, paginada pelo mesmo mecanismo. O
+    cliente repete a chamada com o ``cursor`` retornado enquanto ``has_more``
+    for verdadeiro.
+    """
+
+    sync_model = None
+    sync_page_size = 500
+    # Janela reenviada na próxima sincronização para cobrir transações que
+    # gravaram ``updated_at`` antes do cursor mas só confirmaram depois dele.
+    # Vale também para as lápides: no MySQL o id é reservado antes do commit,
+    # então uma lápide recente pode confirmar depois de outra de id maior.
+    # Reenvios são inofensivos: o cliente apenas sobrescreve ou exclui de novo.
+    sync_overlap = timedelta(seconds=2)
+
+    def get_sync_tombstones(self):
+        tombstones = Tombstone.objects.filter(model=self.sync_model)
+        user = self.request.user
+        if user.is_superuser:
+            # Todas as filiais: só mudou de filial quem ainda existe, nada saiu do escopo
+            return tombstones.exclude(object_id__in=self.queryset.model.objects.values('pk'))
+        return tombstones.filter(branch_id=user.userprofile.branch_id)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        since = request.query_params.get('since')
+        horizon = timezone.now() - self.sync_overlap
+        if since:
+            try:
+                updated_at, last_pk, last_tombstone = decode_sync_cursor(since)
+            except ValueError:
+                return Response({'error': 'Cursor inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            updated_at, last_pk = None, 0
+            # Carga inicial: exclusões anteriores não interessam ao cliente,
+            # exceto as da janela de reenvio, que podem ainda não ter confirmado
+            last_tombstone = (
+                self.get_sync_tombstones().filter(deleted_at__lte=horizon)
+                .order_by('-id').values_list('id', flat=True).first()
+            ) or 0
+
+        queryset = self.get_queryset()
+        if updated_at is not None:
+            queryset = queryset.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=last_pk)
+            )
+        rows = list(queryset.order_by('updated_at', 'pk')[:self.sync_page_size + 1])
+        rows_more = len(rows) > self.sync_page_size
+        rows = rows[:self.sync_page_size]
+
+        tombstones = list(
+            self.get_sync_tombstones()
+            .filter(id__gt=last_tombstone)
+            .order_by('id')
+            .values_list('id', 'object_id', 'deleted_at')[:self.sync_page_size + 1]
+        )
+        tombstones_more = len(tombstones) > self.sync_page_size
+        tombstones = tombstones[:self.sync_page_size]
+
+        if rows:
+            updated_at, last_pk = rows[-1].updated_at, rows[-1].pk
+        if not rows_more and updated_at is not None:
+            if updated_at > horizon:
+                updated_at, last_pk = horizon, 0
+        if tombstones_more:
+            last_tombstone = tombstones[-1][0]
+        else:
+            # O cursor para antes da primeira lápide da janela de reenvio
+            for tombstone_id, _, deleted_at in tombstones:
+                if deleted_at > horizon:
+                    break
+                last_tombstone = tombstone_id
+
+        return Response({
+            'results': self.get_serializer(rows, many=True).data,
+            'deleted': [object_id for _, object_id, _ in tombstones],
+            'cursor': encode_sync_cursor(updated_at, last_pk, last_tombstone),
+            'has_more': rows_more or tombstones_more,
+        })
+
+
+def transition_allowed(model, current, new):
+    """``True`` se ``model.STATUS_TRANSITIONS`` permite ir de ``current`` para ``new``."""
+    return current == new or new in model.STATUS_TRANSITIONS.get(current, ())
+
+
+class BulkStatusMixin:
+    """
+    Ação ``bulk_status``: aplica o mesmo status a vários registros.
+
+    Recebe ``{"ids": [...], "status": "..."}``. As linhas são bloqueadas e
+    conferidas contra ``STATUS_TRANSITIONS`` do modelo; se qualquer id não
+    existir (na filial do usuário) ou não puder mudar para o status pedido,
+    nada é alterado. Caso contrário um único ``UPDATE`` grava a mudança e
+    sai uma notificação agregada por filial.
+    """
+
+    # Caminho até a filial, usado para agrupar as notificações
+    status_branch_field = 'branch_id'
+    status_event_model = None
+    bulk_status_max_ids = 1000
+
+    @action(detail=False, methods=['post'])
+    def bulk_status(self, request):
+        model = self.get_queryset().model
+        new_status = request.data.get('status')
+        ids = request.data.get('ids')
+
+        if new_status not in dict(model.STATUS_CHOICES):
+            return Response({'error': 'Status inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'Informe a lista de ids'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = {int(pk) for pk in ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'Ids inválidos'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.bulk_status_max_ids:
+            return Response(
+                {'error': f'Máximo de {self.bulk_status_max_ids} registros por vez'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        sources = {source for source in model.STATUS_TRANSITIONS if transition_allowed(model, source, new_status)}
+        with transaction.atomic():
+            current = {
+                pk: (current_status, branch_id)
+                for pk, current_status, branch_id in self.get_queryset()
+                .filter(pk__in=ids)
+                .select_for_update()
+                .values_list('pk', 'status', self.status_branch_field)
+            }
+            errors = [{'id': pk, 'error': 'Registro não encontrado'} for pk in sorted(ids - set(current))]
+            errors.extend(
+                {'id': pk, 'error': f'Transição de {current_status} para {new_status} não permitida'}
+                for pk, (current_status, _) in sorted(current.items())
+                if current_status not in sources
+            )
+            if errors:
+                return Response({'updated': 0, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            changes = [(pk, branch_id) for pk, (current_status, branch_id) in current.items() if current_status != new_status]
+            updated = 0
+            if changes:
+                updated = model._default_manager.filter(
+                    pk__in=[pk for pk, _ in changes], status__in=sources
+                ).update(status=new_status, updated_at=timezone.now())
+                statuses_changed.send(sender=model, model=self.status_event_model, changes=changes, status=new_status)
+
+        rows = self.get_queryset().filter(pk__in=ids)
+        return Response({'updated': updated, 'results': self.get_serializer(rows, many=True).data})
+
+
+class ExportMixin:
+    """
+    Ação ``export``: o queryset filtrado da listagem inteiro, sem paginação,
+    como CSV (``?output=csv``, padrão) ou NDJSON (``?output=ndjson``),
+    opcionalmente com gzip (``?gzip=1``). As linhas são lidas em páginas e
+    enviadas aos poucos, então a memória não cresce com o tamanho do arquivo.
+    """
+
+    export_columns = ()
+    export_name = 'export'
+
+    def get_export_querysets(self):
+        return [self.get_queryset()]
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        params = request.query_params
+        fmt = params.get('output', 'csv')
+        if fmt not in FORMATS:
+            return Response(
+                {'error': f'Formato inválido. Use {" ou ".join(FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = params.get('gzip', '').lower() in ('1', 'true')
+        name = f'{self.export_name}-{timezone.localdate().isoformat()}'
+        return streaming_response(self.get_export_querysets(), self.export_columns, name, fmt, compress)
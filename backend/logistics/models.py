@@ -20,13 +20,20 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Listagem de preparadores/supervisores da filial
+            models.Index(fields=['branch', 'is_supervisor'], name='profile_branch_role_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.branch.name}"
 
 class Vehicle(models.Model):
     model = models.CharField(max_length=100)
     color = models.CharField(max_length=7)
-    chassi = models.CharField(max_length=7)
+    # Único: a importação de veículos faz upsert pelo chassi
+    chassi = models.CharField(max_length=7, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -41,12 +48,23 @@ class Appointment(models.Model):
         ('cancelled', 'Cancelado'),
     ]
 
+    # Status de origem -> status de destino permitidos
+    STATUS_TRANSITIONS = {
+        'scheduled': {'in_progress', 'completed', 'cancelled'},
+        'in_progress': {'scheduled', 'completed', 'cancelled'},
+        'completed': {'in_progress'},
+        'cancelled': {'scheduled'},
+    }
+
     PRIORITY_CHOICES = [
         ('low', 'Baixa'),
         ('medium', 'Média'),
         ('high', 'Alta'),
     ]
 
+    # Posição na fila de cada prioridade: menor sai primeiro
+    PRIORITY_RANKS = {'high': 0, 'medium': 1, 'low': 2}
+
     appointment_date = models.DateField()
     scheduled_date = models.DateTimeField(auto_now_add=True)
     delivery_date = models.DateField(null=True, blank=True)
@@ -74,8 +92,12 @@ class Appointment(models.Model):
         choices=PRIORITY_CHOICES,
         default='medium'
     )
+    # Derivado de priority em apply_defaults(); ordena a fila sem depender da ordem alfabética
+    priority_rank = models.PositiveSmallIntegerField(default=1, editable=False)
     estimated_duration = models.DurationField(default=timedelta(hours=1))
     actual_duration = models.DurationField(null=True, blank=True)
+    # Já contado em DurationStat; evita somar a mesma duração duas vezes
+    duration_sampled = models.BooleanField(default=False, editable=False)
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(
         UserProfile,
@@ -86,16 +108,47 @@ class Appointment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['appointment_date', 'time']
+        ordering = ['appointment_date', 'time', 'id']
         verbose_name = 'Agendamento'
         verbose_name_plural = 'Agendamentos'
+        indexes = [
+            # Paginação por cursor em (appointment_date, time, id)
+            models.Index(fields=['appointment_date', 'time', 'id'], name='appointment_keyset_idx'),
+            models.Index(fields=['branch', 'appointment_date', 'time', 'id'], name='appointment_branch_keyset_idx'),
+            # Filtros do AppointmentViewSet combinados com a ordenação padrão
+            models.Index(fields=['branch', 'status', 'appointment_date', 'time'], name='appointment_branch_status_idx'),
+            models.Index(fields=['branch', 'priority', 'appointment_date', 'time'], name='appointment_branch_prio_idx'),
+            models.Index(fields=['preparer', 'appointment_date', 'time'], name='appointment_preparer_idx'),
+            # Fila dos preparadores (claim_next): próximo agendado da filial no dia
+            models.Index(
+                fields=['branch', 'status', 'appointment_date', 'priority_rank', 'time', 'id'],
+                name='appointment_queue_idx',
+            ),
+            # Sincronização incremental por filial (?since=)
+            models.Index(fields=['branch', 'updated_at', 'id'], name='appointment_branch_sync_idx'),
+        ]
 
     def __str__(self):
         return f"{self.client} - {self.appointment_date} {self.time}"
 
-    def save(self, *args, **kwargs):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Filial e dia como estavam no banco, para tirar o card do painel antigo se mudarem
+        instance._loaded_board_key = (instance.__dict__.get('branch_id'), instance.__dict__.get('appointment_date'))
+        return instance
+
+    def apply_defaults(self):
+        # Também chamado pela importação em lote, que não passa por save()
         if not self.delivery_date:
             self.delivery_date = self.appointment_date + timezone.timedelta(days=3)
+        self.priority_rank = self.PRIORITY_RANKS.get(self.priority, self.PRIORITY_RANKS['medium'])
+
+    def save(self, *args, **kwargs):
+        self.apply_defaults()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'priority' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'priority_rank'}
         super().save(*args, **kwargs)
 
 class Delivery(models.Model):
@@ -105,6 +158,12 @@ class Delivery(models.Model):
         ('cancelled', 'Cancelado'),
     ]
 
+    STATUS_TRANSITIONS = {
+        'pending': {'delivered', 'cancelled'},
+        'delivered': {'pending'},
+        'cancelled': {'pending'},
+    }
+
     appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     delivery_date = models.DateTimeField(null=True, blank=True)
@@ -112,5 +171,131 @@ class Delivery(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='delivery_sync_idx'),
+            # Entregas por status; a filial vem do agendamento (appointment_id)
+            models.Index(fields=['status', 'appointment'], name='delivery_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Entrega - {self.appointment.vehicle.model}"
+
+class Tombstone(models.Model):
+    """Registro de exclusão (ou de saída da filial) usado pela sincronização incremental."""
+
+    MODEL_CHOICES = [
+        ('appointment', 'Agendamento'),
+        ('delivery', 'Entrega'),
+    ]
+
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    # Sem constraint: a lápide precisa sobreviver à exclusão em cascata da filial
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'branch', 'id'], name='tombstone_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} excluído em {self.deleted_at}"
+
+
+class DurationStat(models.Model):
+    """Resumo incremental das durações reais (ver ``logistics.durations``)."""
+
+    SCOPE_CHOICES = [
+        ('global', 'Geral'),
+        ('model', 'Modelo de veículo'),
+        ('preparer', 'Preparador'),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    # Modelo do veículo ou id do preparador; vazio no resumo geral
+    key = models.CharField(max_length=100, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    # Segundos: média e soma dos quadrados dos desvios (Welford)
+    mean = models.FloatField(default=0.0)
+    m2 = models.FloatField(default=0.0)
+    # Marcadores P² de cada quantil, por exemplo {"0.5": {"q": [...], "n": [...], "np": [...]}}
+    quantiles = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='duration_stat_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}: {self.count} amostras"
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+class ArchivedAppointment(models.Model):
+    """
+    Agendamento finalizado movido para fora da tabela quente (ver
+    ``logistics.archive``). Mesmas colunas e ids de ``Appointment``, sem
+    ``auto_now``: os valores são copiados como estavam.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    appointment_date = models.DateField()
+    scheduled_date = models.DateTimeField()
+    delivery_date = models.DateField(null=True, blank=True)
+    time = models.TimeField()
+    seller = models.CharField(max_length=100)
+    client = models.CharField(max_length=100)
+    client_phone = models.CharField(max_length=20, blank=True, default='')
+    client_email = models.EmailField(blank=True, default='')
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    preparer = models.ForeignKey(UserProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    priority = models.CharField(max_length=10, choices=Appointment.PRIORITY_CHOICES)
+    priority_rank = models.PositiveSmallIntegerField()
+    estimated_duration = models.DurationField()
+    actual_duration = models.DurationField(null=True, blank=True)
+    duration_sampled = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['appointment_date', 'time', 'id']
+        verbose_name = 'Agendamento arquivado'
+        verbose_name_plural = 'Agendamentos arquivados'
+        indexes = [
+            # Mesma paginação por cursor da tabela quente
+            models.Index(fields=['appointment_date', 'time', 'id'], name='archived_appt_keyset_idx'),
+            models.Index(fields=['branch', 'appointment_date', 'time', 'id'], name='archived_appt_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client} - {self.appointment_date} {self.time} (arquivado)"
+
+class ArchivedDelivery(models.Model):
+    """Entrega finalizada, arquivada junto com o agendamento."""
+
+    id = models.BigIntegerField(primary_key=True)
+    appointment = models.OneToOneField(ArchivedAppointment, on_delete=models.CASCADE, related_name='delivery')
+    status = models.CharField(max_length=20, choices=Delivery.STATUS_CHOICES)
+    delivery_date = models.DateTimeField(null=True, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"Entrega - {self.appointment.vehicle.model}" 
\ No newline at end of file
+        return f"Entrega arquivada - agendamento {self.appointment_id}"
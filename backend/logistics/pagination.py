@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import date, time
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class AppointmentKeysetPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) em ``(appointment_date, time, id)``.
+
+    Cada página filtra a partir da chave da última linha da página anterior,
+    então a página N custa o mesmo que a primeira: sem ``COUNT(*)`` e sem
+    ``OFFSET``. O ``id`` desempata agendamentos no mesmo horário, garantindo
+    que nenhuma linha se repita ou seja pulada entre páginas.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Cursor inválido'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        payload = json.dumps([row.appointment_date.isoformat(), row.time.isoformat(), row.pk, int(reverse)])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            day, hour, pk, reverse = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return date.fromisoformat(day), time.fromisoformat(hour), int(pk), bool(reverse)
+        except (TypeError, ValueError, binascii.Error, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Como ``paginate_queryset``, intercalando várias fontes com a mesma
+        chave (a tabela quente e o arquivo): cada uma lê no máximo uma página
+        a partir do cursor e as linhas são mescladas pela chave.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[3]
+
+        rows = []
+        for queryset in querysets:
+            rows.extend(self.read_page(queryset, cursor, reverse))
+        if len(querysets) > 1:
+            rows.sort(key=lambda row: (row.appointment_date, row.time, row.pk), reverse=reverse)
+            rows = rows[:self.page_size + 1]
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page = rows
+        return rows
+
+    def read_page(self, queryset, cursor, reverse):
+        if cursor is not None:
+            day, hour, pk, _ = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(appointment_date__lt=day)
+                    | Q(appointment_date=day, time__lt=hour)
+                    | Q(appointment_date=day, time=hour, pk__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(appointment_date__gt=day)
+                    | Q(appointment_date=day, time__gt=hour)
+                    | Q(appointment_date=day, time=hour, pk__gt=pk)
+                )
+
+        ordering = ('-appointment_date', '-time', '-pk') if reverse else ('appointment_date', 'time', 'pk')
+        # Uma linha a mais indica se existe página seguinte nessa direção
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1], reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], reverse=True))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
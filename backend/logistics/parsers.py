@@ -0,0 +1,63 @@
+import codecs
+import csv
+import itertools
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """
+    Converte um CSV com cabeçalho em lista de dicionários.
+
+    Aceita vírgula ou ponto e vírgula como separador (planilhas em pt-BR
+    exportam com ``;``). Células vazias são omitidas para que os campos
+    opcionais usem o valor padrão.
+    """
+
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return list(iter_csv_rows(stream, encoding))
+
+
+class StreamingCSVParser(CSVParser):
+    """
+    Como ``CSVParser``, mas ``request.data`` é um gerador: as linhas são
+    lidas do corpo da requisição à medida que a view as consome.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return iter_csv_rows(stream, encoding)
+
+
+def iter_csv_rows(stream, encoding):
+    """
+    Dicionários das linhas de um CSV binário lido linha a linha, sem
+    carregar o arquivo inteiro. O separador é detectado pelo cabeçalho.
+    """
+    if stream is None:
+        return
+    lines = codecs.iterdecode(iter(stream.readline, b''), encoding)
+    try:
+        header = next(lines, '').lstrip('\ufeff')
+        while header and not header.strip():
+            header = next(lines, '')
+        if not header:
+            return
+
+        try:
+            dialect = csv.Sniffer().sniff(header, delimiters=',;')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(itertools.chain([header], lines), dialect=dialect)
+        for row in reader:
+            yield {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+    except UnicodeDecodeError as e:
+        raise ParseError(f'CSV com codificação inválida: {str(e)}')
+    except csv.Error as e:
+        raise ParseError(f'CSV inválido: {str(e)}')
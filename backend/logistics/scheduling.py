@@ -0,0 +1,138 @@
+import heapq
+from datetime import date
+from django.db import transaction
+from django.utils import timezone
+from .availability import build_indexes, interval, working_hours
+from .models import Appointment, UserProfile
+from .signals import preparers_assigned
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = ('pk', 'vehicle_id', 'time', 'estimated_duration', 'priority_rank', 'delivery_date')
+
+
+class PreparerScheduler:
+    """
+    Distribui os agendamentos sem preparador de uma filial em um dia.
+
+    Os agendamentos têm horário fixo, então o problema é escolher *quem*
+    atende cada um: as tarefas são percorridas por prioridade, prazo de
+    entrega (``delivery_date``) e horário, e cada uma vai para o preparador
+    livre naquele intervalo com a menor carga acumulada, tirado de um heap
+    ``(carga, id)``. Os preparadores ocupados no horário saem do heap só
+    até achar um livre e voltam em seguida. A ocupação vem do índice de
+    ``availability``, então ninguém fica com dois agendamentos sobrepostos.
+    """
+
+    def __init__(self, branch_id, day):
+        self.branch_id = branch_id
+        self.day = day
+
+    def load(self):
+        key = (self.branch_id, self.day)
+        index = build_indexes([key])[key]
+        preparers = dict(
+            UserProfile.objects.filter(branch_id=self.branch_id, is_supervisor=False)
+            .order_by('pk').values_list('pk', 'user__username')
+        )
+        jobs = (
+            Appointment.objects.filter(
+                branch_id=self.branch_id, appointment_date=self.day, preparer__isnull=True, status='scheduled'
+            )
+            .values_list(*JOB_FIELDS)
+        )
+        return index, preparers, list(jobs)
+
+    @staticmethod
+    def job_order(job):
+        pk, _, start_time, _, priority_rank, delivery_date = job
+        return priority_rank, delivery_date or date.max, start_time, pk
+
+    def plan(self):
+        """Retorna ``(atribuições {agendamento: preparador}, não atribuídos, relatório)``."""
+        index, preparers, jobs = self.load()
+        load = {pk: sum(end - start for start, end, _ in index.busy('preparer', pk)) for pk in preparers}
+        heap = [(busy, pk) for pk, busy in load.items()]
+        heapq.heapify(heap)
+
+        assignments, unassigned = {}, []
+        for job in sorted(jobs, key=self.job_order):
+            pk, vehicle_id, start_time, duration, _, _ = job
+            start, end = interval(start_time, duration)
+            skipped = []
+            while heap:
+                busy, preparer_id = heapq.heappop(heap)
+                if index.conflicts(preparer_id, None, start, end, exclude=pk):
+                    skipped.append((busy, preparer_id))
+                    continue
+                index.add(pk, preparer_id, vehicle_id, start, end)
+                assignments[pk] = preparer_id
+                load[preparer_id] = busy + end - start
+                heapq.heappush(heap, (load[preparer_id], preparer_id))
+                break
+            else:
+                unassigned.append(pk)
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+
+        return assignments, unassigned, self.report(preparers, load, assignments)
+
+    def report(self, preparers, load, assignments):
+        opening, closing = working_hours()
+        capacity = max(closing - opening, 1)
+        counts = {}
+        for preparer_id in assignments.values():
+            counts[preparer_id] = counts.get(preparer_id, 0) + 1
+        rows = [
+            {
+                'id': pk,
+                'username': username,
+                'assigned': counts.get(pk, 0),
+                'busy_seconds': load[pk],
+                'utilization': round(load[pk] / capacity, 3),
+            }
+            for pk, username in preparers.items()
+        ]
+        total = sum(load.values())
+        return {
+            'preparers': rows,
+            'utilization': round(total / (capacity * len(rows)), 3) if rows else 0.0,
+        }
+
+    def apply(self, assignments):
+        """Grava as atribuições: um UPDATE por preparador, só em quem continua sem preparador."""
+        by_preparer = {}
+        for pk, preparer_id in assignments.items():
+            by_preparer.setdefault(preparer_id, []).append(pk)
+
+        assigned = []
+        now = timezone.now()
+        with transaction.atomic():
+            # Quem recebeu preparador manualmente desde o plano fica de fora
+            still_free = set(
+                Appointment.objects.select_for_update()
+                .filter(pk__in=list(assignments), preparer__isnull=True).values_list('pk', flat=True)
+            )
+            for preparer_id, ids in by_preparer.items():
+                ids = [pk for pk in ids if pk in still_free]
+                if ids:
+                    Appointment.objects.filter(pk__in=ids).update(preparer_id=preparer_id, updated_at=now)
+                    assigned.extend((pk, preparer_id) for pk in ids)
+            if assigned:
+                preparers_assigned.send(sender=Appointment, branch_id=self.branch_id, assignments=assigned)
+
+        logger.info(f"Assigned {len(assigned)} appointments in branch {self.branch_id} on {self.day}")
+        return len(assigned)
+
+    def run(self, dry_run=False):
+        assignments, unassigned, report = self.plan()
+        assigned = len(assignments) if dry_run else self.apply(assignments)
+        return {
+            'date': self.day.isoformat(),
+            'branch': self.branch_id,
+            'assigned': assigned,
+            'unassigned': unassigned,
+            'dry_run': dry_run,
+            **report,
+        }
@@ -0,0 +1,281 @@
+import math
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from django.conf import settings
+from django.db import connection
+from .models import Vehicle
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Fração dos trigramas da busca que o texto precisa conter para contar como parecido
+FUZZY_THRESHOLD = 0.6
+# Abaixo disso os trigramas não distinguem nada: só busca por prefixo
+FUZZY_MIN_LENGTH = 3
+
+# Ordem dos grupos no resultado
+CHASSI_PREFIX, MODEL_PREFIX, CHASSI_FUZZY, MODEL_FUZZY = range(4)
+
+
+def normalize(text):
+    """Maiúsculas, sem acentos e com espaços simples: "Citroën  c3" -> "CITROEN C3"."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.upper().split())
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _remove_sorted(items, item):
+    position = bisect_left(items, item)
+    if position < len(items) and items[position] == item:
+        del items[position]
+
+
+def _prefix_range(items, prefix):
+    """Itens de uma lista ordenada de tuplas cujo primeiro elemento começa com ``prefix``."""
+    position = bisect_left(items, (prefix,))
+    while position < len(items) and items[position][0].startswith(prefix):
+        yield items[position]
+        position += 1
+
+
+class VehicleSearchIndex:
+    """
+    Índice em memória do catálogo de veículos para a busca incremental.
+
+    - prefixo do chassi: lista ordenada de ``(chassi, id)``;
+    - prefixo do modelo: lista ordenada de termos (o modelo inteiro e cada
+      palavra) -> modelo; cada modelo guarda seus veículos ordenados por chassi;
+    - parecidos: trigramas do chassi -> ids (``array`` compacto) e trigramas
+      do modelo -> modelos. Os modelos se repetem muito, então o índice de
+      modelos é pequeno e os textos de modelo e cor são compartilhados.
+
+    A busca aproximada só confere os candidatos das listas de trigramas mais
+    raras que um texto parecido precisa ter (se precisa de ``m`` dos ``n``
+    trigramas, aparece em pelo menos uma das ``n - m + 1`` listas mais curtas).
+    """
+
+    def __init__(self):
+        self.vehicles = {}
+        self.chassis = []
+        self.terms = []
+        self.models = {}
+        self.chassi_grams = {}
+        self.model_grams = {}
+        # Modelo/cor como vieram -> (texto compartilhado, chave normalizada): poucos valores distintos
+        self.labels = {}
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    @classmethod
+    def load(cls, rows):
+        """Índice com todas as linhas ``(id, modelo, cor, chassi)``: acrescenta e ordena uma vez no fim."""
+        index = cls()
+        for row in rows:
+            index.add(*row, place=list.append)
+        index.chassis.sort()
+        index.terms.sort()
+        for members in index.models.values():
+            members.sort()
+        return index
+
+    def label(self, text):
+        entry = self.labels.get(text)
+        if entry is None:
+            entry = self.labels[text] = (text, normalize(text))
+        return entry
+
+    def add(self, pk, model, color, chassi, place=insort):
+        if pk in self.vehicles:
+            self.remove(pk)
+        model, model_key = self.label(model)
+        color, _ = self.label(color)
+        chassi_key = normalize(chassi)
+        self.vehicles[pk] = (model, color, chassi, chassi_key)
+        # A mesma tupla nas duas listas ordenadas
+        entry = (chassi_key, pk)
+        place(self.chassis, entry)
+        for gram in trigrams(chassi_key):
+            self.chassi_grams.setdefault(gram, array('q')).append(pk)
+
+        members = self.models.get(model_key)
+        if members is None:
+            members = self.models[model_key] = []
+            for term in {model_key, *model_key.split()}:
+                place(self.terms, (term, model_key))
+            for gram in trigrams(model_key):
+                self.model_grams.setdefault(gram, set()).add(model_key)
+        place(members, entry)
+
+    def remove(self, pk):
+        entry = self.vehicles.pop(pk, None)
+        if entry is None:
+            return
+        model_key, chassi_key = self.label(entry[0])[1], entry[3]
+        _remove_sorted(self.chassis, (chassi_key, pk))
+        for gram in trigrams(chassi_key):
+            self.chassi_grams[gram].remove(pk)
+
+        members = self.models[model_key]
+        _remove_sorted(members, (chassi_key, pk))
+        if not members:
+            del self.models[model_key]
+            for term in {model_key, *model_key.split()}:
+                _remove_sorted(self.terms, (term, model_key))
+            for gram in trigrams(model_key):
+                self.model_grams[gram].discard(model_key)
+
+    def _similar(self, postings, query, text_of):
+        """Chaves cujos trigramas cobrem ao menos FUZZY_THRESHOLD dos da busca, da mais parecida."""
+        grams = trigrams(query)
+        needed = math.ceil(len(grams) * FUZZY_THRESHOLD)
+        lists = sorted((postings.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*lists[:len(grams) - needed + 1])
+        scored = []
+        for key in candidates:
+            shared = len(grams & trigrams(text_of(key)))
+            if shared >= needed:
+                scored.append((-shared, text_of(key), key))
+        scored.sort()
+        return [key for _, _, key in scored]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Até ``limit`` veículos: chassi por prefixo, modelo por prefixo, depois os parecidos."""
+        query = normalize(query)
+        if not query:
+            return []
+        found = {}
+
+        def take(group, pks):
+            for pk in pks:
+                if len(found) >= limit:
+                    return
+                found.setdefault(pk, group)
+
+        def vehicles_of(models):
+            for model_key in models:
+                for _, pk in self.models.get(model_key, ()):
+                    yield pk
+
+        take(CHASSI_PREFIX, (pk for _, pk in _prefix_range(self.chassis, query)))
+        if len(found) < limit:
+            models = dict.fromkeys(model_key for _, model_key in _prefix_range(self.terms, query))
+            take(MODEL_PREFIX, vehicles_of(models))
+        if len(found) < limit and len(query) >= FUZZY_MIN_LENGTH:
+            take(CHASSI_FUZZY, self._similar(self.chassi_grams, query, lambda pk: self.vehicles[pk][3]))
+            if len(found) < limit:
+                take(MODEL_FUZZY, vehicles_of(self._similar(self.model_grams, query, lambda key: key)))
+
+        return [
+            {'id': pk, 'model': model, 'color': color, 'chassi': chassi}
+            for pk, (model, color, chassi, _) in ((pk, self.vehicles[pk]) for pk in found)
+        ]
+
+
+class VehicleSearch:
+    """
+    Índice local do processo, como o ``principal_cache``: carregado na
+    primeira busca, atualizado pelos sinais de ``Vehicle`` neste processo e
+    recarregado em segundo plano a cada ``VEHICLE_SEARCH_TTL`` segundos para
+    pegar o que outros processos alteraram. Enquanto recarrega, as buscas
+    continuam no índice anterior e as alterações recebidas ficam guardadas
+    para serem reaplicadas no índice novo, que pode ter lido o banco antes
+    delas.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._expires = 0
+        self._refreshing = False
+        # Alterações recebidas durante a recarga: (método do índice, argumentos)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'VEHICLE_SEARCH_TTL', 300)
+
+    def build(self):
+        started = time.perf_counter()
+        rows = Vehicle.objects.order_by().values_list('pk', 'model', 'color', 'chassi').iterator(chunk_size=5000)
+        index = VehicleSearchIndex.load(rows)
+        logger.info(f"Built vehicle search index with {len(index)} vehicles in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def _replace(self, index):
+        with self._lock:
+            for method, args in self._pending:
+                getattr(index, method)(*args)
+            self._pending = []
+            self._index = index
+            self._expires = time.monotonic() + self.ttl
+            self._refreshing = False
+
+    def _refresh_in_background(self):
+        try:
+            self._replace(self.build())
+        except Exception as e:
+            logger.error(f"Error refreshing vehicle search index: {str(e)}")
+            with self._lock:
+                self._pending = []
+                self._refreshing = False
+        finally:
+            connection.close()
+
+    def _apply(self, method, *args):
+        # Chamar com a trava: o índice atual muda já, o da recarga ao ser instalado
+        if self._index is not None:
+            getattr(self._index, method)(*args)
+        if self._refreshing:
+            self._pending.append((method, args))
+
+    def get_index(self):
+        with self._lock:
+            index = self._index
+            stale = index is not None and self._expires <= time.monotonic() and not self._refreshing
+            if stale:
+                self._refreshing = True
+        if index is None:
+            index = self.build()
+            self._replace(index)
+        elif stale:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return index
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        index = self.get_index()
+        with self._lock:
+            return index.search(query, limit)
+
+    def update(self, vehicles):
+        """Aplica ``(id, modelo, cor, chassi)`` ao índice, se ele já estiver carregado."""
+        with self._lock:
+            for row in vehicles:
+                self._apply('add', *row)
+
+    def remove(self, pk):
+        with self._lock:
+            self._apply('remove', pk)
+
+    def refresh_chassis(self, chassis):
+        """Recarrega do banco os veículos com esses chassis (importação em lote)."""
+        if self._index is None or not chassis:
+            return
+        self.update(Vehicle.objects.filter(chassi__in=chassis).values_list('pk', 'model', 'color', 'chassi'))
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+
+vehicle_search = VehicleSearch()
@@ -1,15 +1,105 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction
 from .models import Branch, UserProfile, Vehicle, Appointment, Delivery
+from .instrumentation import measure
+from . import availability, durations
 from django.utils import timezone
 from datetime import datetime, timedelta
 
-class BranchSerializer(serializers.ModelSerializer):
+
+def parse_field_tree(value):
+    """
+    Converte ``"id,vehicle.model,preparer.user"`` (ou uma lista com esses
+    caminhos) em árvore: ``{'id': {}, 'vehicle': {'model': {}}, 'preparer': {'user': {}}}``.
+    """
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str):
+        value = value.split(',')
+    tree = {}
+    for path in value or ():
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def related_paths(serializer_class, expand, prefix=''):
+    """Caminhos de ``select_related`` necessários para a expansão pedida."""
+    paths = []
+    expand = parse_field_tree(expand)
+    for name, (nested_class, _) in getattr(serializer_class, 'expandable_fields', {}).items():
+        if name in expand:
+            path = f'{prefix}{name}'
+            paths.append(path)
+            paths.extend(related_paths(nested_class, expand[name], f'{path}__'))
+    return paths
+
+
+def unknown_paths(serializer_class, tree, expand=False, prefix=''):
+    """
+    Caminhos de ``fields`` (ou de ``expand``, com ``expand=True``) que o
+    serializer não conhece. Só relações em ``expandable_fields`` aceitam
+    níveis aninhados.
+    """
+    nested = getattr(serializer_class, 'expandable_fields', {})
+    names = set(nested) if expand else set(serializer_class().fields)
+    unknown = []
+    for name, children in parse_field_tree(tree).items():
+        path = f'{prefix}{name}'
+        if name not in names:
+            unknown.append(path)
+        elif children and name not in nested:
+            unknown.extend(f'{path}.{child}' for child in children)
+        elif children:
+            unknown.extend(unknown_paths(nested[name][0], children, expand, f'{path}.'))
+    return unknown
+
+
+class FlexFieldsMixin:
+    """
+    Campos esparsos (``fields``) e expansão opcional de relações (``expand``).
+
+    Relações listadas em ``expandable_fields`` saem como id, a menos que
+    sejam expandidas; caminhos com ponto valem para os níveis aninhados
+    (``expand=preparer.user``, ``fields=id,vehicle.model``).
+    """
+
+    # nome do campo -> (serializer usado na expansão, kwargs extras)
+    expandable_fields = {}
+    default_expand = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = parse_field_tree(self.default_expand if expand is None else expand)
+        fields = parse_field_tree(fields) if fields else None
+
+        for name, (nested_class, options) in self.expandable_fields.items():
+            if name in expand and name in self.fields:
+                self.fields[name] = nested_class(
+                    read_only=True,
+                    fields=(fields.get(name) or None) if fields else None,
+                    expand=expand[name],
+                    **options
+                )
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        with measure('serialize'):
+            return super().to_representation(instance)
+
+
+class BranchSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = '__all__'
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name')
@@ -82,24 +172,44 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
         return instance
 
-class UserProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    branch = BranchSerializer(read_only=True)
+class UserProfileSerializer(FlexFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'user': (UserSerializer, {}),
+        'branch': (BranchSerializer, {}),
+    }
+    # Em /api/profiles/ o perfil continua saindo completo; aninhado em um
+    # agendamento só expande o que o cliente pedir.
+    default_expand = ('user', 'branch')
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    branch = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = UserProfile
         fields = '__all__'
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(FlexFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Vehicle
         fields = '__all__'
 
-class AppointmentSerializer(serializers.ModelSerializer):
-    vehicle = VehicleSerializer(read_only=True)
-    branch = BranchSerializer(read_only=True)
-    preparer = UserProfileSerializer(read_only=True)
-    created_by = UserProfileSerializer(read_only=True)
+# Campos que mudam o intervalo ocupado pelo agendamento
+SCHEDULING_FIELDS = {'appointment_date', 'time', 'estimated_duration', 'preparer', 'vehicle', 'branch', 'status'}
+
+class AppointmentSerializer(FlexFieldsMixin, serializers.ModelSerializer):
+    # Recusar horários em que o preparador ou o veículo já estão ocupados
+    check_availability = True
+    # Preencher estimated_duration com a estimativa de logistics.durations na criação
+    estimate_duration = True
+    expandable_fields = {
+        'vehicle': (VehicleSerializer, {}),
+        'branch': (BranchSerializer, {}),
+        'preparer': (UserProfileSerializer, {}),
+        'created_by': (UserProfileSerializer, {}),
+    }
+    vehicle = serializers.PrimaryKeyRelatedField(read_only=True)
+    branch = serializers.PrimaryKeyRelatedField(read_only=True)
+    preparer = serializers.PrimaryKeyRelatedField(read_only=True)
+    created_by = serializers.PrimaryKeyRelatedField(read_only=True)
     vehicle_id = serializers.PrimaryKeyRelatedField(
         queryset=Vehicle.objects.all(),
         source='vehicle',
@@ -149,24 +259,15 @@ class AppointmentSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("O horário do agendamento é obrigatório")
         return value
 
-    def validate_delivery_date(self, value):
-        appointment_date = self.initial_data.get('appointment_date')
-        if appointment_date and value and value < appointment_date:
-            raise serializers.ValidationError("A data de entrega não pode ser anterior à data do agendamento")
-        return value
-
     def validate_estimated_duration(self, value):
         if not value:
             return timedelta(hours=1)
         return value
 
     def validate_branch_id(self, value):
+        # O PrimaryKeyRelatedField já carregou a filial (ou recusou um id inexistente)
         if not value:
             raise serializers.ValidationError("A filial é obrigatória")
-        try:
-            Branch.objects.get(id=value)
-        except Branch.DoesNotExist:
-            raise serializers.ValidationError("Filial não encontrada")
         return value
 
     def validate(self, data):
@@ -179,19 +280,147 @@ class AppointmentSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError("O horário do agendamento não pode ser no passado")
             except (ValueError, TypeError) as e:
                 raise serializers.ValidationError(f"Data ou hora inválida: {str(e)}")
+
+        # Comparar as datas já convertidas (initial_data não existe nos itens de many=True)
+        delivery_date = data.get('delivery_date')
+        appointment_date = data.get('appointment_date')
+        if delivery_date and appointment_date and delivery_date < appointment_date:
+            raise serializers.ValidationError(
+                {'delivery_date': "A data de entrega não pode ser anterior à data do agendamento"}
+            )
         
-        # Validar campos obrigatórios
-        required_fields = ['appointment_date', 'time', 'seller', 'client', 'vehicle_id', 'branch_id']
-        for field in required_fields:
-            if field not in data:
+        # Validar campos obrigatórios (vehicle_id/branch_id chegam em data pelo source)
+        required_fields = {
+            'appointment_date': 'appointment_date', 'time': 'time', 'seller': 'seller',
+            'client': 'client', 'vehicle_id': 'vehicle', 'branch_id': 'branch',
+        }
+        for field, source in required_fields.items():
+            if source not in data:
+                if self.partial:
+                    continue
                 raise serializers.ValidationError(f"O campo {field} é obrigatório")
-            if data[field] is None or (isinstance(data[field], str) and not data[field].strip()):
+            if data[source] is None or (isinstance(data[source], str) and not data[source].strip()):
                 raise serializers.ValidationError(f"O campo {field} não pode estar vazio")
+
+        # Sem duração informada, usar a estimativa do histórico (modelo do veículo e preparador)
+        if self.estimate_duration and self.instance is None and 'estimated_duration' not in data:
+            preparer = data.get('preparer')
+            data['estimated_duration'], _ = durations.estimate(data['vehicle'].model, preparer.pk if preparer else None)
+
+        if self.check_availability:
+            self.validate_availability(data)
         
         return data
 
-class DeliverySerializer(serializers.ModelSerializer):
-    appointment = AppointmentSerializer(read_only=True)
+    def booked_slot(self, data):
+        """
+        ``(filial, dia, horário, duração, preparador, veículo)`` que o
+        agendamento passa a ocupar; None se nada muda no horário ocupado.
+        """
+        # Só verifica quando algum campo que define o horário ocupado chegou na requisição
+        if not self.check_availability or (self.instance is not None and not SCHEDULING_FIELDS & set(data)):
+            return None
+
+        def current(name):
+            return data[name] if name in data else getattr(self.instance, name, None)
+
+        if current('status') in availability.FREE_STATUSES:
+            return None
+        preparer = current('preparer')
+        return (
+            current('branch').pk,
+            current('appointment_date'),
+            current('time'),
+            current('estimated_duration'),
+            preparer.pk if preparer else None,
+            current('vehicle').pk,
+        )
+
+    def validate_availability(self, data):
+        slot = self.booked_slot(data)
+        if slot is None:
+            return
+        conflicts = availability.find_conflicts(*slot, exclude=getattr(self.instance, 'pk', None))
+        if conflicts:
+            raise serializers.ValidationError({'time': availability.describe(conflicts)})
+
+    def save_booking(self, save, data):
+        """
+        Grava com ``save()``. Se o horário ocupado muda, a gravação fica numa
+        transação com o veículo e o preparador travados e os conflitos são
+        conferidos de novo no banco: o índice em cache usado na validação não
+        enxerga reservas concorrentes ainda não confirmadas.
+        """
+        slot = self.booked_slot(data)
+        if slot is None:
+            return save()
+        with transaction.atomic():
+            availability.lock_resources([slot[4]], [slot[5]])
+            conflicts = availability.database_conflicts(*slot, exclude=getattr(self.instance, 'pk', None))
+            if conflicts:
+                raise serializers.ValidationError({'time': availability.describe(conflicts)})
+            return save()
+
+    def create(self, validated_data):
+        return self.save_booking(lambda: super(AppointmentSerializer, self).create(validated_data), validated_data)
+
+    def update(self, instance, validated_data):
+        return self.save_booking(
+            lambda: super(AppointmentSerializer, self).update(instance, validated_data), validated_data
+        )
+
+class PrefetchedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolve o id em ``context['related'][model]``, carregado de uma vez para
+    todas as linhas, em vez de uma consulta por valor.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = self.context['related'][self.queryset.model].get(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class AppointmentImportSerializer(AppointmentSerializer):
+    """Linha da importação em lote: mesmas regras, relações pré-carregadas."""
+
+    # Conflitos de horário e estimativas de duração ficam com o importador, com todas as linhas juntas
+    check_availability = False
+    estimate_duration = False
+
+    vehicle_id = PrefetchedRelatedField(queryset=Vehicle.objects.all(), source='vehicle', write_only=True)
+    preparer_id = PrefetchedRelatedField(
+        queryset=UserProfile.objects.all(),
+        source='preparer',
+        write_only=True,
+        required=False,
+        allow_null=True
+    )
+    branch_id = PrefetchedRelatedField(queryset=Branch.objects.all(), source='branch', write_only=True)
+
+    def validate(self, data):
+        data = super().validate(data)
+        user_branch = self.context.get('branch')
+        if user_branch is not None and data['branch'].pk != user_branch.pk:
+            raise serializers.ValidationError({'branch_id': "Agendamento de outra filial"})
+        preparer = data.get('preparer')
+        if preparer is not None and preparer.branch_id != data['branch'].pk:
+            raise serializers.ValidationError({'preparer_id': "O preparador não pertence a esta filial"})
+        return data
+
+class DeliverySerializer(FlexFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'appointment': (AppointmentSerializer, {}),
+    }
+    default_expand = ('appointment',)
+    appointment = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Delivery
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .auth import principal_cache
+from .models import Appointment, Branch, Delivery, Tombstone, UserProfile, Vehicle
+from .search import vehicle_search
+from . import availability, board, durations, events
+
+# Enviado pela importação em lote: bulk_create não dispara post_save
+appointments_imported = Signal()
+# Enviado pela troca de status em lote: QuerySet.update() não dispara post_save
+statuses_changed = Signal()
+# Enviado pela atribuição automática de preparadores, também feita com update()
+preparers_assigned = Signal()
+# Enviado pela importação de veículos (bulk_create com upsert)
+vehicles_imported = Signal()
+
+# Exclusões feitas pelo arquivamento: sem eventos nem lápide por linha (o arquivamento grava as suas em lote)
+_deletions_muted = ContextVar('deletions_muted', default=False)
+
+
+@contextmanager
+def mute_deletions():
+    token = _deletions_muted.set(True)
+    try:
+        yield
+    finally:
+        _deletions_muted.reset(token)
+
+
+def _delivery_branch_id(delivery):
+    # Evitar consulta extra quando o agendamento já veio com select_related
+    if Delivery.appointment.is_cached(delivery):
+        return delivery.appointment.branch_id
+    return (
+        Appointment.objects.filter(pk=delivery.appointment_id)
+        .values_list('branch_id', flat=True)
+        .first()
+    )
+
+
+def _board_keys(instance):
+    """Painéis (filial, dia) em que o agendamento estava e está agora."""
+    current = (instance.branch_id, instance.appointment_date)
+    keys = {current}
+    loaded = getattr(instance, '_loaded_board_key', None)
+    if loaded is not None and None not in loaded:
+        keys.add(loaded)
+    instance._loaded_board_key = current
+    return keys
+
+
+def _left_branch(appointment, old_branch_id):
+    """
+    O agendamento mudou de filial: para a sincronização da filial anterior
+    ele (e sua entrega) deixou de existir, então recebe lápides lá. Lápides
+    de uma saída anterior da nova filial são descartadas, e a entrega ganha
+    um ``updated_at`` novo para entrar na sincronização da nova filial. Os
+    painéis da filial anterior recebem a saída como exclusão.
+    """
+    delivery_ids = list(Delivery.objects.filter(appointment_id=appointment.pk).values_list('pk', flat=True))
+    Tombstone.objects.filter(
+        Q(model='appointment', object_id=appointment.pk) | Q(model='delivery', object_id__in=delivery_ids),
+        branch_id=appointment.branch_id,
+    ).delete()
+    Tombstone.objects.bulk_create([
+        Tombstone(model='appointment', object_id=appointment.pk, branch_id=old_branch_id),
+        *(Tombstone(model='delivery', object_id=pk, branch_id=old_branch_id) for pk in delivery_ids),
+    ])
+    if delivery_ids:
+        Delivery.objects.filter(pk__in=delivery_ids).update(updated_at=timezone.now())
+    events.publish(old_branch_id, 'appointment', 'deleted', {'id': appointment.pk})
+
+
+def _refresh_appointments(changes):
+    board.refresh_appointments(changes)
+    availability.refresh_appointments(changes)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    if instance.status == 'completed' and instance.actual_duration and not instance.duration_sampled:
+        durations.record_completed([instance.pk])
+        instance.duration_sampled = True
+    events.publish_appointment(instance, 'created' if created else 'updated')
+    loaded = getattr(instance, '_loaded_board_key', None)
+    if not created and loaded is not None and loaded[0] not in (None, instance.branch_id):
+        _left_branch(instance, loaded[0])
+    changes = {instance.pk: _board_keys(instance)}
+    transaction.on_commit(lambda: _refresh_appointments(changes))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    if _deletions_muted.get():
+        return
+    Tombstone.objects.create(model='appointment', object_id=instance.pk, branch_id=instance.branch_id)
+    events.publish_appointment(instance, 'deleted')
+    changes = {instance.pk: _board_keys(instance)}
+    transaction.on_commit(lambda: _refresh_appointments(changes))
+
+
+@receiver(appointments_imported, sender=Appointment)
+def appointments_bulk_imported(sender, appointments, **kwargs):
+    counts = {}
+    for appointment in appointments:
+        counts[appointment.branch_id] = counts.get(appointment.branch_id, 0) + 1
+    # Um único evento por filial: os painéis recarregam em vez de receber cada linha
+    for branch_id, count in counts.items():
+        events.publish(branch_id, 'appointment', 'imported', {'count': count})
+    keys = {(appointment.branch_id, appointment.appointment_date) for appointment in appointments}
+    transaction.on_commit(lambda: (board.invalidate(keys), availability.invalidate(keys)))
+
+
+@receiver(statuses_changed)
+def bulk_statuses_changed(sender, model, changes, status, **kwargs):
+    ids_by_branch = {}
+    for pk, branch_id in changes:
+        ids_by_branch.setdefault(branch_id, []).append(pk)
+    for branch_id, ids in ids_by_branch.items():
+        events.publish(branch_id, model, 'bulk_updated', {'ids': ids, 'status': status})
+    if model == 'appointment':
+        ids = [pk for pk, _ in changes]
+        if status == 'completed':
+            durations.record_completed(ids)
+        transaction.on_commit(lambda: (board.refresh_appointment_ids(ids), availability.refresh_appointment_ids(ids)))
+
+
+@receiver(preparers_assigned)
+def bulk_preparers_assigned(sender, branch_id, assignments, **kwargs):
+    events.publish(branch_id, 'appointment', 'assigned', {
+        'assignments': [{'id': pk, 'preparer': preparer_id} for pk, preparer_id in assignments],
+    })
+    ids = [pk for pk, _ in assignments]
+    transaction.on_commit(lambda: (board.refresh_appointment_ids(ids), availability.refresh_appointment_ids(ids)))
+
+
+@receiver(post_save, sender=Delivery)
+def delivery_saved(sender, instance, created, **kwargs):
+    events.publish_delivery(instance, _delivery_branch_id(instance), 'created' if created else 'updated')
+
+
+@receiver(post_delete, sender=Delivery)
+def delivery_deleted(sender, instance, **kwargs):
+    if _deletions_muted.get():
+        return
+    branch_id = _delivery_branch_id(instance)
+    if branch_id is not None:
+        Tombstone.objects.create(model='delivery', object_id=instance.pk, branch_id=branch_id)
+    events.publish_delivery(instance, branch_id, 'deleted')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    principal_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    principal_cache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def branch_changed(sender, instance, **kwargs):
+    # Alterações de filial são raras: descartar o cache inteiro
+    principal_cache.invalidate()
+
+
+# Índice de busca só depois do commit: um rollback não pode deixar o índice
+# com veículos que nunca existiram no banco
+@receiver(post_save, sender=Vehicle)
+def vehicle_saved(sender, instance, **kwargs):
+    row = (instance.pk, instance.model, instance.color, instance.chassi)
+    transaction.on_commit(lambda: vehicle_search.update([row]))
+
+
+@receiver(post_delete, sender=Vehicle)
+def vehicle_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: vehicle_search.remove(pk))
+
+
+@receiver(vehicles_imported, sender=Vehicle)
+def vehicles_bulk_imported(sender, chassis, **kwargs):
+    transaction.on_commit(lambda: vehicle_search.refresh_chassis(chassis))
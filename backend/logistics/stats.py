@@ -0,0 +1,52 @@
+from django.db.models import Count, Sum
+
+# Agrupamentos: nome na resposta -> (coluna do GROUP BY, coluna com o rótulo)
+GROUPINGS = {
+    'by_status': ('status', None),
+    'by_priority': ('priority', None),
+    'by_preparer': ('preparer', 'preparer__user__username'),
+    'by_day': ('appointment_date', None),
+}
+
+
+def _seconds(value):
+    return int(value.total_seconds()) if value is not None else 0
+
+
+def _row(key, row, label_column):
+    data = {
+        'key': key.isoformat() if hasattr(key, 'isoformat') else key,
+        'count': row['count'],
+        'estimated_seconds': _seconds(row['estimated']),
+        'actual_seconds': _seconds(row['actual']),
+    }
+    if label_column:
+        data['label'] = row[label_column]
+    return data
+
+
+def appointment_stats(queryset):
+    """
+    Contagens e somas de duração por status, prioridade, preparador e dia.
+
+    Cada agrupamento é um único ``GROUP BY`` no banco sobre o queryset já
+    filtrado por filial e período; o total sai da soma dos status, sem
+    consulta extra.
+    """
+    queryset = queryset.select_related(None).order_by()
+    result = {}
+    for name, (column, label_column) in GROUPINGS.items():
+        columns = (column, label_column) if label_column else (column,)
+        rows = (
+            queryset.values(*columns)
+            .annotate(count=Count('pk'), estimated=Sum('estimated_duration'), actual=Sum('actual_duration'))
+            .order_by(column)
+        )
+        result[name] = [_row(row[column], row, label_column) for row in rows]
+
+    result['total'] = {
+        'count': sum(row['count'] for row in result['by_status']),
+        'estimated_seconds': sum(row['estimated_seconds'] for row in result['by_status']),
+        'actual_seconds': sum(row['actual_seconds'] for row in result['by_status']),
+    }
+    return result
@@ -0,0 +1,2004 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import time, timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from config.asgi import application
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .archive import archive, horizon
+from .availability import DAY_SECONDS, DayIndex
+from .auth import PrincipalCache, principal_cache
+from . import board, durations, exports
+from .board import build_snapshot, get_or_build, snapshot_key
+from .cache_backends import FileBasedCache
+from .channel_layers import SQLiteChannelLayer
+from .dataset import DatasetGenerator
+from .durations import quantile, rebuild, record_samples
+from .exports import APPOINTMENT_COLUMNS, stream
+from .importers import VehicleImporter
+from .mixins import encode_sync_cursor
+from .search import vehicle_search
+from .models import (
+    Branch, UserProfile, Vehicle, Appointment, ArchivedAppointment, ArchivedDelivery, Delivery, DurationStat, Tombstone,
+)
+from .urls import router
+from .management.commands import check_query_plans
+from .views import AppointmentViewSet, VehicleViewSet
+
+# Orçamento de cada endpoint com a massa de dados de ``seed_branch``.
+#   route:   nome da rota no router (``basename-ação``)
+#   method:  método HTTP
+#   as_user: 'supervisor', 'preparer', 'superuser' ou None (anônimo)
+#   kwargs:  função(fixtures) -> kwargs da URL
+#   data:    função(fixtures) -> query params (GET) ou corpo JSON
+#   queries: máximo de consultas SQL da requisição inteira, com o usuário já no cache de autenticação
+#   size:    máximo de bytes do corpo da resposta
+Budget = namedtuple('Budget', 'route method as_user kwargs data queries size')
+
+
+def _none(fixtures):
+    return {}
+
+
+def _appointment(fixtures):
+    return {'pk': fixtures['appointment'].pk}
+
+
+def _vehicle_rows(fixtures):
+    # Um chassi novo e um existente: um lote com upsert
+    return [
+        {'model': 'Fiat Argo', 'color': '#00FF00', 'chassi': 'NEW0001'},
+        {'model': fixtures['vehicle'].model, 'color': '#000000', 'chassi': fixtures['vehicle'].chassi},
+    ]
+
+
+def _new_appointment(fixtures):
+    return {
+        'appointment_date': (timezone.localdate() + timedelta(days=2)).isoformat(),
+        # Depois do último agendamento de seed_branch: sem conflito de horário
+        'time': '18:30',
+        'seller': 'Vendedor',
+        'client': 'Cliente Novo',
+        'vehicle_id': fixtures['vehicle'].pk,
+        'branch_id': fixtures['branch'].pk,
+        'preparer_id': fixtures['preparer'].pk,
+    }
+
+
+def _import_rows(fixtures):
+    # Meia hora cada, em sequência, num dia sem agendamentos
+    day = (timezone.localdate() + timedelta(days=6)).isoformat()
+    return [
+        {
+            **_new_appointment(fixtures),
+            'client': f'Cliente Importado {number}',
+            'appointment_date': day,
+            'time': f'{7 + number // 2:02d}:{number % 2 * 30:02d}',
+            'estimated_duration': '00:30:00',
+        }
+        for number in range(20)
+    ]
+
+
+ENDPOINT_BUDGETS = [
+    Budget('branch-list', 'get', 'supervisor', _none, _none, 2, 400),
+    Budget('branch-detail', 'get', 'supervisor', lambda f: {'pk': f['branch'].pk}, _none, 2, 200),
+    Budget('user-list', 'get', 'supervisor', _none, _none, 1, 800),
+    Budget('user-detail', 'get', 'supervisor', lambda f: {'pk': f['preparer'].user_id}, _none, 1, 200),
+    Budget('userprofile-list', 'get', 'supervisor', _none, _none, 1, 2_800),
+    Budget('userprofile-list', 'get', 'supervisor', _none, lambda f: {'is_preparer': 'true'}, 1, 1_900),
+    Budget('userprofile-detail', 'get', 'supervisor', lambda f: {'pk': f['preparer'].pk}, _none, 1, 500),
+    Budget('vehicle-list', 'get', 'supervisor', _none, _none, 2, 5_400),
+    Budget('vehicle-detail', 'get', 'supervisor', lambda f: {'pk': f['vehicle'].pk}, _none, 2, 200),
+    # Índice em memória: só a carga na primeira busca do processo consulta o banco
+    Budget('vehicle-search', 'get', 'supervisor', _none, lambda f: {'q': 'mod'}, 1, 1_000),
+    # +1 para atualizar o índice de busca com os chassis importados
+    Budget('vehicle-bulk-import', 'post', 'supervisor', _none, _vehicle_rows, 5, 200),
+    # Chassi único: o serializer confere a duplicidade antes do INSERT
+    Budget('vehicle-list', 'post', 'supervisor', _none,
+           lambda f: {'model': 'Fiat Argo', 'color': '#00FF00', 'chassi': 'ZZZ0001'}, 2, 200),
+    # Listagem e exportação: +1 para o dia arquivado mais recente, que decide se o arquivo entra
+    Budget('appointment-list', 'get', 'supervisor', _none, _none, 3, 22_000),
+    Budget('appointment-list', 'get', 'supervisor', _none,
+           lambda f: {'expand': 'vehicle,branch,preparer.user,created_by.user'}, 3, 57_000),
+    Budget('appointment-list', 'get', 'supervisor', _none,
+           lambda f: {'fields': 'id,time,vehicle.model,preparer.user.username', 'expand': 'vehicle,preparer.user'}, 3, 4_500),
+    Budget('appointment-list', 'get', 'superuser', _none, _none, 3, 44_000),
+    Budget('appointment-sync', 'get', 'supervisor', _none, _none, 3, 22_000),
+    Budget('appointment-detail', 'get', 'supervisor', _appointment, _none, 2, 600),
+    # +1 para reconferir o horário no banco dentro da transação (+2 do SAVEPOINT dela nos testes);
+    # com FOR UPDATE (MySQL) mais +2 para travar veículo e preparador
+    Budget('appointment-list', 'post', 'supervisor', _none, _new_appointment, 9, 600),
+    Budget('appointment-detail', 'patch', 'supervisor', _appointment, lambda f: {'notes': 'Lavar motor'}, 2, 600),
+    Budget('appointment-update-status', 'post', 'supervisor', _appointment, lambda f: {'status': 'in_progress'}, 2, 600),
+    Budget('appointment-update-duration', 'post', 'supervisor', _appointment,
+           lambda f: {'actual_duration': '01:10:00'}, 2, 600),
+    # +1 para reconferir os horários no banco na transação da gravação (+2 com FOR UPDATE)
+    Budget('appointment-bulk-import', 'post', 'supervisor', _none, _import_rows, 8, 100),
+    Budget('appointment-bulk-status', 'post', 'supervisor', _none,
+           lambda f: {'ids': [a.pk for a in f['scheduled']], 'status': 'cancelled'}, 5, 5_500),
+    Budget('appointment-availability', 'get', 'supervisor', _none,
+           lambda f: {'date': (timezone.localdate() + timedelta(days=1)).isoformat(), 'vehicle': f['vehicle'].pk}, 2, 1_000),
+    Budget('appointment-auto-assign', 'post', 'supervisor', _none,
+           lambda f: {'date': (timezone.localdate() + timedelta(days=1)).isoformat()}, 7, 1_000),
+    # No SQLite (sem SKIP LOCKED) a posse vem de um UPDATE condicional a mais
+    Budget('appointment-claim-next', 'post', 'preparer', _none,
+           lambda f: {'date': (timezone.localdate() + timedelta(days=1)).isoformat()}, 5, 600),
+    Budget('appointment-duration-estimate', 'get', 'supervisor', _none,
+           lambda f: {'vehicle': f['vehicle'].pk, 'preparer': f['preparer'].pk}, 2, 100),
+    Budget('appointment-board', 'get', 'supervisor', _none,
+           lambda f: {'date': (timezone.localdate() + timedelta(days=1)).isoformat()}, 1, 5_000),
+    Budget('appointment-stats', 'get', 'supervisor', _none, lambda f: {
+        'start_date': timezone.localdate().isoformat(),
+        'end_date': (timezone.localdate() + timedelta(days=7)).isoformat(),
+    }, 4, 1_500),
+    # Exportação: uma consulta por página de EXPORT_CHUNK_SIZE linhas e uma última vazia, mais o limite do arquivo
+    Budget('appointment-export', 'get', 'superuser', _none, _none, 3, 30_000),
+    Budget('appointment-export', 'get', 'supervisor', _none, lambda f: {'output': 'ndjson', 'gzip': '1'}, 3, 4_000),
+    Budget('delivery-list', 'get', 'supervisor', _none, _none, 2, 15_000),
+    Budget('delivery-list', 'get', 'supervisor', _none, lambda f: {'status': 'pending'}, 2, 15_000),
+    Budget('delivery-sync', 'get', 'supervisor', _none, _none, 3, 15_000),
+    Budget('delivery-detail', 'get', 'supervisor', lambda f: {'pk': f['delivery'].pk}, _none, 2, 800),
+    Budget('delivery-detail', 'patch', 'supervisor', lambda f: {'pk': f['delivery'].pk},
+           lambda f: {'status': 'delivered'}, 2, 800),
+    Budget('delivery-export', 'get', 'supervisor', _none, _none, 3, 6_000),
+    Budget('delivery-bulk-status', 'post', 'supervisor', _none,
+           lambda f: {'ids': [d.pk for d in f['pending']], 'status': 'delivered'}, 5, 7_500),
+    Budget('appointment-detail', 'delete', 'supervisor', lambda f: {'pk': f['deletable'].pk}, _none, 7, 0),
+    Budget('auth-login', 'post', None, _none,
+           lambda f: {'email': 'supervisor0@example.com', 'password': 'senha123', 'branch': f['branch'].pk}, 4, 1_400),
+    Budget('auth-me', 'get', 'supervisor', _none, _none, 0, 250),
+    Budget('auth-refresh', 'post', None, _none, lambda f: {'refresh': f['refresh']}, 0, 900),
+    Budget('auth-logout', 'post', None, _none, _none, 0, 100),
+]
+
+# Painéis em memória nos testes, isolados entre execuções
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'board': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-board'},
+}
+
+# Rotas sem orçamento próprio (apenas navegação do DRF)
+UNBUDGETED_ROUTES = {'api-root'}
+
+
+def seed_branch(index, vehicles, appointments_per_branch=40, preparers=4):
+    """Filial com supervisor, preparadores, agendamentos e entregas."""
+    branch = Branch.objects.create(name=f'Filial {index}', cnpj=f'{index:014d}')
+    supervisor_user = User.objects.create_user(
+        username=f'supervisor{index}', email=f'supervisor{index}@example.com', password='senha123',
+        first_name='Supervisor', last_name=str(index),
+    )
+    supervisor = UserProfile.objects.create(
+        user=supervisor_user, branch=branch, employee_id=f'SUP{index:03d}', is_supervisor=True
+    )
+    profiles = []
+    for number in range(preparers):
+        user = User.objects.create_user(
+            username=f'preparador{index}_{number}', email=f'preparador{index}_{number}@example.com',
+            password='senha123', first_name='Preparador', last_name=str(number),
+        )
+        profiles.append(UserProfile.objects.create(user=user, branch=branch, employee_id=f'PREP{index}{number:02d}'))
+
+    start = timezone.localdate() + timedelta(days=1)
+    priorities = [choice for choice, _ in Appointment.PRIORITY_CHOICES]
+    created = []
+    for number in range(appointments_per_branch):
+        appointment = Appointment.objects.create(
+            appointment_date=start + timedelta(days=number // 10),
+            time=time(8 + number % 10, 0),
+            seller=f'Vendedor {number % 5}',
+            client=f'Cliente {index}-{number}',
+            client_phone='11999990000',
+            vehicle=vehicles[number % len(vehicles)],
+            branch=branch,
+            preparer=profiles[number % preparers] if number % 4 else None,
+            priority=priorities[number % len(priorities)],
+            notes='Lavagem completa' if number % 3 else '',
+            created_by=supervisor,
+        )
+        if number % 2:
+            Delivery.objects.create(appointment=appointment)
+        created.append(appointment)
+    return branch, supervisor, profiles, created
+
+
+class BranchEventsConsumerTests(TestCase):
+    """WebSocket dos painéis: autenticação por filial e eventos após o commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=2)
+        cls.other_branch, _, _, _ = seed_branch(1, vehicles, appointments_per_branch=0)
+        cls.vehicle = vehicles[0]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        layers = {'default': {
+            'BACKEND': 'logistics.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {'path': os.path.join(directory.name, 'channels.sqlite3'), 'poll_interval': 0.01},
+        }}
+        settings = self.settings(CHANNEL_LAYERS=layers)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(lambda: async_to_sync(get_channel_layer().close)())
+
+    def communicator(self, branch_id, user=None):
+        path = f'/ws/branches/{branch_id}/'
+        if user is not None:
+            path += f'?token={RefreshToken.for_user(user).access_token}'
+        return WebsocketCommunicator(application, path, headers=[(b'host', b'localhost'), (b'origin', b'http://localhost')])
+
+    def test_rejects_anonymous_and_other_branches(self):
+        async def scenario():
+            results = []
+            for communicator in (
+                self.communicator(self.branch.pk),
+                self.communicator(self.other_branch.pk, self.supervisor.user),
+            ):
+                results.append(await communicator.connect())
+                await communicator.disconnect()
+            return results
+
+        self.assertEqual(async_to_sync(scenario)(), [(False, 4401), (False, 4403)])
+
+    def test_broadcasts_changes_after_commit(self):
+        @database_sync_to_async
+        def change():
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment = Appointment.objects.create(
+                    appointment_date=timezone.localdate() + timedelta(days=3), time=time(9, 0),
+                    seller='Vendedor', client='Cliente', vehicle=self.vehicle, branch=self.branch,
+                    created_by=self.supervisor,
+                )
+            pk = appointment.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.delete()
+            return pk
+
+        async def scenario():
+            communicator = self.communicator(self.branch.pk, self.supervisor.user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            pk = await change()
+            created = await communicator.receive_json_from(timeout=2)
+            deleted = await communicator.receive_json_from(timeout=2)
+            await communicator.send_json_to({'type': 'ping'})
+            pong = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return pk, created, deleted, pong
+
+        pk, created, deleted, pong = async_to_sync(scenario)()
+        self.assertEqual((created['model'], created['action']), ('appointment', 'created'))
+        self.assertEqual(created['data']['id'], pk)
+        # Só os campos compactos do evento, nunca o objeto serializado
+        self.assertNotIn('client', created['data'])
+        self.assertEqual(deleted, {'model': 'appointment', 'action': 'deleted', 'data': {'id': pk}})
+        self.assertEqual(pong, {'type': 'pong'})
+
+
+class SQLiteChannelLayerTests(SimpleTestCase):
+    """Channel layer em SQLite compartilhado entre instâncias (workers)."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'channels.sqlite3')
+
+    def layer(self, **options):
+        layer = SQLiteChannelLayer(path=self.path, poll_interval=0.01, max_poll_interval=0.05, **options)
+        self.addCleanup(async_to_sync(layer.close))
+        return layer
+
+    def test_send_and_receive_across_instances(self):
+        sender, receiver = self.layer(), self.layer()
+
+        async def scenario():
+            channel = await receiver.new_channel()
+            await sender.send(channel, {'type': 'board.update', 'id': 1})
+            await sender.send(channel, {'type': 'board.update', 'id': 2})
+            first = await asyncio.wait_for(receiver.receive(channel), 2)
+            second = await asyncio.wait_for(receiver.receive(channel), 2)
+            return [first['id'], second['id']]
+
+        self.assertEqual(asyncio.run(scenario()), [1, 2])
+        self.assertEqual(sender.stats()['queued'], 0)
+        self.assertEqual(sender.stats()['counters'], {'sent': 2, 'received': 2})
+
+    def test_groups(self):
+        first, second = self.layer(), self.layer()
+
+        async def scenario():
+            one, two = await first.new_channel(), await second.new_channel()
+            await first.group_add('branch_1', one)
+            await second.group_add('branch_1', two)
+            await first.group_send('branch_1', {'type': 'board.update', 'id': 1})
+            received = [
+                (await asyncio.wait_for(first.receive(one), 2))['id'],
+                (await asyncio.wait_for(second.receive(two), 2))['id'],
+            ]
+
+            await second.group_discard('branch_1', two)
+            await second.group_send('branch_1', {'type': 'board.update', 'id': 2})
+            received.append((await asyncio.wait_for(first.receive(one), 2))['id'])
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(second.receive(two), 0.2)
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), [1, 1, 2])
+        self.assertEqual(first.stats()['groups'], {'branch_1': 1})
+
+    def test_expired_messages_are_dropped_and_cleaned_up(self):
+        layer = self.layer(expiry=0.05, cleanup_interval=0)
+
+        async def scenario():
+            stale, live = await layer.new_channel(), await layer.new_channel()
+            await layer.group_add('branch_1', stale)
+            await layer.group_add('branch_1', live)
+            await layer.send(stale, {'type': 'board.update'})
+            await asyncio.sleep(0.1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(layer.receive(stale), 0.2)
+
+        asyncio.run(scenario())
+        stats = layer.stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['counters']['expired'], 1)
+        # O canal que deixou mensagem expirar saiu do grupo
+        self.assertEqual(stats['groups'], {'branch_1': 1})
+
+    def test_capacity(self):
+        layer = self.layer(capacity=1)
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'board.update'})
+            with self.assertRaises(ChannelFull):
+                await layer.send(channel, {'type': 'board.update'})
+
+        asyncio.run(scenario())
+        self.assertEqual(layer.stats()['counters']['dropped_full'], 1)
+
+    def test_idle_poll_does_not_take_the_write_lock(self):
+        layer = self.layer()
+        writer = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(writer.close)
+        layer.stats()
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            # Com outra conexão segurando a escrita, a leitura sem mensagens não espera por ela
+            started = timezone.now()
+            self.assertEqual(layer._receive_batch(['specific.sqlite!idle']), [])
+            self.assertLess((timezone.now() - started).total_seconds(), 1)
+        finally:
+            writer.execute('ROLLBACK')
+
+    def test_cancelled_receive_keeps_message(self):
+        layer = self.layer()
+        read = threading.Event()
+        resume = threading.Event()
+        original = layer._receive_batch
+
+        def slow_batch(channels):
+            rows = original(channels)
+            if rows and not read.is_set():
+                # Mensagem já retirada do banco; o receive() é cancelado antes da entrega
+                read.set()
+                resume.wait(2)
+            return rows
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'board.update', 'id': 1})
+            waiting = asyncio.ensure_future(layer.receive(channel))
+            loop = asyncio.get_running_loop()
+            self.assertTrue(await loop.run_in_executor(None, read.wait, 2))
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            resume.set()
+            for _ in range(100):
+                if (await loop.run_in_executor(None, layer.stats))['queued']:
+                    break
+                await asyncio.sleep(0.01)
+            return await asyncio.wait_for(layer.receive(channel), 2)
+
+        with mock.patch.object(layer, '_receive_batch', slow_batch):
+            self.assertEqual(asyncio.run(scenario())['id'], 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalResponseTests(TestCase):
+    """ETag/Last-Modified: 304 enquanto nada muda, 200 depois de uma alteração."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, cls.appointments = seed_branch(0, cls.vehicles, appointments_per_branch=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_list_etag(self):
+        url = reverse('appointment-list')
+        first = self.client.get(url)
+        etag = first['ETag']
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+
+        unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(unchanged.content, b'')
+
+        # Alteração numa relação aninhada também muda o ETag
+        Vehicle.objects.filter(pk=self.vehicles[0].pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        # Exclusão não avança nenhum updated_at, só a contagem
+        self.appointments[0].delete()
+        deleted = self.client.get(url, HTTP_IF_NONE_MATCH=changed['ETag'])
+        self.assertEqual(deleted.status_code, 200)
+        self.assertEqual(len(deleted.data['results']), 4)
+
+    def test_detail_last_modified(self):
+        appointment = self.appointments[1]
+        # Last-Modified tem resolução de segundos e cobre as relações: a versão anterior fica bem no passado
+        past = timezone.now() - timedelta(minutes=1)
+        for model in (Appointment, Vehicle, Branch, UserProfile):
+            model.objects.update(updated_at=past)
+        url = reverse('appointment-detail', kwargs={'pk': appointment.pk})
+        last_modified = self.client.get(url)['Last-Modified']
+
+        unchanged = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(unchanged.status_code, 304)
+
+        self.client.patch(url, {'notes': 'Lavar motor'}, format='json')
+        changed = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['notes'], 'Lavar motor')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DeltaSyncTests(TestCase):
+    """``sync?since=``: só o que mudou desde o cursor, exclusões por lápides."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=5)
+        cls.other_branch, cls.other_supervisor, _, cls.other_appointments = seed_branch(1, vehicles, appointments_per_branch=2)
+        cls.superuser = User.objects.create_superuser(username='admin', email='admin@example.com', password='senha123')
+
+    def setUp(self):
+        self.client = self.client_for(self.supervisor.user)
+        # Fora da janela de reenvio (sync_overlap): cada rodada só traz o que mudou nela
+        past = timezone.now() - timedelta(minutes=1)
+        Appointment.objects.update(updated_at=past)
+        Delivery.objects.update(updated_at=past)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def sync(self, cursor=None, route='appointment-sync', client=None):
+        response = (client or self.client).get(reverse(route), {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_round_trip(self):
+        initial = self.sync()
+        self.assertEqual({row['id'] for row in initial['results']}, {a.pk for a in self.appointments})
+        self.assertEqual(initial['deleted'], [])
+        self.assertFalse(initial['has_more'])
+
+        nothing = self.sync(initial['cursor'])
+        self.assertEqual((nothing['results'], nothing['deleted']), ([], []))
+
+        changed, removed = self.appointments[0], self.appointments[1]
+        self.client.patch(reverse('appointment-detail', kwargs={'pk': changed.pk}), {'notes': 'Lavar motor'}, format='json')
+        self.client.delete(reverse('appointment-detail', kwargs={'pk': removed.pk}))
+        # Exclusão em outra filial não aparece para este cliente
+        self.other_appointments[0].delete()
+
+        delta = self.sync(nothing['cursor'])
+        self.assertEqual([row['id'] for row in delta['results']], [changed.pk])
+        self.assertEqual(delta['deleted'], [removed.pk])
+        # Dentro da janela de reenvio a lápide volta; depois dela o cursor a ultrapassa
+        self.assertEqual(self.sync(delta['cursor'])['deleted'], [removed.pk])
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(minutes=1))
+        settled = self.sync(delta['cursor'])
+        self.assertEqual(settled['deleted'], [removed.pk])
+        self.assertEqual(self.sync(settled['cursor'])['deleted'], [])
+
+    def test_branch_change_leaves_the_old_branch(self):
+        moved = self.appointments[1]
+        delivery = moved.delivery
+        other_client, admin = self.client_for(self.other_supervisor.user), self.client_for(self.superuser)
+        cursors = {
+            (name, route): self.sync(route=route, client=client)['cursor']
+            for name, client in (('old', self.client), ('new', other_client), ('admin', admin))
+            for route in ('appointment-sync', 'delivery-sync')
+        }
+
+        moved.branch = self.other_branch
+        moved.save()
+        left = self.sync(cursors['old', 'appointment-sync'])
+        self.assertEqual((left['results'], left['deleted']), ([], [moved.pk]))
+        self.assertEqual(self.sync(cursors['old', 'delivery-sync'], 'delivery-sync')['deleted'], [delivery.pk])
+        arrived = self.sync(cursors['new', 'delivery-sync'], 'delivery-sync', other_client)
+        self.assertEqual([row['id'] for row in arrived['results']], [delivery.pk])
+        self.assertEqual(self.sync(cursors['new', 'appointment-sync'], client=other_client)['deleted'], [])
+        # Para o superusuário nada saiu do escopo
+        self.assertEqual(self.sync(cursors['admin', 'appointment-sync'], client=admin)['deleted'], [])
+        self.assertEqual(self.sync(cursors['admin', 'delivery-sync'], 'delivery-sync', admin)['deleted'], [])
+
+        # De volta: quem ainda não viu a saída recebe só a linha, sem a lápide
+        moved.branch = self.branch
+        moved.save()
+        back = self.sync(cursors['old', 'appointment-sync'])
+        self.assertEqual(([row['id'] for row in back['results']], back['deleted']), ([moved.pk], []))
+        self.assertEqual(self.sync(cursors['new', 'appointment-sync'], client=other_client)['deleted'], [moved.pk])
+
+    def test_late_committed_tombstone_is_not_skipped(self):
+        initial = self.sync()
+        late_pk, early_pk = self.appointments[0].pk, self.appointments[1].pk
+        for pk in (late_pk, early_pk):
+            Appointment.objects.get(pk=pk).delete()
+        # No MySQL o id é reservado no INSERT: a lápide de id menor ainda não
+        # confirmou quando a de id maior já é visível
+        late_tombstone = Tombstone.objects.get(model='appointment', object_id=late_pk)
+        Tombstone.objects.filter(pk=late_tombstone.pk).delete()
+        delta = self.sync(initial['cursor'])
+        self.assertEqual(delta['deleted'], [early_pk])
+
+        Tombstone.objects.bulk_create([late_tombstone])
+        self.assertEqual(self.sync(delta['cursor'])['deleted'], [late_pk, early_pk])
+        # A carga inicial também não passa por cima das lápides recentes
+        self.assertEqual(self.sync()['deleted'], [late_pk, early_pk])
+
+    def test_pages_until_has_more_is_false(self):
+        seen, cursor = [], None
+        with mock.patch.object(AppointmentViewSet, 'sync_page_size', 2):
+            for _ in range(5):
+                page = self.sync(cursor)
+                seen.extend(row['id'] for row in page['results'])
+                cursor = page['cursor']
+                if not page['has_more']:
+                    break
+        self.assertFalse(page['has_more'])
+        self.assertEqual(sorted(seen), sorted(a.pk for a in self.appointments))
+
+    def test_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('appointment-sync'), {'since': 'nao-e-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    """Paginação por cursor em ``(appointment_date, time, id)``."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, appointments = seed_branch(0, vehicles, appointments_per_branch=5)
+        # Vários agendamentos no mesmo dia e horário: só o id desempata
+        first = appointments[0]
+        for number in range(4):
+            Appointment.objects.create(
+                appointment_date=first.appointment_date, time=first.time, seller='Vendedor',
+                client=f'Empate {number}', vehicle=vehicles[0], branch=cls.branch, created_by=cls.supervisor,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_next_and_previous_links(self):
+        expected = list(
+            Appointment.objects.filter(branch=self.branch)
+            .order_by('appointment_date', 'time', 'pk').values_list('pk', flat=True)
+        )
+        first_url = f"{reverse('appointment-list')}?page_size=2"
+        forward = self.walk(first_url, 'next')
+        self.assertEqual([pk for page in forward for pk in page], expected)
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 2, 1])
+
+        first = self.client.get(first_url).data
+        self.assertIsNone(first['previous'])
+        # Voltando da última página, as mesmas páginas na ordem inversa
+        last_url = first_url
+        for _ in forward[1:]:
+            last_url = self.client.get(last_url).data['next']
+        last = self.client.get(last_url).data
+        self.assertIsNone(last['next'])
+        backward = self.walk(last['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('appointment-list'), {'cursor': 'nao-e-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanCheckTests(TestCase):
+    """``check_query_plans``: falha quando uma consulta canônica varre a tabela inteira."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        seed_branch(0, vehicles, appointments_per_branch=5)
+
+    def test_canonical_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FULL SCAN', out.getvalue())
+
+    def test_full_scan_fails_the_command(self):
+        # Listagem de veículos sem filtro: sempre lê a tabela inteira
+        queries = [*check_query_plans.CANONICAL_QUERIES, ('veículos: todos', VehicleViewSet, {}, False)]
+        out = io.StringIO()
+        with mock.patch.object(check_query_plans, 'CANONICAL_QUERIES', queries):
+            with self.assertRaises(CommandError) as raised:
+                call_command('check_query_plans', stdout=out)
+        self.assertEqual(raised.exception.returncode, 1)
+        self.assertIn('FULL SCAN  veículos: todos: logistics_vehicle', out.getvalue())
+        self.assertIn('OK         appointments: filial', out.getvalue())
+
+
+class FlexFieldsTests(TestCase):
+    """``?fields=`` e ``?expand=``: forma da resposta e nomes desconhecidos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_relations_are_ids_unless_expanded(self):
+        row = self.client.get(reverse('appointment-list')).data['results'][1]
+        self.assertEqual(row['vehicle'], self.appointments[1].vehicle_id)
+        self.assertEqual(row['preparer'], self.appointments[1].preparer_id)
+
+        row = self.client.get(reverse('appointment-list'), {'expand': 'vehicle,preparer.user'}).data['results'][1]
+        self.assertEqual(row['vehicle']['chassi'], 'CHS0001')
+        self.assertEqual(row['preparer']['user']['username'], 'preparador0_1')
+        self.assertIsInstance(row['branch'], int)
+
+    def test_sparse_fields(self):
+        params = {'fields': 'id,time,vehicle.model,preparer.user.username', 'expand': 'vehicle,preparer.user'}
+        rows = self.client.get(reverse('appointment-list'), params).data['results']
+        self.assertEqual(set(rows[1]), {'id', 'time', 'vehicle', 'preparer'})
+        self.assertEqual(rows[1]['vehicle'], {'model': 'Modelo'})
+        self.assertEqual(rows[1]['preparer'], {'user': {'username': 'preparador0_1'}})
+
+        detail = reverse('appointment-detail', kwargs={'pk': self.appointments[0].pk})
+        self.assertEqual(set(self.client.get(detail, {'fields': 'id,status'}).data), {'id', 'status'})
+
+    def test_rejects_unknown_names(self):
+        url = reverse('appointment-list')
+        for params, param, unknown in (
+            ({'fields': 'id,bogus'}, 'fields', 'bogus'),
+            ({'fields': 'notes.length'}, 'fields', 'notes.length'),
+            ({'fields': 'id,vehicle.owner', 'expand': 'vehicle'}, 'fields', 'vehicle.owner'),
+            ({'expand': 'vehicle,client'}, 'expand', 'client'),
+            ({'expand': 'preparer.manager'}, 'expand', 'preparer.manager'),
+        ):
+            with self.subTest(params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(unknown, str(response.data[param]))
+        response = self.client.get(reverse('userprofile-list'), {'expand': 'vehicle'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EndpointBudgetTests(TestCase):
+    """Limites de consultas SQL e de tamanho de resposta por endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [
+            Vehicle.objects.create(model=f'Modelo {number % 6}', color='#FFFFFF', chassi=f'CHS{number:04d}')
+            for number in range(30)
+        ]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles)
+        seed_branch(1, vehicles)
+        cls.superuser = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='senha123'
+        )
+        UserProfile.objects.create(user=cls.superuser, branch=cls.branch, employee_id='ADM001', is_supervisor=True)
+        cls.vehicle = vehicles[0]
+
+    def budget_fixtures(self):
+        return {
+            'branch': self.branch,
+            'vehicle': self.vehicle,
+            'preparer': self.preparers[0],
+            'appointment': self.appointments[5],
+            'deletable': self.appointments[7],
+            'delivery': Delivery.objects.filter(appointment__branch=self.branch).order_by('pk').first(),
+            'scheduled': self.appointments[10:20],
+            'pending': list(Delivery.objects.filter(appointment__branch=self.branch).order_by('pk')[5:15]),
+            'refresh': str(RefreshToken.for_user(self.supervisor.user)),
+        }
+
+    def client_for(self, as_user):
+        client = APIClient()
+        users = {'supervisor': self.supervisor.user, 'preparer': self.preparers[1].user, 'superuser': self.superuser}
+        if as_user is not None:
+            token = RefreshToken.for_user(users[as_user]).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_every_route_has_a_budget(self):
+        budgeted = {budget.route for budget in ENDPOINT_BUDGETS}
+        routes = {url.name for url in router.urls} - UNBUDGETED_ROUTES
+        self.assertEqual(routes - budgeted, set(), 'Rotas sem orçamento em ENDPOINT_BUDGETS')
+
+    def test_endpoint_budgets(self):
+        fixtures = self.budget_fixtures()
+        for as_user in ('supervisor', 'preparer', 'superuser'):
+            self.client_for(as_user).get(reverse('auth-me'))
+        for budget in ENDPOINT_BUDGETS:
+            url = reverse(budget.route, kwargs=budget.kwargs(fixtures))
+            label = f'{budget.method.upper()} {url} ({budget.as_user or "anônimo"})'
+            with self.subTest(label):
+                client = self.client_for(budget.as_user)
+                data = budget.data(fixtures)
+                options = {} if budget.method == 'get' else {'format': 'json'}
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(client, budget.method)(url, data, **options)
+                    # Respostas em streaming só consultam o banco enquanto são lidas
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+
+                self.assertLess(response.status_code, 400, f'{label}: {content[:300]}')
+                self.assertLessEqual(
+                    len(queries), budget.queries,
+                    f'{label}: {len(queries)} consultas (orçamento {budget.queries})',
+                )
+                self.assertLessEqual(
+                    len(content), budget.size,
+                    f'{label}: {len(content)} bytes (orçamento {budget.size})',
+                )
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        client = self.client_for('supervisor')
+        url = reverse('appointment-list')
+        params = {'expand': 'vehicle,branch,preparer.user,preparer.branch,created_by.user'}
+        # Primeira requisição carrega o usuário no cache de autenticação
+        client.get(url, {**params, 'page_size': 1})
+
+        with CaptureQueriesContext(connection) as small:
+            client.get(url, {**params, 'page_size': 5})
+        with CaptureQueriesContext(connection) as large:
+            client.get(url, {**params, 'page_size': 40})
+        self.assertEqual(len(small), len(large))
+
+
+class ServerTimingTests(TestCase):
+    """Cabeçalho Server-Timing e amostragem da instrumentação."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, _ = seed_branch(0, vehicles, appointments_per_branch=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_header_reports_queries_and_view(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('appointment-list'))
+        header = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, header)
+        self.assertIn('view;desc="appointment-list"', header)
+
+    @override_settings(PERFORMANCE_INSTRUMENTATION={'SAMPLE_RATE': 0.0, 'SLOW_REQUEST_MS': 0})
+    def test_unsampled_requests_only_log_when_slow(self):
+        with self.assertLogs('logistics.performance', level='WARNING') as logs:
+            response = self.client.get(reverse('branch-list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertIn('"view":"branch-list"', logs.output[0])
+        self.assertNotIn('queries', logs.output[0])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AppointmentImportTests(TestCase):
+    """Importação em lote de agendamentos (JSON e CSV)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicles = [
+            Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi=f'CHS{number:04d}') for number in range(10)
+        ]
+        cls.branch, cls.supervisor, cls.preparers, _ = seed_branch(0, cls.vehicles, appointments_per_branch=0)
+        cls.other_branch, _, cls.other_preparers, _ = seed_branch(1, cls.vehicles, appointments_per_branch=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = reverse('appointment-bulk-import')
+        caches['board'].clear()
+        self.day = (timezone.localdate() + timedelta(days=1)).isoformat()
+
+    def csv_rows(self, count, first_day=1):
+        # Dez horários por dia, sem sobreposição de preparador ou veículo
+        lines = ['appointment_date;time;seller;client;vehicle_id;preparer_id;priority']
+        for number in range(count):
+            day = timezone.localdate() + timedelta(days=first_day + number // 10)
+            vehicle = self.vehicles[number % len(self.vehicles)]
+            preparer = self.preparers[number % len(self.preparers)]
+            lines.append(f'{day};{8 + number % 10:02d}:00;Vendedor;Cliente {number};{vehicle.pk};{preparer.pk};high')
+        return '\n'.join(lines)
+
+    def test_csv_import_uses_constant_queries(self):
+        # Carregar o usuário no cache de autenticação antes de medir
+        self.client.get(reverse('auth-me'))
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post(self.url, self.csv_rows(10), content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, self.csv_rows(800, first_day=2), content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json(), {'created': 800})
+
+        # Só o número de INSERTs em lote cresce com as linhas (o tamanho do lote depende do banco)
+        def lookups(queries):
+            return [query for query in queries if not query['sql'].startswith('INSERT')]
+        self.assertEqual(len(lookups(large)), len(lookups(small)))
+        created = Appointment.objects.filter(branch=self.branch)
+        self.assertEqual(created.count(), 810)
+        self.assertFalse(created.filter(delivery_date__isnull=True).exists())
+
+    def test_invalid_rows_are_reported_and_nothing_is_saved(self):
+        rows = [
+            {'appointment_date': self.day, 'time': '09:00', 'seller': 'V', 'client': 'Ok', 'vehicle_id': self.vehicles[0].pk},
+            {'appointment_date': self.day, 'time': '09:00', 'seller': 'V', 'client': 'Sem veículo', 'vehicle_id': 999999},
+            {'appointment_date': self.day, 'time': '09:00', 'seller': 'V', 'client': 'Outra filial',
+             'vehicle_id': self.vehicles[0].pk, 'branch_id': self.other_branch.pk},
+            {'appointment_date': self.day, 'time': '09:00', 'seller': 'V', 'client': 'Preparador de fora',
+             'vehicle_id': self.vehicles[0].pk, 'preparer_id': self.other_preparers[0].pk},
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = {error['row']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(set(errors), {2, 3, 4})
+        self.assertIn('vehicle_id', errors[2])
+        self.assertIn('branch_id', errors[3])
+        self.assertIn('preparer_id', errors[4])
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_overlapping_rows_are_rejected(self):
+        row = {'appointment_date': self.day, 'seller': 'V', 'client': 'C', 'vehicle_id': self.vehicles[0].pk}
+        rows = [{**row, 'time': '09:00'}, {**row, 'time': '10:00'}, {**row, 'time': '09:30'}]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [3])
+        self.assertIn('linha 1', response.json()['errors'][0]['errors']['time'][0])
+
+
+class BulkStatusTests(TestCase):
+    """Troca de status em lote com validação das transições."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, _, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=10)
+        _, _, _, cls.other_appointments = seed_branch(1, vehicles, appointments_per_branch=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = reverse('appointment-bulk-status')
+
+    def test_applies_status_with_single_update(self):
+        ids = [appointment.pk for appointment in self.appointments]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'ids': ids, 'status': 'completed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['updated'], len(ids))
+        self.assertEqual({row['status'] for row in response.json()['results']}, {'completed'})
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+
+    def test_rejects_whole_batch_on_invalid_transition_or_foreign_id(self):
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(status='completed')
+        ids = [self.appointments[0].pk, self.appointments[1].pk, self.other_appointments[0].pk]
+        response = self.client.post(self.url, {'ids': ids, 'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            {error['id'] for error in response.json()['errors']},
+            {self.appointments[0].pk, self.other_appointments[0].pk},
+        )
+        self.assertEqual(Appointment.objects.get(pk=self.appointments[1].pk).status, 'scheduled')
+
+
+    def test_single_update_is_not_limited_by_the_transition_table(self):
+        # A tabela de transições vale só para o lote; correções individuais continuam livres
+        appointment = self.appointments[0]
+        Appointment.objects.filter(pk=appointment.pk).update(status='completed')
+        url = reverse('appointment-update-status', kwargs={'pk': appointment.pk})
+        for new_status in ('cancelled', 'completed', 'scheduled'):
+            response = self.client.post(url, {'status': new_status})
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()['status'], new_status)
+
+class PrincipalCacheTests(TestCase):
+    """Usuário autenticado em cache e invalidação pelos sinais."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, _ = seed_branch(0, vehicles, appointments_per_branch=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_me_is_served_from_cache(self):
+        self.client.get(reverse('auth-me'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('auth-me'))
+        self.assertEqual(response.json()['branch']['id'], self.branch.pk)
+
+    def test_profile_and_branch_changes_invalidate(self):
+        self.client.get(reverse('auth-me'))
+
+        self.supervisor.is_supervisor = False
+        self.supervisor.save()
+        self.assertFalse(self.client.get(reverse('auth-me')).json()['is_supervisor'])
+
+        self.branch.name = 'Filial Renomeada'
+        self.branch.save()
+        self.assertEqual(self.client.get(reverse('auth-me')).json()['branch']['name'], 'Filial Renomeada')
+
+    def test_invalidation_right_after_load(self):
+        cache = PrincipalCache()
+
+        class ClearOnRelease:
+            # Outra thread invalida o cache assim que a trava é liberada
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                cache._entries.clear()
+
+        cache._lock = ClearOnRelease()
+        self.assertEqual(cache.get(self.supervisor.user_id).userprofile.branch_id, self.branch.pk)
+
+
+class TokenClaimsTests(TestCase):
+    """Leituras atendidas só com as claims do token emitido pelo login."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, _ = seed_branch(0, vehicles, appointments_per_branch=5)
+        cls.vehicle = vehicles[0]
+
+    def setUp(self):
+        response = APIClient().post(reverse('auth-login'), {
+            'email': 'supervisor0@example.com', 'password': 'senha123', 'branch': self.branch.pk,
+        }, format='json')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.json()["token"]}')
+        principal_cache.invalidate()
+
+    def test_reads_need_no_user_lookup(self):
+        # Só a primeira leitura carrega o usuário no principal_cache, para conferir as claims
+        self.client.get(reverse('auth-me'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('auth-me'))
+        self.assertEqual(response.json()['branch'], {'id': self.branch.pk, 'name': self.branch.name})
+        self.assertTrue(response.json()['is_supervisor'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('appointment-list'))
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertFalse([query for query in queries if 'FROM "auth_user"' in query['sql']])
+
+    def test_stale_claims_lose_read_access(self):
+        url = reverse('appointment-list')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        other_branch = Branch.objects.create(name='Outra Filial', cnpj='99999999000199')
+        self.supervisor.branch = other_branch
+        self.supervisor.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'claims_changed')
+
+        self.supervisor.branch = self.branch
+        self.supervisor.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.supervisor.user.is_active = False
+        self.supervisor.user.save()
+        self.assertEqual(self.client.get(url).json()['code'], 'user_inactive')
+
+    def test_writes_use_the_real_user(self):
+        response = self.client.post(reverse('appointment-list'), _new_appointment({
+            'vehicle': self.vehicle, 'branch': self.branch, 'preparer': self.preparers[0],
+        }), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Appointment.objects.get(pk=response.json()['id']).created_by, self.supervisor)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BoardSnapshotTests(TestCase):
+    """Painel pré-calculado por filial e dia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=10)
+
+    def setUp(self):
+        caches['board'].clear()
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = reverse('appointment-board')
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.client.get(reverse('auth-me'))
+
+    def get_board(self, day=None):
+        return self.client.get(self.url, {'date': (day or self.day).isoformat()})
+
+    def cards(self, snapshot, status):
+        bucket = next(bucket for bucket in snapshot['buckets'] if bucket['status'] == status)
+        return [card['id'] for card in bucket['appointments']]
+
+    def test_impossible_dates_are_rejected(self):
+        # Bem formadas, mas inexistentes: parse_date levanta ValueError em vez de devolver None
+        day = '2024-02-30'
+        requests = [
+            (self.client.get, reverse('appointment-board'), {'date': day}),
+            (self.client.get, reverse('appointment-stats'), {'start_date': day}),
+            (self.client.get, reverse('appointment-export'), {'end_date': day}),
+            (self.client.get, reverse('delivery-export'), {'start_date': day}),
+            (self.client.post, reverse('appointment-auto-assign'), {'date': day}),
+        ]
+        for method, url, params in requests:
+            with self.subTest(url=url):
+                self.assertEqual(method(url, params).status_code, 400)
+
+        token = RefreshToken.for_user(self.preparers[0].user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.post(reverse('appointment-claim-next'), {'date': day}).status_code, 400)
+
+    def test_snapshot_is_computed_once(self):
+        with self.assertNumQueries(1):
+            first = self.get_board()
+        with self.assertNumQueries(0):
+            for _ in range(40):
+                response = self.get_board()
+        self.assertEqual(response.json(), first.json())
+        self.assertEqual(first.json()['total'], 10)
+
+        ranks = [card['priority'] for card in first.json()['buckets'][1]['appointments']]
+        self.assertEqual(ranks, sorted(ranks, key=['high', 'medium', 'low'].index))
+
+        response = self.client.get(self.url, {'date': self.day.isoformat()}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_patch_the_cached_snapshot(self):
+        self.get_board()
+        appointment = self.appointments[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointment-update-status', kwargs={'pk': appointment.pk}), {'status': 'in_progress'})
+        snapshot = self.get_board().json()
+        self.assertEqual(self.cards(snapshot, 'in_progress'), [appointment.pk])
+        self.assertNotIn(appointment.pk, self.cards(snapshot, 'scheduled'))
+        self.assertEqual(snapshot['total'], 10)
+
+        # Mudar o dia tira o card do painel antigo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse('appointment-detail', kwargs={'pk': appointment.pk}),
+                {'appointment_date': (self.day + timedelta(days=5)).isoformat()},
+                format='json',
+            )
+        with self.assertNumQueries(0):
+            snapshot = self.get_board().json()
+        self.assertEqual(self.cards(snapshot, 'in_progress'), [])
+        self.assertEqual(snapshot['total'], 9)
+
+    def test_change_during_build_is_not_lost(self):
+        key = snapshot_key(self.branch.pk, self.day)
+        appointment = self.appointments[3]
+
+        def build():
+            snapshot = build_snapshot(self.branch.pk, self.day)
+            # Mudança confirmada depois da leitura, com o lock ainda com este cálculo
+            Appointment.objects.filter(pk=appointment.pk).update(status='in_progress')
+            board.refresh_appointment_ids([appointment.pk])
+            return snapshot
+
+        stale = get_or_build(key, build)
+        self.assertIn(appointment.pk, self.cards(stale, 'scheduled'))
+        # O resultado desatualizado não ficou em cache: o próximo acesso recalcula
+        self.assertIsNone(caches['board'].get(key))
+        self.assertEqual(self.cards(self.get_board().json(), 'in_progress'), [appointment.pk])
+
+
+class FileBasedCacheTests(SimpleTestCase):
+    """``add`` atômico do cache em disco usado pelos locks dos painéis."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def test_only_one_concurrent_add_wins(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def add(number):
+            cache = FileBasedCache(self.location, {})
+            barrier.wait()
+            results.append(cache.add('lock', number, 10))
+
+        threads = [threading.Thread(target=add, args=(number,)) for number in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_add_replaces_expired_entry(self):
+        first, second = FileBasedCache(self.location, {}), FileBasedCache(self.location, {})
+        self.assertTrue(first.add('lock', 1, 10))
+        self.assertFalse(second.add('lock', 2, 10))
+        self.assertEqual(second.get('lock'), 1)
+
+        first.set('lock', 1, -1)
+        self.assertTrue(second.add('lock', 2, 10))
+        self.assertEqual(first.get('lock'), 2)
+        self.assertEqual(os.listdir(self.location), [os.path.basename(first._key_to_file('lock'))])
+
+
+@override_settings(CACHES=TEST_CACHES, WORKING_HOURS=('08:00', '18:00'))
+class AvailabilityTests(TestCase):
+    """Horários livres e recusa de agendamentos sobrepostos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=10)
+        cls.vehicle = vehicles[0]
+        cls.free_vehicle = Vehicle.objects.create(model='Modelo', color='#000000', chassi='CHS0002')
+
+    def setUp(self):
+        caches['board'].clear()
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.client.get(reverse('auth-me'))
+        self.day = timezone.localdate() + timedelta(days=1)
+        # Em seed_branch o preparador 1 atende às 09:00, 13:00 e 17:00
+        self.preparer = self.preparers[1]
+
+    def free(self, **params):
+        response = self.client.get(reverse('appointment-availability'), {'date': self.day.isoformat(), **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def book(self, start, **extra):
+        data = {
+            'appointment_date': self.day.isoformat(), 'time': start, 'seller': 'Vendedor', 'client': 'Cliente',
+            'vehicle_id': self.free_vehicle.pk, 'branch_id': self.branch.pk, 'preparer_id': self.preparer.pk, **extra,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('appointment-list'), data, format='json')
+
+    def test_free_intervals_come_from_the_cached_index(self):
+        data = self.free(preparer=self.preparer.pk, vehicle=self.vehicle.pk)
+        self.assertEqual(
+            data['preparers'][0]['free'],
+            [{'start': '08:00', 'end': '09:00'}, {'start': '10:00', 'end': '13:00'}, {'start': '14:00', 'end': '17:00'}],
+        )
+        self.assertEqual(data['vehicle']['free'], [])
+
+        # Só a lista de preparadores vai ao banco depois da primeira consulta
+        with self.assertNumQueries(1):
+            data = self.free(duration='02:00:00')
+        self.assertEqual(len(data['preparers']), len(self.preparers))
+        free = {preparer['id']: preparer['free'] for preparer in data['preparers']}
+        self.assertEqual(free[self.preparer.pk], [{'start': '10:00', 'end': '13:00'}, {'start': '14:00', 'end': '17:00'}])
+
+    def test_overlapping_bookings_are_rejected(self):
+        self.free()
+        first = self.book('10:30')
+        self.assertEqual(first.status_code, 201, first.content)
+        with self.assertNumQueries(1):
+            data = self.free(preparer=self.preparer.pk)
+        self.assertIn({'start': '11:30', 'end': '13:00'}, data['preparers'][0]['free'])
+
+        response = self.book('11:00')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('time', response.json())
+        response = self.book('12:00', vehicle_id=self.vehicle.pk, preparer_id=None)
+        self.assertEqual(response.status_code, 400)
+
+        # Cancelar libera o horário no índice
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointment-update-status', kwargs={'pk': first.json()['id']}), {'status': 'cancelled'})
+        self.assertEqual(self.book('11:00').status_code, 201)
+
+    def test_booking_rechecks_the_database_when_the_index_is_stale(self):
+        self.free()
+        # Reserva concorrente que o índice em cache ainda não viu (bulk_create não dispara sinais)
+        concurrent = Appointment(
+            appointment_date=self.day, time=time(10, 30), seller='V', client='Concorrente',
+            vehicle=self.free_vehicle, branch=self.branch, created_by=self.supervisor,
+        )
+        concurrent.apply_defaults()
+        Appointment.objects.bulk_create([concurrent])
+
+        response = self.book('10:00', preparer_id=None)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('time', response.json())
+
+        rows = [{
+            'appointment_date': self.day.isoformat(), 'time': '11:00', 'seller': 'V', 'client': 'Importado',
+            'vehicle_id': self.free_vehicle.pk, 'branch_id': self.branch.pk,
+        }]
+        response = self.client.post(reverse('appointment-bulk-import'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Appointment.objects.filter(vehicle=self.free_vehicle).count(), 1)
+
+    def test_index_finds_the_same_conflicts_as_a_full_scan(self):
+        rng = random.Random(7)
+        index, rows = DayIndex(), {}
+        for pk in range(1, 300):
+            start = rng.randrange(0, DAY_SECONDS - 3600)
+            rows[pk] = (rng.randrange(3), start, start + rng.choice((600, 1800, 3600, 4 * 3600)))
+            index.add(pk, rows[pk][0], None, *rows[pk][1:])
+        for pk in rng.sample(sorted(rows), 100):
+            index.remove(pk)
+            del rows[pk]
+        for _ in range(200):
+            preparer, start = rng.randrange(3), rng.randrange(0, DAY_SECONDS - 3600)
+            end = start + rng.randrange(1, 3600)
+            expected = sorted(
+                ('preparer', busy_start, busy_end, pk) for pk, (resource, busy_start, busy_end) in rows.items()
+                if resource == preparer and busy_start < end and busy_end > start
+            )
+            self.assertEqual(sorted(index.conflicts(preparer, None, start, end)), expected)
+
+    def test_rejects_impossible_date(self):
+        response = self.client.get(reverse('appointment-availability'), {'date': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, WORKING_HOURS=('08:00', '18:00'))
+class PreparerSchedulerTests(TestCase):
+    """Atribuição automática de preparadores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicles = [
+            Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi=f'CHS{number:04d}') for number in range(20)
+        ]
+        cls.branch, cls.supervisor, cls.preparers, _ = seed_branch(0, cls.vehicles, appointments_per_branch=0, preparers=3)
+        cls.day = timezone.localdate() + timedelta(days=1)
+
+        def job(number, hour, priority='medium', delivery_days=3):
+            return Appointment(
+                appointment_date=cls.day, time=time(hour, 0), seller='V', client=f'C{number}',
+                vehicle=cls.vehicles[number], branch=cls.branch, priority=priority, created_by=cls.supervisor,
+                delivery_date=cls.day + timedelta(days=delivery_days),
+            )
+
+        # Quatro tarefas às 08:00 para três preparadores: fica de fora a de menor prioridade e prazo mais longo
+        jobs = [job(0, 8, 'low'), job(1, 8, 'low', delivery_days=5), job(2, 8, 'high'), job(3, 8, 'low')]
+        jobs += [job(4 + number, 9 + number // 3) for number in range(9)]
+        for appointment in jobs:
+            appointment.apply_defaults()
+        cls.jobs = Appointment.objects.bulk_create(jobs)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def auto_assign(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('appointment-auto-assign'), {'date': self.day.isoformat(), **data}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_dry_run_does_not_write(self):
+        result = self.auto_assign(dry_run=True)
+        self.assertEqual(result['assigned'], 12)
+        self.assertFalse(Appointment.objects.filter(preparer__isnull=False).exists())
+
+    def test_balances_load_by_priority_without_overlaps(self):
+        result = self.auto_assign()
+        self.assertEqual(result['assigned'], 12)
+        self.assertEqual(result['unassigned'], [self.jobs[1].pk])
+        self.assertEqual([row['assigned'] for row in result['preparers']], [4, 4, 4])
+        self.assertEqual(result['utilization'], round(12 * 3600 / (3 * 10 * 3600), 3))
+
+        assigned = Appointment.objects.filter(preparer__isnull=False)
+        self.assertEqual(assigned.count(), 12)
+        self.assertEqual(
+            assigned.values('preparer', 'time').distinct().count(), 12, 'Preparador com dois agendamentos no mesmo horário'
+        )
+        self.assertIsNone(Appointment.objects.get(pk=self.jobs[1].pk).preparer_id)
+
+        # Nada mais a atribuir: a tarefa restante continua sem preparador livre
+        self.assertEqual(self.auto_assign()['assigned'], 0)
+
+    def test_preparer_cannot_auto_assign(self):
+        token = RefreshToken.for_user(self.preparers[0].user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post(reverse('appointment-auto-assign'), {'date': self.day.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Appointment.objects.filter(preparer__isnull=False).exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ClaimNextTests(TestCase):
+    """Fila de trabalho dos preparadores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=10)
+        cls.day = (timezone.localdate() + timedelta(days=1)).isoformat()
+
+    def client_for(self, profile):
+        client = APIClient()
+        token = RefreshToken.for_user(profile.user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def claim(self, client):
+        return client.post(reverse('appointment-claim-next'), {'date': self.day}, format='json')
+
+    def test_claims_follow_priority_rank(self):
+        client = self.client_for(self.preparers[1])
+        claimed = []
+        while (response := self.claim(client)).status_code == 200:
+            claimed.append(response.json()['id'])
+        self.assertEqual(response.status_code, 204)
+
+        # Livres (números 0, 4, 8) ou já do preparador 1 (1, 5, 9), por prioridade e horário
+        expected = [self.appointments[number].pk for number in (5, 8, 1, 4, 0, 9)]
+        self.assertEqual(claimed, expected)
+        self.assertEqual(
+            set(Appointment.objects.filter(pk__in=claimed).values_list('status', 'preparer')),
+            {('in_progress', self.preparers[1].pk)},
+        )
+
+    def test_each_appointment_is_claimed_once(self):
+        clients = [self.client_for(profile) for profile in self.preparers]
+        claimed = []
+        for _ in range(4):
+            for client in clients:
+                response = self.claim(client)
+                if response.status_code == 200:
+                    claimed.append(response.json()['id'])
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), 10)
+
+    def test_supervisors_cannot_claim(self):
+        self.assertEqual(self.claim(self.client_for(self.supervisor)).status_code, 403)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DurationStatsTests(TestCase):
+    """Estatísticas incrementais de duração e estimativa automática."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, cls.vehicles, appointments_per_branch=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_streaming_summary_matches_exact_values(self):
+        generator = random.Random(7)
+        samples = [generator.lognormvariate(8, 0.4) for _ in range(3000)]
+        record_samples([('Modelo', None, value) for value in samples[:1000]])
+        record_samples([('Modelo', None, value) for value in samples[1000:]])
+
+        stat = DurationStat.objects.get(scope='model', key='Modelo')
+        ordered = sorted(samples)
+        self.assertEqual(stat.count, 3000)
+        self.assertAlmostEqual(stat.mean, statistics.fmean(samples), places=6)
+        self.assertAlmostEqual(stat.variance, statistics.variance(samples), delta=1e-6 * statistics.variance(samples))
+        self.assertAlmostEqual(quantile(stat, 0.5), ordered[1500], delta=0.03 * ordered[1500])
+        self.assertAlmostEqual(quantile(stat, 0.9), ordered[2700], delta=0.03 * ordered[2700])
+
+    def test_concurrent_first_sample_does_not_conflict(self):
+        # Outra transação cria o resumo entre a leitura travada e o INSERT
+        DurationStat.objects.create(scope='model', key='Modelo', count=1, mean=600.0)
+        lookup = durations._lookup
+        calls = []
+
+        def stale_lookup(keys, lock=False):
+            calls.append(keys)
+            return {} if len(calls) == 1 else lookup(keys, lock)
+
+        with mock.patch.object(durations, '_lookup', stale_lookup):
+            record_samples([('Modelo', None, 1200.0)])
+        stat = DurationStat.objects.get(scope='model', key='Modelo')
+        self.assertEqual(stat.count, 2)
+        self.assertAlmostEqual(stat.mean, 900.0)
+        self.assertEqual(DurationStat.objects.get(scope='global').count, 1)
+
+    def test_completion_is_sampled_once(self):
+        appointment = self.appointments[1]
+        detail = {'pk': appointment.pk}
+        self.client.post(reverse('appointment-update-duration', kwargs=detail), {'actual_duration': '00:40:00'})
+        self.assertFalse(DurationStat.objects.exists())
+
+        for status in ('completed', 'in_progress', 'completed'):
+            self.client.post(reverse('appointment-update-status', kwargs=detail), {'status': status})
+        counts = dict(DurationStat.objects.values_list('scope', 'count'))
+        self.assertEqual(counts, {'global': 1, 'model': 1, 'preparer': 1})
+
+        # Conclusão em lote também entra nas estatísticas
+        others = self.appointments[2:4]
+        Appointment.objects.filter(pk__in=[a.pk for a in others]).update(actual_duration=timedelta(minutes=20))
+        self.client.post(
+            reverse('appointment-bulk-status'), {'ids': [a.pk for a in others], 'status': 'completed'}, format='json'
+        )
+        self.assertEqual(DurationStat.objects.get(scope='global').count, 3)
+
+    def test_new_appointments_get_learned_estimate(self):
+        record_samples([('Modelo', None, 30 * 60)] * 5)
+        data = {
+            'appointment_date': (timezone.localdate() + timedelta(days=5)).isoformat(), 'time': '10:00',
+            'seller': 'Vendedor', 'client': 'Cliente', 'vehicle_id': self.vehicles[0].pk, 'branch_id': self.branch.pk,
+        }
+        response = self.client.post(reverse('appointment-list'), data, format='json')
+        self.assertEqual(response.json()['estimated_duration'], '00:30:00')
+
+        response = self.client.post(
+            reverse('appointment-list'), {**data, 'time': '11:00', 'estimated_duration': '02:00:00'}, format='json'
+        )
+        self.assertEqual(response.json()['estimated_duration'], '02:00:00')
+
+        response = self.client.get(reverse('appointment-duration-estimate'), {'vehicle': self.vehicles[0].pk})
+        self.assertEqual(response.json(), {'estimated_duration': '00:30:00', 'source': 'model'})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AppointmentStatsTests(TestCase):
+    """Estatísticas agregadas no banco."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=30)
+        seed_branch(1, vehicles, appointments_per_branch=10)
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.params = {
+            'start_date': timezone.localdate().isoformat(),
+            'end_date': (timezone.localdate() + timedelta(days=30)).isoformat(),
+        }
+
+    def test_groups_match_rows(self):
+        response = self.client.get(reverse('appointment-stats'), self.params)
+        data = response.json()
+        self.assertEqual(data['total']['count'], 30)
+        self.assertEqual(data['total']['estimated_seconds'], 30 * 3600)
+
+        priorities = {row['key']: row['count'] for row in data['by_priority']}
+        expected = {}
+        for appointment in self.appointments:
+            expected[appointment.priority] = expected.get(appointment.priority, 0) + 1
+        self.assertEqual(priorities, expected)
+        self.assertEqual(sum(row['count'] for row in data['by_day']), 30)
+        self.assertEqual(
+            {row['label'] for row in data['by_preparer']},
+            {appointment.preparer.user.username if appointment.preparer else None for appointment in self.appointments},
+        )
+        self.assertLess(len(response.content), 1_500)
+
+    def test_cached_for_short_ttl(self):
+        self.client.get(reverse('auth-me'))
+        self.client.get(reverse('appointment-stats'), self.params)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('appointment-stats'), self.params)
+
+
+@override_settings(CACHES=TEST_CACHES, ARCHIVE_AFTER_DAYS=90)
+class ArchiveTests(TestCase):
+    """Arquivamento de agendamentos finalizados e leitura pelo período."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=20)
+        # Os 12 primeiros ficam antes do horizonte; 0-9 finalizados, 10-11 ainda agendados
+        old_day = timezone.localdate() - timedelta(days=200)
+        for number, appointment in enumerate(cls.appointments[:12]):
+            Appointment.objects.filter(pk=appointment.pk).update(
+                appointment_date=old_day + timedelta(days=number // 4),
+                status='scheduled' if number >= 10 else 'completed' if number % 3 else 'cancelled',
+            )
+        Delivery.objects.filter(appointment__in=cls.appointments[:10]).update(status='delivered')
+        # Entrega ainda pendente segura o agendamento 9 na tabela quente
+        Delivery.objects.filter(appointment=cls.appointments[9]).update(status='pending')
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_moves_finished_rows_in_batches(self):
+        archived_ids = {appointment.pk for appointment in self.appointments[:9]}
+        self.assertEqual(archive(horizon(), batch_size=4, max_batches=1), (4, 2))
+        self.assertEqual(archive(horizon(), batch_size=4), (5, 2))
+
+        self.assertEqual(set(ArchivedAppointment.objects.values_list('pk', flat=True)), archived_ids)
+        self.assertEqual(ArchivedDelivery.objects.count(), 4)
+        self.assertFalse(Appointment.objects.filter(pk__in=archived_ids).exists())
+        self.assertEqual(Appointment.objects.count(), 11)
+        # Para a sincronização, quem foi arquivado saiu da tabela quente
+        tombstones = set(Tombstone.objects.values_list('model', 'object_id', 'branch_id'))
+        archived_deliveries = ArchivedDelivery.objects.values_list('pk', flat=True)
+        self.assertEqual(tombstones, {
+            *(('appointment', pk, self.branch.pk) for pk in archived_ids),
+            *(('delivery', pk, self.branch.pk) for pk in archived_deliveries),
+        })
+        deleted = self.client.get(reverse('appointment-sync'), {'since': encode_sync_cursor(None, 0, 0)}).json()['deleted']
+        self.assertEqual(set(deleted), archived_ids)
+
+        original = self.appointments[1]
+        copy = ArchivedAppointment.objects.get(pk=original.pk)
+        self.assertEqual((copy.client, copy.preparer_id, copy.created_at), (original.client, original.preparer_id, original.created_at))
+
+    def test_list_merges_archive_only_for_old_periods(self):
+        archive(horizon())
+        url = reverse('appointment-list')
+
+        # Período que começa depois do dia arquivado mais recente: só a tabela quente
+        recent = {'start_date': (timezone.localdate() - timedelta(days=30)).isoformat()}
+        rows = self.client.get(url, recent).json()['results']
+        self.assertEqual([row['id'] for row in rows], [a.pk for a in self.appointments[12:]])
+        # Período aberto alcança o arquivo
+        self.assertEqual(len(self.client.get(url).json()['results']), 20)
+
+        params = {'start_date': (timezone.localdate() - timedelta(days=365)).isoformat(), 'page_size': 7}
+        data = self.client.get(url, params).json()
+        ids = [row['id'] for row in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            ids.extend(row['id'] for row in data['results'])
+
+        # As duas tabelas intercaladas na ordem do cursor
+        rows = list(Appointment.objects.values_list('appointment_date', 'time', 'pk'))
+        rows += ArchivedAppointment.objects.values_list('appointment_date', 'time', 'pk')
+        self.assertEqual(ids, [pk for _, _, pk in sorted(rows)])
+        self.assertEqual(len(ids), 20)
+
+    def test_shorter_horizon_is_still_read_from_the_archive(self):
+        recent = self.appointments[12]
+        Appointment.objects.filter(pk=recent.pk).update(
+            appointment_date=timezone.localdate() - timedelta(days=10), status='completed'
+        )
+        # Como archive_appointments --days 5: mais recente que ARCHIVE_AFTER_DAYS
+        archive(horizon(5))
+        self.assertTrue(ArchivedAppointment.objects.filter(pk=recent.pk).exists())
+
+        start_date = (timezone.localdate() - timedelta(days=30)).isoformat()
+        ids = [row['id'] for row in self.client.get(reverse('appointment-list'), {'start_date': start_date}).json()['results']]
+        self.assertIn(recent.pk, ids)
+        response = self.client.get(reverse('appointment-export'), {'start_date': start_date, 'output': 'ndjson'})
+        exported = [json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()]
+        self.assertIn(recent.pk, exported)
+
+        # Exportação sem datas inclui o histórico arquivado
+        response = self.client.get(reverse('appointment-export'), {'output': 'ndjson'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 20)
+
+    def test_rebuilt_duration_stats_keep_archived_samples(self):
+        Appointment.objects.filter(status='completed').update(actual_duration=timedelta(minutes=90))
+        completed = Appointment.objects.filter(status='completed').count()
+        archive(horizon())
+        self.assertTrue(ArchivedAppointment.objects.filter(status='completed').exists())
+
+        self.assertEqual(rebuild(), completed)
+        self.assertEqual(DurationStat.objects.get(scope='model', key='Modelo').count, completed)
+        self.assertFalse(ArchivedAppointment.objects.filter(status='completed', duration_sampled=False).exists())
+
+
+@override_settings(CACHES=TEST_CACHES, ARCHIVE_AFTER_DAYS=90)
+class ExportTests(TestCase):
+    """Exportação em streaming de agendamentos e entregas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Modelo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=30)
+        seed_branch(1, vehicles, appointments_per_branch=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def export(self, route='appointment-export', **params):
+        response = self.client.get(reverse(route), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_has_every_filtered_row(self):
+        response, content = self.export(priority='high')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="agendamentos-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(content.decode('utf-8-sig'))))
+        expected = [appointment for appointment in self.appointments if appointment.priority == 'high']
+        self.assertEqual([int(row['id']) for row in rows], [appointment.pk for appointment in expected])
+        self.assertEqual(rows[0]['estimated_duration'], '01:00:00')
+        self.assertEqual(rows[0]['branch'], 'Filial 0')
+
+    def test_ndjson_gzip(self):
+        response, content = self.export('delivery-export', output='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(len(records), 15)
+        self.assertEqual({record['branch'] for record in records}, {'Filial 0'})
+        self.assertEqual(records[0]['status'], 'pending')
+
+    def test_rejects_unknown_format(self):
+        response = self.client.get(reverse('appointment-export'), {'output': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_filters(self):
+        routes = (
+            'appointment-list', 'appointment-sync', 'appointment-export', 'appointment-stats',
+            'delivery-list', 'delivery-sync', 'delivery-export',
+        )
+        for route in routes:
+            for params in ({'start_date': '2024-02-30'}, {'end_date': 'ontem'}, {'preparer': 'abc'}):
+                with self.subTest(route=route, **params):
+                    response = self.client.get(reverse(route), params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(next(iter(params)), response.json())
+
+        # Filtros válidos continuam valendo para as entregas
+        preparer = self.preparers[1]
+        response = self.client.get(reverse('delivery-list'), {'preparer': preparer.pk})
+        expected = Delivery.objects.filter(appointment__preparer=preparer).count()
+        self.assertGreater(expected, 0)
+        self.assertEqual(len(response.json()), expected)
+        with self.assertRaises(CommandError):
+            call_command('export_appointments', start_date='2024-02-30', stdout=io.StringIO())
+
+    def test_streams_incrementally_under_asgi(self):
+        events = []
+        build_chunks = exports._chunks
+
+        def small_chunks(lines, size=exports.EXPORT_BUFFER_BYTES):
+            for chunk in build_chunks(lines, size=500):
+                events.append('built')
+                yield chunk
+
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': reverse('appointment-export'), 'root_path': '', 'query_string': b'output=ndjson',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        body = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                self.assertEqual(message['status'], 200)
+            elif message.get('body'):
+                events.append('sent')
+                body.append(message['body'])
+
+        with mock.patch.object(exports, '_chunks', small_chunks):
+            async_to_sync(application)(scope, receive, send)
+
+        self.assertEqual(len(b''.join(body).splitlines()), 30)
+        # O primeiro pedaço sai antes de o último ser montado
+        self.assertGreater(events.count('built'), 2)
+        self.assertIn('built', events[events.index('sent'):])
+
+    def test_reads_in_pages(self):
+        querysets = [Appointment.objects.all()]
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(stream(querysets, APPOINTMENT_COLUMNS, 'ndjson', chunk_size=7))
+        self.assertEqual(len(content.splitlines()), 40)
+        # 40 linhas em páginas de 7: seis cheias, uma parcial e a última vazia
+        self.assertEqual(len(queries), 7)
+
+    def test_includes_archive_for_old_periods(self):
+        old = self.appointments[0]
+        Appointment.objects.filter(pk=old.pk).update(
+            appointment_date=timezone.localdate() - timedelta(days=200), status='completed'
+        )
+        archive(horizon())
+        _, content = self.export(start_date=(timezone.localdate() - timedelta(days=365)).isoformat())
+        rows = list(csv.DictReader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(int(rows[0]['id']), old.pk)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'agendamentos.csv.gz')
+            call_command(
+                'export_appointments', output=path, gzip=True, branch=self.branch.pk, status='scheduled',
+                stderr=io.StringIO(),
+            )
+            with gzip.open(path, 'rt', encoding='utf-8-sig') as exported:
+                rows = list(csv.DictReader(exported))
+        self.assertEqual(len(rows), 30)
+
+
+class VehicleImportTests(TestCase):
+    """Importação de veículos com upsert pelo chassi."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicles = [Vehicle.objects.create(model='Antigo', color='#FFFFFF', chassi='CHS0001')]
+        cls.branch, cls.supervisor, cls.preparers, cls.appointments = seed_branch(0, vehicles, appointments_per_branch=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.url = reverse('vehicle-bulk-import')
+
+    def csv_rows(self, count, start=0):
+        lines = ['model;color;chassi']
+        lines += [f'Modelo {number % 7};#{number:06X};VIN{number:04d}' for number in range(start, start + count)]
+        return '\n'.join(lines)
+
+    def test_upserts_by_chassi(self):
+        content = 'model,color,chassi\nNovo,#112233,CHS0001\nOutro,#445566,chs0002\n,#000000,CHS0003\nDe novo,#000000,CHS0002\n'
+        response = self.client.post(self.url, content, content_type='text/csv')
+        data = response.json()
+        self.assertEqual((data['inserted'], data['updated'], data['rejected']), (1, 1, 2))
+        self.assertEqual([error['row'] for error in data['errors']], [3, 4])
+        self.assertIn('model', data['errors'][0]['errors'])
+
+        vehicle = Vehicle.objects.get(chassi='CHS0001')
+        self.assertEqual((vehicle.model, vehicle.color), ('Novo', '#112233'))
+        self.assertEqual(vehicle.pk, self.appointments[0].vehicle_id)
+        self.assertTrue(Vehicle.objects.filter(chassi='CHS0002', model='Outro').exists())
+
+    def test_queries_grow_with_batches_not_rows(self):
+        self.client.post(self.url, self.csv_rows(1), content_type='text/csv')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, self.csv_rows(10), content_type='text/csv')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, self.csv_rows(190), content_type='text/csv')
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(response.json()['inserted'], 180)
+
+        report = VehicleImporter(batch_size=100).run(
+            {'model': 'Modelo', 'color': '#000000', 'chassi': f'VIN{number:04d}'} for number in range(100, 250)
+        )
+        self.assertEqual((report['inserted'], report['updated']), (60, 90))
+        self.assertEqual(Vehicle.objects.count(), 251)
+
+    def test_rejects_non_list(self):
+        response = self.client.post(self.url, {'model': 'Modelo'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_reads_csv_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'frota.csv')
+            with open(path, 'w', encoding='utf-8-sig') as manifest:
+                manifest.write(self.csv_rows(25))
+            output = io.StringIO()
+            call_command('import_vehicles', path, batch_size=10, stdout=output)
+        self.assertIn('25 inserido(s), 0 atualizado(s), 0 recusado(s)', output.getvalue())
+        self.assertEqual(Vehicle.objects.filter(chassi__startswith='VIN').count(), 25)
+
+
+class VehicleSearchTests(TestCase):
+    """Busca incremental de veículos por chassi e modelo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.supervisor = seed_branch(0, [Vehicle.objects.create(model='Base', color='#FFFFFF', chassi='BASE001')], 0)[1]
+        cls.vehicles = Vehicle.objects.bulk_create([
+            Vehicle(model='Toyota Corolla', color='#FF0000', chassi='ABC1234'),
+            Vehicle(model='Toyota Corolla', color='#0000FF', chassi='ABD5678'),
+            Vehicle(model='Citroën C3', color='#FFFFFF', chassi='XYZ9999'),
+            Vehicle(model='Honda Civic', color='#000000', chassi='CIV0001'),
+        ])
+
+    def setUp(self):
+        vehicle_search.invalidate()
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.supervisor.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('vehicle-search'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['chassi'] for row in response.json()['results']]
+
+    def test_prefix_then_fuzzy(self):
+        self.assertEqual(self.search('ab'), ['ABC1234', 'ABD5678'])
+        self.assertEqual(self.search('cor'), ['ABC1234', 'ABD5678'])
+        self.assertEqual(self.search('citroen'), ['XYZ9999'])
+        # Chassi com um caractere errado e modelo com letra faltando
+        self.assertEqual(self.search('XYZ9998'), ['XYZ9999'])
+        self.assertEqual(self.search('corola'), ['ABC1234', 'ABD5678'])
+        # Prefixo do chassi vem antes do modelo
+        self.assertEqual(self.search('civ'), ['CIV0001'])
+        self.assertEqual(self.search('toyota', limit=1), ['ABC1234'])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_changes_without_reloading(self):
+        self.search('a')
+        vehicle = self.vehicles[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            vehicle.chassi = 'NEW0001'
+            vehicle.save()
+            Vehicle.objects.get(chassi='XYZ9999').delete()
+            VehicleImporter().run([{'model': 'Fiat Argo', 'color': '#00FF00', 'chassi': 'ARG0001'}])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('new'), ['NEW0001'])
+            self.assertEqual(self.search('argo'), ['ARG0001'])
+            self.assertEqual(self.search('citroen'), [])
+
+    def test_changes_during_a_refresh_reach_the_new_index(self):
+        self.search('a')
+        # O índice novo leu o banco antes das alterações abaixo
+        rebuilt = vehicle_search.build()
+        vehicle = self.vehicles[0]
+
+        def build():
+            with self.captureOnCommitCallbacks(execute=True):
+                vehicle.chassi = 'NEW0001'
+                vehicle.save()
+                Vehicle.objects.get(chassi='XYZ9999').delete()
+            return rebuilt
+
+        vehicle_search._expires = 0
+        with mock.patch.object(vehicle_search, 'build', build), \
+                mock.patch('logistics.search.threading.Thread') as thread, mock.patch('logistics.search.connection'):
+            vehicle_search.get_index()
+            # A recarga roda aqui mesmo, na conexão do teste
+            thread.call_args.kwargs['target']()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('new'), ['NEW0001'])
+            self.assertEqual(self.search('abc'), [])
+            self.assertEqual(self.search('citroen'), [])
+
+    def test_rolled_back_changes_stay_out_of_the_index(self):
+        self.search('a')
+        vehicle = self.vehicles[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    vehicle.chassi = 'NEW0001'
+                    vehicle.save()
+                    Vehicle.objects.get(chassi='XYZ9999').delete()
+                    VehicleImporter().run([{'model': 'Fiat Argo', 'color': '#00FF00', 'chassi': 'ARG0001'}])
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+
+        self.assertEqual(self.search('new'), [])
+        self.assertEqual(self.search('argo'), [])
+        self.assertEqual(self.search('abc'), ['ABC1234'])
+        self.assertEqual(self.search('citroen'), ['XYZ9999'])
+
+    def test_rejects_invalid_limit(self):
+        response = self.client.get(reverse('vehicle-search'), {'q': 'a', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DatasetGeneratorTests(TestCase):
+    """Massa sintética para testes de carga."""
+
+    def generate(self, seed):
+        Branch.objects.all().delete()
+        Vehicle.objects.all().delete()
+        User.objects.all().delete()
+        counts = DatasetGenerator(
+            seed=seed, branches=2, preparers=3, vehicles=50, years=0.1, future_days=5, appointments_per_day=12,
+            batch_size=40,
+        ).run()
+        snapshot = list(Appointment.objects.order_by('pk').values_list(
+            'appointment_date', 'time', 'client', 'status', 'priority', 'vehicle__model', 'actual_duration',
+            'delivery__status',
+        ))
+        return counts, snapshot
+
+    def test_generates_consistent_reproducible_data(self):
+        counts, snapshot = self.generate(seed=7)
+        self.assertEqual(counts['branches'], 2)
+        self.assertEqual(counts['users'], 8)
+        self.assertEqual(Vehicle.objects.count(), 50)
+        self.assertEqual(Appointment.objects.count(), counts['appointments'])
+        self.assertEqual(Delivery.objects.count(), counts['deliveries'])
+        self.assertGreater(counts['appointments'], 200)
+
+        today = timezone.localdate()
+        self.assertFalse(Appointment.objects.filter(appointment_date__gt=today).exclude(
+            status__in=['scheduled', 'cancelled']).exists())
+        self.assertFalse(Appointment.objects.filter(status='completed', actual_duration__isnull=True).exists())
+        # Nenhum preparador com dois agendamentos sobrepostos
+        agenda = {}
+        for appointment in Appointment.objects.filter(preparer__isnull=False).order_by('time'):
+            key = (appointment.preparer_id, appointment.appointment_date)
+            start = timezone.datetime.combine(appointment.appointment_date, appointment.time)
+            self.assertLessEqual(agenda.get(key, start), start)
+            agenda[key] = start + appointment.estimated_duration
+
+        # A mesma semente gera os mesmos dados
+        self.assertEqual(self.generate(seed=7)[1], snapshot)
+        self.assertNotEqual(self.generate(seed=8)[1][:20], snapshot[:20])
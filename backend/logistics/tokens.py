@@ -0,0 +1,79 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Branch, UserProfile
+
+# Claim que marca tokens com os dados do usuário embutidos
+PRINCIPAL_CLAIM = 'principal'
+
+
+def principal_claims(user):
+    """Dados do usuário, do perfil e da filial assinados no token."""
+    claims = {
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_superuser': user.is_superuser,
+        PRINCIPAL_CLAIM: None,
+    }
+    try:
+        profile = user.userprofile
+    except ObjectDoesNotExist:
+        return claims
+    claims[PRINCIPAL_CLAIM] = {
+        'profile_id': profile.pk,
+        'employee_id': profile.employee_id,
+        'is_supervisor': profile.is_supervisor,
+        'branch_id': profile.branch_id,
+        'branch_name': profile.branch.name,
+    }
+    return claims
+
+
+class BranchRefreshToken(RefreshToken):
+    """Refresh token cujas claims (e as dos access tokens derivados) descrevem o usuário."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in principal_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class TokenProfile:
+    """Perfil montado a partir das claims; ``branch`` é uma instância não salva só com id e nome."""
+
+    def __init__(self, user, claims):
+        self.id = self.pk = claims['profile_id']
+        self.user = user
+        self.user_id = user.id
+        self.employee_id = claims['employee_id']
+        self.is_supervisor = claims['is_supervisor']
+        self.branch_id = claims['branch_id']
+        self.branch = Branch(id=claims['branch_id'], name=claims['branch_name'])
+
+
+class BranchTokenUser(TokenUser):
+    """Usuário sem banco de dados, com os mesmos atributos que as views leem de ``request.user``."""
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def first_name(self):
+        return self.token.get('first_name', '')
+
+    @cached_property
+    def last_name(self):
+        return self.token.get('last_name', '')
+
+    @cached_property
+    def userprofile(self):
+        claims = self.token.get(PRINCIPAL_CLAIM)
+        if not claims:
+            raise UserProfile.DoesNotExist('Usuário sem perfil')
+        return TokenProfile(self, claims)
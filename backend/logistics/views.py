@@ -1,108 +1,333 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Branch, UserProfile, Vehicle, Appointment, Delivery
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_duration
+from django.utils.duration import duration_string
+from django.utils.http import quote_etag
+from .models import Branch, UserProfile, Vehicle, Appointment, ArchivedAppointment, ArchivedDelivery, Delivery
 from .serializers import (
     BranchSerializer, UserProfileSerializer, VehicleSerializer,
     AppointmentSerializer, DeliverySerializer, LoginSerializer,
     UserCreateSerializer, UserUpdateSerializer, UserSerializer
 )
+from .mixins import (
+    BulkStatusMixin, ConditionalResponseMixin, DeltaSyncMixin, ExportMixin, FlexFieldsViewMixin,
+)
+from .pagination import AppointmentKeysetPagination
+from .filters import filter_appointments, filter_deliveries, parse_day
+from .archive import reaches_archive
+from .board import get_snapshot
+from . import availability
+from .stats import appointment_stats
+from .scheduling import PreparerScheduler
+from . import claims, durations, exports, search
+from .importers import AppointmentImporter, VehicleImporter, MAX_IMPORT_ROWS
+from .parsers import CSVParser, StreamingCSVParser
+from .auth import principal_cache
+from .tokens import BranchRefreshToken, principal_claims
 import logging
 import traceback
+from types import GeneratorType
 
 logger = logging.getLogger(__name__)
 
-class BranchViewSet(viewsets.ModelViewSet):
+class BranchViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     queryset = Branch.objects.all()
     serializer_class = BranchSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(FlexFieldsViewMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        logger.info(f"UserProfileViewSet - User: {user.username}, is_superuser: {user.is_superuser}")
-        
         queryset = UserProfile.objects.all()
-        logger.info(f"Initial queryset count: {queryset.count()}")
-        
+
         # Filtrar por filial
         if not user.is_superuser:
-            branch = user.userprofile.branch
-            logger.info(f"Filtering by branch: {branch.id} - {branch.name}")
-            queryset = queryset.filter(branch=branch)
-            logger.info(f"After branch filter count: {queryset.count()}")
-        
+            queryset = queryset.filter(branch=user.userprofile.branch)
+
         # Filtrar por tipo de usuário (preparador)
         is_preparer = self.request.query_params.get('is_preparer', None)
-        logger.info(f"is_preparer parameter: {is_preparer}")
-        
         if is_preparer is not None:
             is_preparer = is_preparer.lower() == 'true'
-            logger.info(f"Filtering preparers (is_preparer={is_preparer})")
             queryset = queryset.filter(is_supervisor=not is_preparer)
-            logger.info(f"After preparer filter count: {queryset.count()}")
-        
-        # Log dos resultados
-        for profile in queryset:
-            logger.info(f"Profile: {profile.id} - User: {profile.user.username} - Supervisor: {profile.is_supervisor}")
-        
-        return queryset
 
-class VehicleViewSet(viewsets.ModelViewSet):
+        logger.debug(f"UserProfileViewSet - User: {user.username}, is_superuser: {user.is_superuser}, is_preparer: {is_preparer}")
+
+        # user e branch saem aninhados por padrão: carregar no mesmo SELECT
+        return queryset.select_related(*self.get_related_paths())
+
+class VehicleViewSet(ConditionalResponseMixin, viewsets.ModelViewSet):
     queryset = Vehicle.objects.all()
     serializer_class = VehicleSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', search.DEFAULT_LIMIT)), search.MAX_LIMIT)
+        except ValueError:
+            return Response({'error': 'Limite inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'Limite inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        # Índice em memória: nenhuma consulta ao banco depois de carregado
+        return Response({'results': search.vehicle_search.search(query, limit)})
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[JSONParser, StreamingCSVParser])
+    def bulk_import(self, request):
+        rows = request.data
+        if not isinstance(rows, (list, GeneratorType)):
+            return Response(
+                {'error': 'Envie uma lista de veículos (JSON) ou um CSV com cabeçalho'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # CSV chega como gerador: as linhas são gravadas enquanto o corpo é lido
+        report = VehicleImporter().run(rows)
+        if not (report['inserted'] or report['updated'] or report['rejected']):
+            return Response({'error': 'Nenhum veículo para importar'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+class AppointmentViewSet(
+    ConditionalResponseMixin, DeltaSyncMixin, BulkStatusMixin, ExportMixin, FlexFieldsViewMixin,
+    viewsets.ModelViewSet
+):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AppointmentKeysetPagination
+    sync_model = 'appointment'
+    status_event_model = 'appointment'
+    export_columns = exports.APPOINTMENT_COLUMNS
+    export_name = 'agendamentos'
+    validator_fields = (
+        'updated_at', 'vehicle__updated_at', 'branch__updated_at',
+        'preparer__updated_at', 'created_by__updated_at',
+    )
 
     def get_queryset(self):
+        return self.filter_appointments(Appointment.objects.all())
+
+    def get_archive_queryset(self):
+        """
+        Agendamentos arquivados, com os mesmos filtros, só quando o período
+        pedido é aberto ou começa até o dia arquivado mais recente; senão None.
+        """
+        if self.action not in ('list', 'export') or not reaches_archive(self.request.query_params.get('start_date')):
+            return None
+        return self.filter_appointments(ArchivedAppointment.objects.all())
+
+    def get_export_querysets(self):
+        archived = self.get_archive_queryset()
+        # Arquivo primeiro: são os agendamentos mais antigos
+        return [self.get_queryset()] if archived is None else [archived, self.get_queryset()]
+
+    def paginate_queryset(self, queryset):
+        archived = self.get_archive_queryset()
+        if archived is None:
+            return super().paginate_queryset(queryset)
+        return self.paginator.paginate_querysets([queryset, archived], self.request, view=self)
+
+    def filter_appointments(self, queryset):
         user = self.request.user
-        queryset = Appointment.objects.all()
-        
-        # Filtrar por filial
-        if not user.is_superuser:
-            queryset = queryset.filter(branch=user.userprofile.branch)
-        
-        # Filtrar por data
-        start_date = self.request.query_params.get('start_date', None)
-        end_date = self.request.query_params.get('end_date', None)
-        
-        if start_date:
-            queryset = queryset.filter(appointment_date__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(appointment_date__lte=end_date)
-        
-        # Filtrar por status
-        status = self.request.query_params.get('status', None)
-        if status:
-            queryset = queryset.filter(status=status)
-        
-        # Filtrar por preparador
-        preparer = self.request.query_params.get('preparer', None)
-        if preparer:
-            queryset = queryset.filter(preparer_id=preparer)
-        
-        # Filtrar por prioridade
-        priority = self.request.query_params.get('priority', None)
-        if priority is not None:
-            priority = priority.lower() == 'true'
-            queryset = queryset.filter(priority=priority)
-        
-        return queryset.select_related('vehicle', 'branch', 'preparer', 'created_by')
+        branch_id = None if user.is_superuser else user.userprofile.branch_id
+        queryset = filter_appointments(queryset, self.request.query_params, branch_id)
+        # Só entram no JOIN as relações que serão expandidas na resposta
+        return queryset.select_related(*self.get_related_paths())
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user.userprofile)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[JSONParser, CSVParser])
+    def bulk_import(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {'error': 'Envie uma lista de agendamentos (JSON) ou um CSV com cabeçalho'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not rows:
+            return Response({'error': 'Nenhum agendamento para importar'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_IMPORT_ROWS:
+            return Response(
+                {'error': f'Máximo de {MAX_IMPORT_ROWS} agendamentos por importação'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        importer = AppointmentImporter(request.user.userprofile, superuser=request.user.is_superuser)
+        created, errors = importer.run(rows)
+        if errors:
+            return Response({'created': 0, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': created}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        params = request.query_params
+        user = request.user
+        scope = 'all' if user.is_superuser else user.userprofile.branch_id
+        cache_key = f'appointment-stats:{scope}:{request.get_full_path()}'
+        data = cache.get(cache_key)
+        if data is None:
+            # get_queryset já aplica filial, período, status, preparador e prioridade
+            queryset = self.get_queryset()
+            if not params.get('start_date') and not params.get('end_date'):
+                queryset = queryset.filter(appointment_date=timezone.localdate())
+            data = appointment_stats(queryset)
+            ttl = getattr(settings, 'STATS_CACHE_TTL', 30)
+            if ttl:
+                cache.set(cache_key, data, ttl)
+        return Response(data)
+
+    def requested_branch_id(self, request):
+        """Filial do usuário; superusuários podem escolher com ``?branch=``."""
+        user = request.user
+        branch_id = request.query_params.get('branch') if user.is_superuser else None
+        if branch_id is None:
+            try:
+                branch_id = user.userprofile.branch_id
+            except UserProfile.DoesNotExist:
+                return None, Response({'error': 'Informe a filial'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return int(branch_id), None
+        except ValueError:
+            return None, Response({'error': 'Filial inválida'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        params = request.query_params
+        day = parse_day(params['date']) if params.get('date') else timezone.localdate()
+        if day is None:
+            return Response({'error': 'Data inválida. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        min_length = parse_duration(params['duration']) if params.get('duration') else None
+        if params.get('duration') and min_length is None:
+            return Response({'error': 'Duração inválida. Use HH:MM:SS'}, status=status.HTTP_400_BAD_REQUEST)
+        min_length = int(min_length.total_seconds()) if min_length else 0
+        branch_id, error = self.requested_branch_id(request)
+        if error:
+            return error
+
+        preparers = UserProfile.objects.filter(branch_id=branch_id, is_supervisor=False)
+        if params.get('preparer'):
+            if not params['preparer'].isdigit():
+                return Response({'error': 'Preparador inválido'}, status=status.HTTP_400_BAD_REQUEST)
+            preparers = preparers.filter(pk=params['preparer'])
+        preparers = preparers.order_by('pk').values_list('pk', 'user__username')
+
+        # Ocupação do dia vem do índice em cache; só a lista de preparadores vai ao banco
+        index = availability.get_index(branch_id, day)
+        window = availability.availability_window(day)
+
+        def free(kind, resource):
+            return [
+                {'start': availability.format_seconds(start), 'end': availability.format_seconds(end)}
+                for start, end in availability.free_intervals(index.busy(kind, resource), *window, min_length)
+            ]
+
+        opening, closing = availability.working_hours()
+        data = {
+            'date': day.isoformat(),
+            'branch': branch_id,
+            'working_hours': {'start': availability.format_seconds(opening), 'end': availability.format_seconds(closing)},
+            'preparers': [
+                {'id': pk, 'username': username, 'free': free('preparer', pk)} for pk, username in preparers
+            ],
+        }
+        if params.get('vehicle'):
+            if not params['vehicle'].isdigit():
+                return Response({'error': 'Veículo inválido'}, status=status.HTTP_400_BAD_REQUEST)
+            vehicle_id = int(params['vehicle'])
+            data['vehicle'] = {'id': vehicle_id, 'free': free('vehicle', vehicle_id)}
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def auto_assign(self, request):
+        if not request.user.is_superuser:
+            try:
+                profile = request.user.userprofile
+            except UserProfile.DoesNotExist:
+                return Response({'error': 'Perfil de usuário não encontrado'}, status=status.HTTP_404_NOT_FOUND)
+            if not profile.is_supervisor:
+                return Response(
+                    {'error': 'Apenas supervisores distribuem os agendamentos'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
+        day = request.data.get('date')
+        day = parse_day(day) if day else timezone.localdate()
+        if day is None:
+            return Response({'error': 'Data inválida. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        branch_id, error = self.requested_branch_id(request)
+        if error:
+            return error
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        return Response(PreparerScheduler(branch_id, day).run(dry_run=dry_run))
+
+    @action(detail=False, methods=['post'])
+    def claim_next(self, request):
+        day = request.data.get('date')
+        day = parse_day(day) if day else timezone.localdate()
+        if day is None:
+            return Response({'error': 'Data inválida. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            profile = request.user.userprofile
+        except UserProfile.DoesNotExist:
+            return Response({'error': 'Perfil de usuário não encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        if profile.is_supervisor:
+            return Response(
+                {'error': 'Apenas preparadores pegam agendamentos da fila'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        appointment = claims.claim_next(profile, day)
+        if appointment is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(self.get_serializer(appointment).data)
+
+    @action(detail=False, methods=['get'])
+    def duration_estimate(self, request):
+        vehicle_id = request.query_params.get('vehicle', '')
+        preparer_id = request.query_params.get('preparer', '')
+        if not vehicle_id.isdigit() or (preparer_id and not preparer_id.isdigit()):
+            return Response({'error': 'Informe vehicle (e opcionalmente preparer) numéricos'}, status=status.HTTP_400_BAD_REQUEST)
+        vehicle_model = Vehicle.objects.filter(pk=vehicle_id).values_list('model', flat=True).first()
+        if vehicle_model is None:
+            return Response({'error': 'Veículo não encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+        duration, source = durations.estimate(vehicle_model, int(preparer_id) if preparer_id else None)
+        return Response({'estimated_duration': duration_string(duration), 'source': source})
+
+    @action(detail=False, methods=['get'])
+    def board(self, request):
+        day = request.query_params.get('date')
+        day = parse_day(day) if day else timezone.localdate()
+        if day is None:
+            return Response({'error': 'Data inválida. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch_id, error = self.requested_branch_id(request)
+        if error:
+            return error
+
+        # Painel pré-calculado e mantido pelos sinais; o ETag é a versão do painel
+        snapshot = get_snapshot(branch_id, day)
+        etag = quote_etag(snapshot['version'])
+        response = get_conditional_response(request, etag=etag) or Response(snapshot)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         appointment = self.get_object()
@@ -120,8 +345,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Só o status muda: não regravar as demais colunas nem recalcular delivery_date
         appointment.status = new_status
-        appointment.save()
+        appointment.save(update_fields=['status', 'updated_at'])
         
         return Response(self.get_serializer(appointment).data)
 
@@ -136,21 +362,50 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        appointment.actual_duration = actual_duration
+        duration = parse_duration(str(actual_duration))
+        if duration is None:
+            return Response(
+                {'error': 'Duração inválida. Use HH:MM:SS'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        appointment.actual_duration = duration
         appointment.save()
         
         return Response(self.get_serializer(appointment).data)
 
-class DeliveryViewSet(viewsets.ModelViewSet):
+class DeliveryViewSet(
+    ConditionalResponseMixin, DeltaSyncMixin, BulkStatusMixin, ExportMixin, FlexFieldsViewMixin,
+    viewsets.ModelViewSet
+):
     queryset = Delivery.objects.all()
     serializer_class = DeliverySerializer
     permission_classes = [permissions.IsAuthenticated]
+    sync_model = 'delivery'
+    status_event_model = 'delivery'
+    export_columns = exports.DELIVERY_COLUMNS
+    export_name = 'entregas'
+    status_branch_field = 'appointment__branch_id'
+    validator_fields = (
+        'updated_at', 'appointment__updated_at', 'appointment__vehicle__updated_at',
+        'appointment__branch__updated_at', 'appointment__preparer__updated_at',
+        'appointment__created_by__updated_at',
+    )
 
     def get_queryset(self):
+        return self.filter_deliveries(Delivery.objects.all())
+
+    def filter_deliveries(self, queryset):
         user = self.request.user
-        if user.is_superuser:
-            return Delivery.objects.all()
-        return Delivery.objects.filter(appointment__branch=user.userprofile.branch)
+        branch_id = None if user.is_superuser else user.userprofile.branch_id
+        queryset = filter_deliveries(queryset, self.request.query_params, branch_id)
+        return queryset.select_related(*self.get_related_paths())
+
+    def get_export_querysets(self):
+        querysets = [self.get_queryset()]
+        if reaches_archive(self.request.query_params.get('start_date')):
+            querysets.insert(0, self.filter_deliveries(ArchivedDelivery.objects.all()))
+        return querysets
 
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
@@ -185,10 +440,12 @@ class AuthViewSet(viewsets.ViewSet):
                 if user.check_password(password):
                     logger.info("Password check passed")
                     try:
-                        user_profile = UserProfile.objects.get(user=user, branch_id=branch_id)
+                        user_profile = UserProfile.objects.select_related('branch').get(user=user, branch_id=branch_id)
+                        user.userprofile = user_profile
                         logger.info(f"User profile found: {user_profile.id}")
                         
-                        refresh = RefreshToken.for_user(user)
+                        # Filial e papel vão assinados no token (ver ClaimsJWTAuthentication)
+                        refresh = BranchRefreshToken.for_user(user)
                         response_data = {
                             'token': str(refresh.access_token),
                             'refresh': str(refresh),
@@ -244,7 +501,8 @@ class AuthViewSet(viewsets.ViewSet):
                 )
             
             user = request.user
-            user_profile = UserProfile.objects.get(user=user)
+            # Perfil e filial já vêm carregados pela autenticação
+            user_profile = user.userprofile
             
             response_data = {
                 'id': user.id,
@@ -285,8 +543,18 @@ class AuthViewSet(viewsets.ViewSet):
                 )
             
             refresh = RefreshToken(refresh_token)
+            access = refresh.access_token
+            # Reemitir as claims com os dados atuais do usuário
+            user = principal_cache.get(refresh[api_settings.USER_ID_CLAIM])
+            if user is None or not user.is_active:
+                return Response(
+                    {'error': 'Usuário não encontrado ou inativo'},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+            for claim, value in principal_claims(user).items():
+                access[claim] = value
             response_data = {
-                'token': str(refresh.access_token),
+                'token': str(access),
                 'refresh': str(refresh)
             }
             return Response(response_data)
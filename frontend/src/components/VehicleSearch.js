@@ -0,0 +1,77 @@
+import React, { useEffect, useRef, useState } from 'react';
+import api from '../services/api';
+
+// Espera entre teclas antes de consultar /api/vehicles/search/
+const SEARCH_DELAY = 200;
+
+const describe = (vehicle) => `${vehicle.model} - ${vehicle.color} - ${vehicle.chassi}`;
+
+export default function VehicleSearch({ value, onSelect, className }) {
+  const [query, setQuery] = useState(value ? describe(value) : '');
+  const [results, setResults] = useState([]);
+  const [open, setOpen] = useState(false);
+  const latest = useRef(0);
+
+  useEffect(() => {
+    if (value) {
+      setQuery(describe(value));
+    }
+  }, [value]);
+
+  useEffect(() => {
+    if (!open || !query.trim()) {
+      setResults([]);
+      return undefined;
+    }
+    const request = ++latest.current;
+    const timeout = setTimeout(() => {
+      api.get('/api/vehicles/search/', { params: { q: query, limit: 10 } })
+        .then((response) => {
+          // Respostas fora de ordem de buscas anteriores são descartadas
+          if (request === latest.current) {
+            setResults(response.data.results);
+          }
+        })
+        .catch(() => setResults([]));
+    }, SEARCH_DELAY);
+    return () => clearTimeout(timeout);
+  }, [query, open]);
+
+  const choose = (vehicle) => {
+    setQuery(describe(vehicle));
+    setOpen(false);
+    onSelect(vehicle);
+  };
+
+  return (
+    <div className="relative">
+      <input
+        type="text"
+        value={query}
+        placeholder="Buscar por chassi ou modelo"
+        onChange={(e) => {
+          setQuery(e.target.value);
+          setOpen(true);
+          onSelect(null);
+        }}
+        onFocus={() => setOpen(true)}
+        onBlur={() => setTimeout(() => setOpen(false), 150)}
+        className={className}
+      />
+      {open && results.length > 0 && (
+        <ul className="absolute z-10 mt-1 w-full bg-white shadow-lg max-h-60 rounded-md py-1 text-sm overflow-auto border border-gray-200">
+          {results.map((vehicle) => (
+            <li
+              key={vehicle.id}
+              onMouseDown={() => choose(vehicle)}
+              className="cursor-pointer px-3 py-2 hover:bg-indigo-50"
+            >
+              <span className="font-medium">{vehicle.chassi}</span>
+              <span className="text-gray-500"> - {vehicle.model} - {vehicle.color}</span>
+            </li>
+          ))}
+        </ul>
+      )}
+    </div>
+  );
+}
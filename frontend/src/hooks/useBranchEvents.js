@@ -0,0 +1,75 @@
+import { useEffect, useRef, useState } from 'react';
+import api from '../services/api';
+
+const buildSocketUrl = (branchId, token) => {
+  const base = api.defaults.baseURL.replace(/^http/, 'ws');
+  return `${base}/ws/branches/${branchId}/?token=${encodeURIComponent(token)}`;
+};
+
+// Assina os eventos de agendamentos/entregas da filial via WebSocket.
+// Reconecta com backoff e informa se a conexão está ativa, para que as
+// páginas só façam polling quando o socket estiver fora do ar.
+export function useBranchEvents(branchId, onEvent) {
+  const [connected, setConnected] = useState(false);
+  const handlerRef = useRef(onEvent);
+
+  useEffect(() => {
+    handlerRef.current = onEvent;
+  }, [onEvent]);
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!branchId || !token) {
+      return undefined;
+    }
+
+    let socket = null;
+    let retryTimeout = null;
+    let pingInterval = null;
+    let attempts = 0;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(buildSocketUrl(branchId, token));
+
+      socket.onopen = () => {
+        attempts = 0;
+        setConnected(true);
+        pingInterval = setInterval(() => {
+          socket.send(JSON.stringify({ type: 'ping' }));
+        }, 25000);
+      };
+
+      socket.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        if (event.model && handlerRef.current) {
+          handlerRef.current(event);
+        }
+      };
+
+      socket.onclose = (event) => {
+        setConnected(false);
+        clearInterval(pingInterval);
+        // 4401/4403: token inválido ou filial não permitida, não adianta reconectar
+        if (closed || event.code === 4401 || event.code === 4403) {
+          return;
+        }
+        attempts += 1;
+        retryTimeout = setTimeout(connect, Math.min(30000, 1000 * 2 ** attempts));
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimeout);
+      clearInterval(pingInterval);
+      if (socket) {
+        socket.close();
+      }
+    };
+  }, [branchId]);
+
+  return connected;
+}
@@ -1,30 +1,30 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import api from '../services/api';
+import { useAuth } from '../hooks/useAuth';
+import { useBranchEvents } from '../hooks/useBranchEvents';
 import { format } from 'date-fns';
 import { ptBR } from 'date-fns/locale';
 
 const AppointmentBoard = () => {
   const navigate = useNavigate();
+  const { user } = useAuth();
+  const refreshTimeout = useRef(null);
   const [appointments, setAppointments] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [filter, setFilter] = useState('today'); // today, week, all
 
-  useEffect(() => {
-    fetchAppointments();
-    // Atualizar a cada 30 segundos
-    const interval = setInterval(fetchAppointments, 30000);
-    return () => clearInterval(interval);
-  }, [filter]);
-
-  const fetchAppointments = async () => {
+  const fetchAppointments = useCallback(async (silent = false) => {
     try {
-      setLoading(true);
+      if (!silent) {
+        setLoading(true);
+      }
       setError(null);
       let url = '/api/appointments/';
       const params = new URLSearchParams();
+      params.append('expand', 'vehicle,preparer.user');
       
       if (filter === 'today') {
         const today = format(new Date(), 'yyyy-MM-dd');
@@ -38,7 +38,7 @@ const AppointmentBoard = () => {
       }
       
       const response = await api.get(url, { params });
-      setAppointments(response.data);
+      setAppointments(response.data.results);
     } catch (error) {
       console.error('Erro ao carregar agendamentos:', error);
       setError('Erro ao carregar agendamentos. Por favor, tente novamente.');
@@ -46,7 +46,25 @@ const AppointmentBoard = () => {
     } finally {
       setLoading(false);
     }
-  };
+  }, [filter]);
+
+  // Agrupa rajadas de eventos em um único recarregamento silencioso
+  const handleEvent = useCallback(() => {
+    clearTimeout(refreshTimeout.current);
+    refreshTimeout.current = setTimeout(() => fetchAppointments(true), 500);
+  }, [fetchAppointments]);
+
+  const connected = useBranchEvents(user?.branch?.id, handleEvent);
+
+  useEffect(() => {
+    fetchAppointments();
+    // Atualizar a cada 30 segundos apenas enquanto o WebSocket estiver desconectado
+    if (connected) {
+      return () => clearTimeout(refreshTimeout.current);
+    }
+    const interval = setInterval(() => fetchAppointments(true), 30000);
+    return () => clearInterval(interval);
+  }, [fetchAppointments, connected]);
 
   const getStatusColor = (status) => {
     switch (status) {
@@ -152,7 +170,7 @@ const AppointmentBoard = () => {
             <div className="col-span-full text-center py-12">
               <p className="text-red-600">{error}</p>
               <button
-                onClick={fetchAppointments}
+                onClick={() => fetchAppointments()}
                 className="mt-4 px-4 py-2 bg-indigo-600 text-white rounded-md hover:bg-indigo-700"
               >
                 Tentar Novamente
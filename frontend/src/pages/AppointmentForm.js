@@ -4,18 +4,18 @@ import { useForm } from 'react-hook-form';
 import { toast } from 'react-toastify';
 import api from '../services/api';
 import { useAuth } from '../hooks/useAuth';
+import VehicleSearch from '../components/VehicleSearch';
 
 const AppointmentForm = () => {
   const navigate = useNavigate();
   const { user } = useAuth();
   const [loading, setLoading] = React.useState(false);
   const [preparers, setPreparers] = React.useState([]);
-  const [vehicles, setVehicles] = React.useState([]);
+  const [vehicle, setVehicle] = React.useState(null);
   const { register, handleSubmit, formState: { errors }, watch, setValue } = useForm();
 
   React.useEffect(() => {
     fetchPreparers();
-    fetchVehicles();
   }, []);
 
   const fetchPreparers = async () => {
@@ -35,16 +35,6 @@ const AppointmentForm = () => {
     }
   };
 
-  const fetchVehicles = async () => {
-    try {
-      const response = await api.get('/api/vehicles/');
-      setVehicles(response.data);
-    } catch (error) {
-      console.error('Erro ao carregar veículos:', error);
-      toast.error('Erro ao carregar veículos');
-    }
-  };
-
   const onSubmit = async (data) => {
     setLoading(true);
     try {
@@ -129,17 +119,16 @@ const AppointmentForm = () => {
 
           <div>
             <label className="block text-sm font-medium text-gray-700">Veículo</label>
-            <select
-              {...register('vehicle_id', { required: 'Veículo é obrigatório' })}
+            {/* Busca no servidor em vez de carregar o catálogo inteiro de veículos */}
+            <input type="hidden" {...register('vehicle_id', { required: 'Veículo é obrigatório' })} />
+            <VehicleSearch
+              value={vehicle}
+              onSelect={(selected) => {
+                setVehicle(selected);
+                setValue('vehicle_id', selected ? selected.id : '', { shouldValidate: Boolean(selected) });
+              }}
               className="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500"
-            >
-              <option value="">Selecione um veículo</option>
-              {vehicles.map((vehicle) => (
-                <option key={vehicle.id} value={vehicle.id}>
-                  {vehicle.model} - {vehicle.color} - {vehicle.chassi}
-                </option>
-              ))}
-            </select>
+            />
             {errors.vehicle_id && (
               <p className="mt-1 text-sm text-red-600">{errors.vehicle_id.message}</p>
             )}
@@ -1,37 +1,69 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { toast } from 'react-toastify';
 import { format } from 'date-fns';
 import { ptBR } from 'date-fns/locale';
 import { useAuth } from '../hooks/useAuth';
+import { useBranchEvents } from '../hooks/useBranchEvents';
 import api from '../services/api';
 
+const STATUS_LABELS = {
+  scheduled: 'Agendados',
+  in_progress: 'Em Andamento',
+  completed: 'Concluídos',
+  cancelled: 'Cancelados',
+};
+
 export default function Dashboard() {
   const { user } = useAuth();
   const [appointments, setAppointments] = useState([]);
+  const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
 
-  useEffect(() => {
-    fetchAppointments();
-    const interval = setInterval(fetchAppointments, 30000); // Refresh every 30 seconds
-    return () => clearInterval(interval);
-  }, []);
+  const refreshTimeout = useRef(null);
 
-  const fetchAppointments = async () => {
+  const fetchAppointments = useCallback(async () => {
     try {
-      const response = await api.get('/api/appointments/', {
-        params: {
-          branch: user?.branch,
-        },
-      });
-      setAppointments(response.data);
+      // Contagens agregadas no servidor; a lista traz só os próximos agendamentos.
+      // A paginação é crescente por data: sem start_date viriam os mais antigos.
+      // A filial vem do token no servidor, não de parâmetro.
+      const [response, statsResponse] = await Promise.all([
+        api.get('/api/appointments/', {
+          params: {
+            start_date: format(new Date(), 'yyyy-MM-dd'),
+            expand: 'vehicle,preparer.user',
+            page_size: 10,
+          },
+        }),
+        api.get('/api/appointments/stats/'),
+      ]);
+      setAppointments(response.data.results);
+      setStats(statsResponse.data);
     } catch (error) {
       console.error('Erro ao carregar agendamentos:', error);
       toast.error('Erro ao carregar agendamentos');
     } finally {
       setLoading(false);
     }
-  };
+  }, []);
+
+  // Agrupa rajadas de eventos em um único recarregamento
+  const handleEvent = useCallback(() => {
+    clearTimeout(refreshTimeout.current);
+    refreshTimeout.current = setTimeout(fetchAppointments, 500);
+  }, [fetchAppointments]);
+
+  const connected = useBranchEvents(user?.branch?.id, handleEvent);
+
+  useEffect(() => {
+    fetchAppointments();
+    // Polling apenas enquanto o WebSocket estiver desconectado
+    if (connected) {
+      return () => clearTimeout(refreshTimeout.current);
+    }
+    const interval = setInterval(fetchAppointments, 30000); // Refresh every 30 seconds
+    return () => clearInterval(interval);
+  }, [fetchAppointments, connected]);
 
   const getWashDate = (appointmentDate) => {
     const date = new Date(appointmentDate);
@@ -70,6 +102,22 @@ export default function Dashboard() {
         </div>
       </div>
 
+      {/* Resumo do dia */}
+      {stats && (
+        <div className="grid grid-cols-2 gap-4 sm:grid-cols-5">
+          <div className="bg-white shadow rounded-lg p-4">
+            <p className="text-sm font-medium text-gray-500">Hoje</p>
+            <p className="mt-1 text-2xl font-semibold text-gray-900">{stats.total.count}</p>
+          </div>
+          {stats.by_status.map((row) => (
+            <div key={row.key} className="bg-white shadow rounded-lg p-4">
+              <p className="text-sm font-medium text-gray-500">{STATUS_LABELS[row.key] || row.key}</p>
+              <p className="mt-1 text-2xl font-semibold text-gray-900">{row.count}</p>
+            </div>
+          ))}
+        </div>
+      )}
+
       {/* Seção de Cadastros */}
       <div className="bg-white shadow sm:rounded-lg">
         <div className="px-4 py-5 sm:p-6">
@@ -121,7 +169,7 @@ export default function Dashboard() {
       <div className="bg-white shadow sm:rounded-lg">
         <div className="px-4 py-5 sm:p-6">
           <h3 className="text-lg font-medium leading-6 text-gray-900 mb-4">
-            Agendamentos Recentes
+            Próximos Agendamentos
           </h3>
           <ul className="divide-y divide-gray-200">
             {appointments.length === 0 ? (
@@ -1,39 +1,47 @@
-import React, { useEffect, useState } from 'react';
-import axios from 'axios';
-import { format, addDays } from 'date-fns';
-import { ptBR } from 'date-fns/locale';
+import React, { useCallback, useEffect, useRef, useState } from 'react';
 import { useAuth } from '../hooks/useAuth';
+import { useBranchEvents } from '../hooks/useBranchEvents';
+import api from '../services/api';
 
 export default function DisplayBoard() {
   const { user } = useAuth();
-  const [appointments, setAppointments] = useState([]);
+  const branchId = user?.branch?.id;
+  const [board, setBoard] = useState(null);
   const [loading, setLoading] = useState(true);
+  const refreshTimeout = useRef(null);
+
+  // Painel pronto para exibir: colunas por status, já ordenadas e formatadas pelo servidor
+  const fetchBoard = useCallback(async () => {
+    try {
+      const response = await api.get('/api/appointments/board/', {
+        params: { branch: branchId },
+      });
+      setBoard(response.data);
+    } catch (error) {
+      console.error('Erro ao carregar painel:', error);
+    } finally {
+      setLoading(false);
+    }
+  }, [branchId]);
+
+  // Agrupa rajadas de eventos em um único recarregamento
+  const handleEvent = useCallback(() => {
+    clearTimeout(refreshTimeout.current);
+    refreshTimeout.current = setTimeout(fetchBoard, 500);
+  }, [fetchBoard]);
+
+  const connected = useBranchEvents(branchId, handleEvent);
 
   useEffect(() => {
-    const fetchAppointments = async () => {
-      try {
-        const response = await axios.get('http://localhost:8000/api/appointments/', {
-          params: {
-            branch: user.branch,
-          },
-        });
-        setAppointments(response.data);
-      } catch (error) {
-        console.error('Erro ao carregar agendamentos:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
-
-    fetchAppointments();
-    const interval = setInterval(fetchAppointments, 30000); // Atualiza a cada 30 segundos
+    fetchBoard();
+    // Polling apenas enquanto o WebSocket estiver desconectado
+    if (connected) {
+      return () => clearTimeout(refreshTimeout.current);
+    }
+    const interval = setInterval(fetchBoard, 30000); // Atualiza a cada 30 segundos
 
     return () => clearInterval(interval);
-  }, [user.branch]);
-
-  const getWashDate = (appointmentDate) => {
-    return format(addDays(new Date(appointmentDate), 3), 'dd/MM/yyyy', { locale: ptBR });
-  };
+  }, [fetchBoard, connected]);
 
   if (loading) {
     return (
@@ -43,70 +51,86 @@ export default function DisplayBoard() {
     );
   }
 
+  const buckets = (board?.buckets || []).filter((bucket) => bucket.count > 0);
+
   return (
     <div className="bg-white shadow sm:rounded-lg">
       <div className="px-4 py-5 sm:p-6">
         <h3 className="text-2xl font-bold text-center text-gray-900 mb-8">
           Agendamentos de Lavagem
+          {board?.branch?.name && (
+            <span className="block text-base font-medium text-gray-500 mt-1">{board.branch.name}</span>
+          )}
         </h3>
 
-        <div className="grid grid-cols-1 gap-6 sm:grid-cols-2 lg:grid-cols-3">
-          {appointments.map((appointment) => (
-            <div
-              key={appointment.id}
-              className="bg-white overflow-hidden shadow rounded-lg border border-gray-200"
-            >
-              <div className="px-4 py-5 sm:p-6">
-                <div className="flex items-center justify-between mb-4">
-                  <h4 className="text-lg font-medium text-gray-900">
-                    {appointment.vehicle.model}
-                  </h4>
-                  <span className="px-2 py-1 text-xs font-semibold rounded-full bg-primary-100 text-primary-800">
-                    {appointment.branch.name}
-                  </span>
-                </div>
+        {buckets.map((bucket) => (
+          <section key={bucket.status} className="mb-10">
+            <h4 className="text-xl font-semibold text-gray-800 mb-4">
+              {bucket.label}
+              <span className="ml-2 px-2 py-1 text-sm font-semibold rounded-full bg-gray-100 text-gray-700">
+                {bucket.count}
+              </span>
+            </h4>
 
-                <dl className="grid grid-cols-1 gap-x-4 gap-y-4">
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Cor</dt>
-                    <dd className="mt-1 text-sm text-gray-900">{appointment.vehicle.color}</dd>
-                  </div>
+            <div className="grid grid-cols-1 gap-6 sm:grid-cols-2 lg:grid-cols-3">
+              {bucket.appointments.map((appointment) => (
+                <div
+                  key={appointment.id}
+                  className="bg-white overflow-hidden shadow rounded-lg border border-gray-200"
+                >
+                  <div className="px-4 py-5 sm:p-6">
+                    <div className="flex items-center justify-between mb-4">
+                      <h4 className="text-lg font-medium text-gray-900">
+                        {appointment.vehicle.model}
+                      </h4>
+                      <span className="px-2 py-1 text-xs font-semibold rounded-full bg-primary-100 text-primary-800">
+                        {appointment.priority_label}
+                      </span>
+                    </div>
 
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Chassi</dt>
-                    <dd className="mt-1 text-sm text-gray-900">{appointment.vehicle.chassi}</dd>
-                  </div>
+                    <dl className="grid grid-cols-1 gap-x-4 gap-y-4">
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Cor</dt>
+                        <dd className="mt-1 text-sm text-gray-900">{appointment.vehicle.color}</dd>
+                      </div>
 
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Data de Lavagem</dt>
-                    <dd className="mt-1 text-sm text-gray-900">
-                      {getWashDate(appointment.appointment_date)}
-                    </dd>
-                  </div>
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Chassi</dt>
+                        <dd className="mt-1 text-sm text-gray-900">{appointment.vehicle.chassi}</dd>
+                      </div>
 
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Preparador</dt>
-                    <dd className="mt-1 text-sm text-gray-900">
-                      {appointment.preparer?.user.username || 'Não atribuído'}
-                    </dd>
-                  </div>
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Data de Lavagem</dt>
+                        <dd className="mt-1 text-sm text-gray-900">{appointment.wash_date}</dd>
+                      </div>
 
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Horário</dt>
-                    <dd className="mt-1 text-sm text-gray-900">{appointment.time}</dd>
-                  </div>
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Preparador</dt>
+                        <dd className="mt-1 text-sm text-gray-900">
+                          {appointment.preparer || 'Não atribuído'}
+                        </dd>
+                      </div>
+
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Horário</dt>
+                        <dd className="mt-1 text-sm text-gray-900">
+                          {appointment.time} – {appointment.estimated_end}
+                        </dd>
+                      </div>
 
-                  <div>
-                    <dt className="text-sm font-medium text-gray-500">Vendedor</dt>
-                    <dd className="mt-1 text-sm text-gray-900">{appointment.seller}</dd>
+                      <div>
+                        <dt className="text-sm font-medium text-gray-500">Vendedor</dt>
+                        <dd className="mt-1 text-sm text-gray-900">{appointment.seller}</dd>
+                      </div>
+                    </dl>
                   </div>
-                </dl>
-              </div>
+                </div>
+              ))}
             </div>
-          ))}
-        </div>
+          </section>
+        ))}
 
-        {appointments.length === 0 && (
+        {buckets.length === 0 && (
           <div className="text-center py-12">
             <p className="text-gray-500">Nenhum agendamento encontrado.</p>
           </div>
@@ -114,4 +138,4 @@ export default function DisplayBoard() {
       </div>
     </div>
   );
-} 
\ No newline at end of file
+}
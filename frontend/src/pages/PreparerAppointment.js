@@ -14,8 +14,12 @@ const PreparerAppointment = () => {
 
   const fetchAppointments = async () => {
     try {
-      const response = await api.get('/api/appointments/');
-      setAppointments(response.data);
+      const response = await api.get('/api/appointments/', {
+        params: {
+          expand: 'vehicle',
+        },
+      });
+      setAppointments(response.data.results);
     } catch (error) {
       console.error('Erro ao carregar agendamentos:', error);
       toast.error('Erro ao carregar agendamentos');
@@ -24,6 +28,22 @@ const PreparerAppointment = () => {
     }
   };
 
+  // Pega o próximo agendamento da fila da filial; o servidor garante que ninguém mais recebe o mesmo
+  const handleClaimNext = async () => {
+    try {
+      const response = await api.post('/api/appointments/claim_next/');
+      if (response.status === 204) {
+        toast.info('Nenhum agendamento na fila');
+        return;
+      }
+      toast.success(`Agendamento de ${response.data.client} iniciado`);
+      fetchAppointments();
+    } catch (error) {
+      console.error('Erro ao pegar agendamento:', error);
+      toast.error(error.response?.data?.error || 'Erro ao pegar agendamento');
+    }
+  };
+
   const handleStatusChange = async (appointmentId, newStatus) => {
     try {
       await api.patch(`/api/appointments/${appointmentId}/`, {
@@ -41,7 +61,15 @@ const PreparerAppointment = () => {
     <div className="min-h-screen bg-gray-100">
       <div className="max-w-7xl mx-auto py-6 sm:px-6 lg:px-8">
         <div className="px-4 py-6 sm:px-0">
-          <h1 className="text-3xl font-bold text-gray-900">Meus Agendamentos</h1>
+          <div className="flex justify-between items-center">
+            <h1 className="text-3xl font-bold text-gray-900">Meus Agendamentos</h1>
+            <button
+              onClick={handleClaimNext}
+              className="px-4 py-2 rounded-md text-sm font-medium text-white bg-indigo-600 hover:bg-indigo-700"
+            >
+              Pegar próximo
+            </button>
+          </div>
           
           {loading ? (
             <div className="mt-8 text-center">
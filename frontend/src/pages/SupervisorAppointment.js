@@ -6,13 +6,14 @@ import { format } from 'date-fns';
 import { ptBR } from 'date-fns/locale';
 import api from '../services/api';
 import { useAuth } from '../hooks/useAuth';
+import VehicleSearch from '../components/VehicleSearch';
 
 const SupervisorAppointment = () => {
   const navigate = useNavigate();
   const { user } = useAuth();
   const [loading, setLoading] = useState(false);
   const [preparers, setPreparers] = useState([]);
-  const [vehicles, setVehicles] = useState([]);
+  const [vehicle, setVehicle] = useState(null);
   const [showPreparerModal, setShowPreparerModal] = useState(false);
   const [newPreparer, setNewPreparer] = useState({
     first_name: '',
@@ -24,23 +25,33 @@ const SupervisorAppointment = () => {
   });
   const { register, handleSubmit, formState: { errors }, watch, setValue } = useForm();
 
-  const watchVehicleId = watch('vehicle_id');
+  const watchDate = watch('appointment_date');
+  const watchPreparer = watch('preparer');
+  const [freeSlots, setFreeSlots] = useState(null);
 
   useEffect(() => {
     fetchPreparers();
-    fetchVehicles();
   }, []);
 
+  const selectVehicle = (selected) => {
+    setVehicle(selected);
+    setValue('vehicle_id', selected ? selected.id : '', { shouldValidate: Boolean(selected) });
+    setValue('model', selected ? selected.model : '');
+    setValue('color', selected ? selected.color : '');
+    setValue('chassi', selected ? selected.chassi : '');
+  };
+
+  // Horários livres do preparador no dia escolhido
   useEffect(() => {
-    if (watchVehicleId) {
-      const selectedVehicle = vehicles.find(v => v.id === parseInt(watchVehicleId));
-      if (selectedVehicle) {
-        setValue('model', selectedVehicle.model);
-        setValue('color', selectedVehicle.color);
-        setValue('chassi', selectedVehicle.chassi);
-      }
+    const date = watchDate ? watchDate.split('T')[0] : null;
+    if (!date || !watchPreparer) {
+      setFreeSlots(null);
+      return;
     }
-  }, [watchVehicleId, vehicles, setValue]);
+    api.get('/api/appointments/availability/', { params: { date, preparer: watchPreparer } })
+      .then((response) => setFreeSlots(response.data.preparers[0]?.free || []))
+      .catch(() => setFreeSlots(null));
+  }, [watchDate, watchPreparer]);
 
   const fetchPreparers = async () => {
     try {
@@ -74,16 +85,6 @@ const SupervisorAppointment = () => {
     }
   };
 
-  const fetchVehicles = async () => {
-    try {
-      const response = await api.get('/api/vehicles/');
-      setVehicles(response.data);
-    } catch (error) {
-      console.error('Erro ao carregar veículos:', error);
-      toast.error('Erro ao carregar veículos');
-    }
-  };
-
   const handleNewPreparerChange = (e) => {
     const { name, value } = e.target;
     setNewPreparer(prev => ({
@@ -275,17 +276,13 @@ const SupervisorAppointment = () => {
 
                     <div>
                       <label className="block text-sm font-medium text-gray-700">Veículo</label>
-                      <select
-                        {...register('vehicle_id', { required: 'Veículo é obrigatório' })}
+                      {/* Busca no servidor em vez de carregar o catálogo inteiro de veículos */}
+                      <input type="hidden" {...register('vehicle_id', { required: 'Veículo é obrigatório' })} />
+                      <VehicleSearch
+                        value={vehicle}
+                        onSelect={selectVehicle}
                         className="mt-1 block w-full rounded-md border-gray-300 shadow-sm focus:border-indigo-500 focus:ring-indigo-500 sm:text-sm"
-                      >
-                        <option value="">Selecione um veículo</option>
-                        {vehicles.map((vehicle) => (
-                          <option key={vehicle.id} value={vehicle.id}>
-                            {vehicle.model} - {vehicle.color} - {vehicle.chassi}
-                          </option>
-                        ))}
-                      </select>
+                      />
                       {errors.vehicle_id && (
                         <p className="mt-1 text-sm text-red-600">{errors.vehicle_id.message}</p>
                       )}
@@ -348,6 +345,13 @@ const SupervisorAppointment = () => {
             {errors.preparer && (
               <p className="mt-1 text-sm text-red-600">{errors.preparer.message}</p>
             )}
+            {freeSlots && (
+              <p className="mt-1 text-sm text-gray-500">
+                {freeSlots.length
+                  ? `Horários livres: ${freeSlots.map((slot) => `${slot.start}–${slot.end}`).join(', ')}`
+                  : 'Preparador sem horários livres neste dia'}
+              </p>
+            )}
           </div>
 
           <div>